@@ -1,32 +1,103 @@
 import os
 import re
 import csv
+import time
 import tqdm
 import json
+import sys
 import glob
+import hashlib
+import mmap
 import pprint
+import pickle
+import shutil
+import tempfile
 import argparse
+import contextlib
+import nltk
+import numpy as np
 import constants as co
-from shutil import rmtree
-from collections import Counter
+from collections import Counter, deque
 from multiprocessing import Pool
+from Executor import Executor
+from Coordinator import Coordinator
+from ResultCache import ResultCache
+from TokenCorpus import TokenCorpus, TextChunk
+from TaggedCorpus import TaggedCorpus
+from SentenceIndex import SentenceIndex
+from PartFile import PartFile
+from CompressedResource import CompressedResource
+from Deduplicator import Deduplicator
+from Sampler import Sampler
+from Checkpoint import Checkpoint
 
 
 class AnalyserTemplate:
     """This is the template for all analyses which handles the configuration initialisation and the 
     loading and pre-processing of the resource file(s). 
+
+    Each analysis implements prepare, process_chunk, empty, combine and save, which the template executes
+    over every chunk of the resource.
     """
 
-    def __init__(self, language, resource_type):
+    # whether the analysis reads the results of the frequency analysis
+    uses_frequency = False
+
+    def __init__(self, language, resource_type, use_cache=True, sample=None, seed=0, serve=None, resume=False, workers=None):
 
         # initialise settings
         self.language = language
         self.resource_type = resource_type
         self.init_configs()
 
+        # pre-process the resource on these workers if given, such as the shared pool of a batch, rather than on
+        # a pool of its own
+        self.workers = workers
+
         # load resource
         self.load_resource()
 
+        # process the chunks on the workers which connect to this address, if given, instead of a local pool
+        self.serve = Coordinator.parse_address(serve) if serve else None
+
+        # estimate the results from a random sample of the chunks if a fraction is given
+        self.sampler = None
+        if sample is not None:
+            if any(os.path.exists(PartFile.weights_path(part)) for part in self.pool):
+                raise ValueError("Sampling is not supported on a de-duplicated resource, pre-process it again without deduplicate to sample...")
+            self.sampler = Sampler(self.pool, [SentenceIndex.count(part) for part in self.pool], sample, seed, self.configs["sampling"])
+
+        # pick up from the last checkpoint of the same analysis if resuming
+        self.resume = resume
+
+        # initialise the cache of the results of each chunk
+        self.cache = None
+        if use_cache and self.configs["cache"]["enabled"]:
+            self.cache = ResultCache(os.path.join(self.resource_folder, self.configs["cache"]["path"]), self.configs["cache"]["size_limit"])
+
+    def __getstate__(self):
+
+        # the shared pool of a batch stays with the process which runs it
+        state = self.__dict__.copy()
+        state["workers"] = None
+        return state
+
+    @contextlib.contextmanager
+    def worker_pool(self):
+        """Returns the pool which pre-processes the resource, which is a new pool of n_processors unless the
+        analysis was given the shared pool of a batch.
+
+        Returns:
+            Pool -- the pool, to be entered as a context manager
+        """
+
+        if self.workers is not None:
+            yield self.workers
+            return
+
+        with Pool(self.configs["n_processors"]) as pool:
+            yield pool
+
     def init_configs(self):
         """Parses configuration file and loads some frequently used fields to attributes.
         """
@@ -43,31 +114,356 @@ class AnalyserTemplate:
         self.pre_processed_folder = os.path.join(self.resource_folder, self.configs["pre_processed_path"])
         self.results_folder = os.path.join(self.resource_folder, self.configs["results_path"])
         self.chunk_size = self.configs["resources"][self.resource_type]["chunk_size"]
+        self.token_ids = self.configs["pre_processing"]["token_ids"]
+        self.tags = self.configs["pre_processing"]["tags"]
+        self.index = self.configs["pre_processing"]["index"]
+
+    def execute(self):
+        """Executes the analysis.
+
+        Using the multiprocessing library, process the resource chunk by chunk, combine the results of
+        every chunk as a tree within the pool and save them. If sampling, only the sampled chunks are processed,
+        round by round. Otherwise the partial results are checkpointed, and the checkpoint is removed once the
+        results have been saved.
+        """
+
+        # initialise configurations and load additional resources
+        self.prepare()
+
+        # multiprocess chunk by chunk
+        checkpoint = self.checkpoint([self])
+        with self.executor(self.process, self.combine, checkpoint) as executor:
+            if self.sampler:
+                count = self.sampler.map_reduce(executor, self.combine, self.ranking)
+            else:
+                count = executor.map_reduce(self.pool)
+        self.master_count = count if count is not None else self.empty()
+
+        # keep the cache within its size limit
+        if self.cache:
+            self.cache.evict()
+
+        start = time.time()
+        self.save_state()
+        self.save()
+        print("Saved results in {:.1f}s".format(time.time() - start))
+
+        if checkpoint:
+            checkpoint.remove()
+
+    def executor(self, process, combine, checkpoint=None):
+        """Returns the executor which processes the chunks, which is a local pool of n_processors unless the
+        chunks are served to remote workers.
+
+        Arguments:
+            process {callable} -- processes a single chunk
+            combine {callable} -- combines two results into one
+            checkpoint {Checkpoint} -- where to save the partial results, if anywhere
+
+        Returns:
+            Executor|Coordinator -- the executor, to be entered as a context manager
+        """
+
+        if self.serve:
+            return Coordinator.instance(self.serve, self.configs["distributed"]).start_job(process, combine, checkpoint)
+        return Executor(self.configs["n_processors"], process, combine, checkpoint)
+
+    def checkpoint(self, analysers):
+        """Returns the checkpoint of a pass of the analyses given over this resource.
+
+        The checkpoint is named by everything the merged results depend on: the analyses and their cache
+        states, and the size and modification time of every part and of the vocabulary, so a run only resumes
+        from a checkpoint made with the same configuration.
+
+        Arguments:
+            analysers {list[AnalyserTemplate]} -- the analyses of the pass, which have been prepared
+
+        Returns:
+            Checkpoint -- the checkpoint, or None if checkpointing is neither enabled nor resumed, the chunks are
+                sampled or the results of an analysis cannot be cached
+        """
+
+        states = [analyser.cache_state() for analyser in analysers]
+        if not (self.configs["checkpoint"]["enabled"] or self.resume) or self.sampler or any(state is None for state in states):
+            return None
+
+        # describe every file the results are read from by its size and modification time
+        stats = self.part_stats(self.pool)
+        if self.vocab is not None:
+            stats.update(self.part_stats([TokenCorpus(self.pre_processed_folder, self.language).vocab_path]))
+
+        description = json.dumps([[type(analyser).__name__ for analyser in analysers], states, stats], sort_keys=True)
+        key = hashlib.sha1(description.encode("UTF-8")).hexdigest()
+        path = os.path.join(self.resource_folder, self.configs["checkpoint"]["path"], key + ".pkl")
+
+        return Checkpoint(path, self.configs["checkpoint"], self.resume)
+
+    @staticmethod
+    def part_stats(parts):
+        """Returns the size and modification time of each part and of the weights of any de-duplicated part,
+        which change whenever the part is written again.
+
+        Arguments:
+            parts {list[str]} -- paths to the pre-processed resource files
+
+        Returns:
+            dict{str:list[int]} -- the size and modification time of each file, by its name
+        """
+
+        files = list(parts) + [path for path in map(PartFile.weights_path, parts) if os.path.exists(path)]
+        return {os.path.basename(f): [os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in files}
+
+    def state_path(self):
+        """Returns the path of the saved combined results of the analysis.
+
+        Returns:
+            str -- path to the pickled state
+        """
+
+        return os.path.join(self.results_folder, self.configs["ingest"]["path"], type(self).__name__ + ".pkl")
+
+    def save_state(self, always=False):
+        """Saves the combined results together with the parts they cover, so that ingesting new sentences only
+        has to process the new parts. Sampled results, and results which cannot be cached, are not saved.
+
+        Arguments:
+            always {bool} -- whether to save the results even if save_state is disabled, as when ingesting
+                (default: {False})
+        """
+
+        state = self.cache_state()
+        if not (always or self.configs["ingest"]["save_state"]) or self.sampler or state is None:
+            return
+
+        path = self.state_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump({
+                "state": state,
+                "parts": self.part_stats(self.pool),
+                "vocab": [len(self.vocab), self.vocab_hash(len(self.vocab))] if self.vocab is not None else None,
+                "count": self.master_count
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def load_state(self):
+        """Loads the saved combined results of the analysis.
+
+        Returns:
+            dict -- the saved state, or None if there is none
+        """
+
+        if not os.path.exists(self.state_path()):
+            return None
+
+        with open(self.state_path(), 'rb') as f:
+            return pickle.load(f)
+
+    def vocab_hash(self, n):
+        """Returns the hash of the first n words of the vocabulary, which the token IDs of saved results refer to.
+
+        Arguments:
+            n {int} -- the number of words
+
+        Returns:
+            str -- the hex digest of the words
+        """
+
+        return hashlib.sha1("\n".join(self.vocab[:n]).encode("UTF-8")).hexdigest()
+
+    def unprocessed_parts(self, state):
+        """Returns the parts of the resource which the saved results do not cover.
+
+        Arguments:
+            state {dict} -- the saved state
+
+        Returns:
+            list[str] -- paths to the parts still to be processed, or None if a part the results cover has changed
+                or the token IDs they refer to have
+        """
+
+        stats = self.part_stats(self.pool)
+        if any(stats.get(name) != stat for name, stat in state["parts"].items()):
+            return None
+        if (state["vocab"] is None) != (self.vocab is None):
+            return None
+        if state["vocab"] is not None and self.vocab_hash(state["vocab"][0]) != state["vocab"][1]:
+            return None
+
+        return [part for part in self.pool if os.path.basename(part) not in state["parts"]]
+
+    def restore(self, state):
+        """Returns the saved results, ready to be combined with the results of new chunks.
+
+        Analyses whose results depend on the size of the vocabulary, or which must count new chunks with the
+        same resources as the saved results, override this.
+
+        Arguments:
+            state {dict} -- the saved state, loaded after the analysis was prepared
+
+        Returns:
+            object -- the saved combined results, or None if they were counted with a different configuration
+        """
+
+        if state["state"] != self.cache_state():
+            return None
+
+        return state["count"]
+
+    def process(self, file):
+        """Processes a single chunk.
+
+        Arguments:
+            file {str} -- path to pre-processed resource file
+
+        Returns:
+            object -- the results of the chunk, as returned by process_chunk
+        """
+
+        result = self.load_cached(file)
+        if result is None:
+            result = self.process_chunk(self.read_chunk(file))
+            self.store_cached(file, result)
+
+        return result
+
+    def ranking(self, count):
+        """Returns the top of the ranking of the results, which a sampled analysis reports after each round and
+        stops early once it has settled.
+
+        Analyses which rank their results override this.
+
+        Arguments:
+            count {object} -- the combined results so far
+
+        Returns:
+            list[tuple] -- the top (key, count) pairs in order, or None if the results are not ranked
+        """
+
+        return None
+
+    def cache_state(self):
+        """Returns a description of everything other than the content of a chunk that its results depend on.
+
+        Analyses override this to list their relevant configurations and resources.
+
+        Returns:
+            object -- JSON serialisable description, or None if the results cannot be cached
+        """
+
+        return None
+
+    def cache_key(self, file):
+        """Returns the key under which the results of a chunk are cached.
+
+        Arguments:
+            file {str} -- path to pre-processed resource file
+
+        Returns:
+            str -- the key, or None if the results cannot be cached
+        """
+
+        state = self.cache_state()
+        if self.cache is None or state is None:
+            return None
+
+        # results counted on token IDs also depend on the vocabulary, and those of a de-duplicated part on its weights
+        vocab_hash = self.cache.chunk_hash(TokenCorpus(self.pre_processed_folder, self.language).vocab_path) if self.vocab is not None else None
+        weights_path = PartFile.weights_path(file)
+        weights_hash = [self.cache.chunk_hash(weights_path)] if os.path.exists(weights_path) else []
+
+        return self.cache.key(file, type(self).__name__, [state, vocab_hash] + weights_hash)
+
+    def load_cached(self, file):
+        """Loads the cached results of a chunk.
+
+        Arguments:
+            file {str} -- path to pre-processed resource file
+
+        Returns:
+            object -- the results of the chunk, or None if they are not cached
+        """
+
+        key = self.cache_key(file)
+        return self.cache.get(key) if key else None
+
+    def store_cached(self, file, result):
+        """Caches the results of a chunk.
+
+        Arguments:
+            file {str} -- path to pre-processed resource file
+            result {object} -- the results of the chunk
+        """
+
+        key = self.cache_key(file)
+        if key:
+            self.cache.put(key, result)
 
     def load_resource(self):
         """Loads the filenames of any pre-processed resource files.
 
         First, check if pre-processed files exist and execute the preprocessing if not.
-        Finally, load the paths to the pre-processed files.
+        Then, if enabled, build the binary token ID corpus and its positional index if they are missing and load
+        the vocabulary, and tag any parts whose tags are missing or out of date and load the lexicon of word types.
         """
 
         # check resource folder exists
         if not os.path.isdir(self.resource_folder):
-          raise Exception("Resource folder not found...")
+          raise FileNotFoundError("Resource folder not found...")
         
         # check if pre-processed folder exists
         if not os.path.isdir(self.pre_processed_folder) or not os.listdir(self.pre_processed_folder):
             self.pre_process_resource()
 
         # get list of matching resource file names
-        self.pool = glob.glob(os.path.join(self.pre_processed_folder, self.language + "_part_*"))
+        self.pool = self.find_parts()
+
+        # index the sentences of any parts pre-processed before the sentence offsets were introduced
+        if not SentenceIndex.exists(self.pool):
+            with self.worker_pool() as p:
+                for _ in tqdm.tqdm(p.imap_unordered(SentenceIndex.index_part, self.pool), total=len(self.pool)):
+                    pass
+
+        # load the token ID vocabulary, building the binary corpus first if required
+        self.vocab = None
+        if self.token_ids:
+            corpus = TokenCorpus(self.pre_processed_folder, self.language)
+            if not corpus.exists(self.pool):
+                self.build_token_ids(corpus)
+            self.vocab = corpus.load_vocab()
+            self.word_index = {word: i for i, word in enumerate(self.vocab)}
+
+        # build the positional index if it is missing
+        if self.index:
+            if not self.token_ids:
+                raise ValueError("The positional index requires the token_ids pre-processing option to be enabled...")
+            if not corpus.index_exists(self.pool):
+                with self.worker_pool() as p:
+                    for _ in tqdm.tqdm(p.imap_unordered(corpus.index_part, self.pool), total=len(self.pool)):
+                        pass
+
+        # load the word types, tagging any parts which changed since they were last tagged
+        self.lexicon = None
+        if self.tags:
+            tagged = TaggedCorpus(self.pre_processed_folder, self.language, self.configs["pos_frequency"]["batch_size"], self.configs["pos_frequency"]["tag_cache_size"])
+            stale = tagged.stale(self.pool)
+            if stale or not os.path.exists(tagged.lexicon_path):
+                self.build_tags(tagged, stale)
+            self.lexicon = tagged.load_lexicon()
 
     def pre_process_resource(self):
-        """Pre-processes the resource file using the multiprocessing library.
+        """Pre-processes the resource files using the multiprocessing library.
+
+        Every file is split into chunks of whole lines, which are numbered in order and processed by a single
+        pool, each being written as the part of the same number so that the parts are the same however the work
+        is scheduled. Wherever possible the workers read their own chunks from the file, so the parent only hands
+        out offsets, and only a bounded number of chunks are queued ahead of the workers. If enabled, repeated
+        sentences are then removed, leaving the first copy of each weighted by the number of copies.
         """
 
-        # get list of resource files
-        files = [os.path.join(self.resource_folder, f) for f in os.listdir(self.resource_folder)]
+        # get list of resource files, leaving out the files named in the configs such as the words of interest
+        named = {task[key].format(l=self.language) for task in self.configs.values() if isinstance(task, dict) for key in task if key.endswith("_filename")}
+        files = [os.path.join(self.resource_folder, f) for f in sorted(os.listdir(self.resource_folder)) if f not in named]
         files = [f for f in files if os.path.isfile(f)]
 
         # raise error if no files found
@@ -78,78 +474,510 @@ class AnalyserTemplate:
         if not os.path.exists(self.pre_processed_folder):
             os.mkdir(self.pre_processed_folder)
 
-        # record number of chunks from previous files
-        chunk_hist = 0
+        # split every file into chunks of whole lines, where the chunks of a streamed file are only known as it
+        # is decompressed
+        tasks = [self.chunk_tasks(filename) for filename in files]
+        total = sum(map(len, tasks)) if all(isinstance(t, list) for t in tasks) else None
+
+        # check the sentences of each chunk against the earlier chunks if de-duplicating
+        dedup = None
+        if self.configs["pre_processing"]["deduplicate"]:
+            dedup = Deduplicator(self.configs["pre_processing"]["dedup_capacity"])
+
+        # process the chunks in order, waiting for the oldest whenever too many are in flight
+        in_flight = deque()
+        with self.worker_pool() as pool:
+            with tqdm.tqdm(total=total) as progress:
+                for i, (function, args) in enumerate(task for file_tasks in tasks for task in file_tasks):
+                    if len(in_flight) >= 2 * self.configs["n_processors"]:
+                        result = in_flight.popleft().get()
+                        if dedup:
+                            dedup.add(*result)
+                        progress.update()
+                    in_flight.append(pool.apply_async(function, (i,) + args))
+                while in_flight:
+                    result = in_flight.popleft().get()
+                    if dedup:
+                        dedup.add(*result)
+                    progress.update()
+
+            # add the counts of the later copies of each sentence to the first, removing them from their parts
+            if dedup:
+                parts = self.find_parts()
+                print("De-duplicated {} parts...".format(len(parts)))
+                pool.starmap(Deduplicator.compact, [(part,) + dedup.extra_counts(part) for part in parts])
+
+    def append_parts(self, filename):
+        """Pre-processes a file of new sentences as new parts after the last part of the resource, and builds
+        the binary corpus, positional index and tags of the new parts only.
+
+        The new words are appended to the vocabulary and the lexicon, so the token IDs and word types of the
+        existing parts are unchanged. If de-duplicating, the sentences are only de-duplicated among the new
+        parts, which keeps every count exact.
+
+        Arguments:
+            filename {str} -- path to the file of new sentences, or "-" to read them from stdin
+
+        Returns:
+            list[str] -- paths to the new parts
+        """
+
+        # save stdin to a temporary file so that it is split into chunks like any resource file
+        if filename == "-":
+            with tempfile.NamedTemporaryFile('wb', dir=self.pre_processed_folder, suffix=".ingest", delete=False) as f:
+                shutil.copyfileobj(sys.stdin.buffer, f)
+            try:
+                return self.append_parts(f.name)
+            finally:
+                os.remove(f.name)
+
+        # pre-process each chunk of the file as the part numbered after the last
+        first = self.part_number(self.pool[-1]) + 1 if self.pool else 0
+        with self.worker_pool() as pool:
+            results = [pool.apply_async(function, (first + i,) + args) for i, (function, args) in enumerate(self.chunk_tasks(filename))]
+            results = [result.get() for result in tqdm.tqdm(results)]
+        parts = [self.part_path(first + i) for i in range(len(results))]
 
-        # open valid files
-        for filename in files:
+        if not parts:
+            return parts
 
-            self.file_size = os.path.getsize(filename)
+        # add the counts of the later copies of each sentence to the first, within the new parts
+        if self.configs["pre_processing"]["deduplicate"]:
+            dedup = Deduplicator(self.configs["pre_processing"]["dedup_capacity"])
+            for result in results:
+                dedup.add(*result)
+            with self.worker_pool() as pool:
+                pool.starmap(Deduplicator.compact, [(part,) + dedup.extra_counts(part) for part in parts])
 
-            # check chunk size
-            if self.file_size / self.chunk_size > 500:
-                print("Warning, this will create {} partitions.".format(int(self.file_size / self.chunk_size)))
-                rmtree(self.pre_processed_folder)
-                raise ValueError("This file will create more than 500 partitions, consider increasing the chunk size...")
+        # encode the new parts, appending their new words to the vocabulary
+        if self.token_ids:
+            corpus = TokenCorpus(self.pre_processed_folder, self.language)
+            with self.worker_pool() as pool:
+                count = Counter()
+                for cnt in pool.imap_unordered(corpus.count_part, parts):
+                    count.update(cnt)
+            corpus.extend_vocab(self.vocab, count)
+            with self.worker_pool() as pool:
+                pool.map(corpus.encode_part, parts)
+                if self.index:
+                    pool.map(corpus.index_part, parts)
 
-            # process
-            pool = Pool(self.configs["n_processors"])
-            for _ in tqdm.tqdm(pool.imap(self.pre_process_chunk, self.generate_chunk(filename)), total=int(self.file_size / self.chunk_size)):
+        # tag the new parts, adding the tags of their new words to the lexicon
+        if self.tags:
+            tagged = TaggedCorpus(self.pre_processed_folder, self.language, self.configs["pos_frequency"]["batch_size"], self.configs["pos_frequency"]["tag_cache_size"])
+            with self.worker_pool() as pool:
+                pool.map(tagged.tag_part, parts)
+                count = Counter()
+                for cnt in pool.imap_unordered(tagged.count_word_tags, parts):
+                    count.update(cnt)
+            tagged.extend_lexicon(count)
+
+        print("Ingested {} new parts...".format(len(parts)))
+
+        # reload the resource, which now includes the new parts
+        self.load_resource()
+
+        return parts
+
+    def build_token_ids(self, corpus):
+        """Builds the binary token ID corpus from the pre-processed text files using the multiprocessing library.
+
+        The tokens of every part are counted to build a shared vocabulary, after which each part is encoded
+        as an array of token IDs with the offsets at which each sentence starts.
+
+        Arguments:
+            corpus {TokenCorpus} -- the binary corpus to be written
+        """
+
+        # count tokens chunk by chunk
+        with self.worker_pool() as p:
+            count = Counter()
+            for cnt in tqdm.tqdm(p.imap_unordered(corpus.count_part, self.pool), total=len(self.pool)):
+                count.update(cnt)
+
+        # save vocabulary
+        corpus.save_vocab(count)
+
+        # encode chunk by chunk
+        with self.worker_pool() as p:
+            for _ in tqdm.tqdm(p.imap_unordered(corpus.encode_part, self.pool), total=len(self.pool)):
                 pass
-            
 
-    def generate_chunk(self, filename):
-        """Loads the raw resource file and yields chunks of the specified size in bytes.
+    def build_tags(self, tagged, stale):
+        """Tags the specified parts using the multiprocessing library and rebuilds the lexicon of word types.
+
+        Arguments:
+            tagged {TaggedCorpus} -- the tags to be written
+            stale {list[str]} -- paths to the parts which must be tagged
+        """
+
+        # tag chunk by chunk
+        if stale:
+            print("Tagging {} of {} parts...".format(len(stale), len(self.pool)))
+            with self.worker_pool() as p:
+                for _ in tqdm.tqdm(p.imap_unordered(tagged.tag_part, stale), total=len(stale)):
+                    pass
+
+        # count the tags of each word over every part
+        with self.worker_pool() as p:
+            count = Counter()
+            for cnt in tqdm.tqdm(p.imap_unordered(tagged.count_word_tags, self.pool), total=len(self.pool)):
+                count.update(cnt)
+
+        tagged.save_lexicon(count)
+
+    def read_chunk(self, file):
+        """Loads a single pre-processed part as a sequence of tokenised sentences.
+
+        When the binary corpus is enabled, the token arrays are memory-mapped and each sentence is a list
+        of token IDs, otherwise the text file is read and each sentence is a list of words.
+
+        Arguments:
+            file {str} -- path to pre-processed resource file
+
+        Returns:
+            TokenChunk|TextChunk -- the tokenised sentences
+        """
+
+        if self.vocab is not None:
+            return TokenCorpus.load_chunk(file)
+
+        with PartFile.open(file) as f:
+            return TextChunk([line.split() for line in f], file, PartFile.load_weights(file))
+
+    def make_key(self, tokens):
+        """Returns the key under which a word or phrase is counted.
+
+        Phrases of token IDs are kept as tuples, or as the bare ID for single words, and are only
+        decoded to text when the results are saved.
+
+        Arguments:
+            tokens {list} -- the words or token IDs of the phrase
+
+        Returns:
+            str|int|tuple[int] -- the key
+        """
+
+        if self.vocab is None:
+            return " ".join(tokens)
+        elif len(tokens) == 1:
+            return tokens[0]
+        return tuple(tokens)
+
+    def decode(self, key):
+        """Returns the text of a word or phrase counted under the specified key.
+
+        Arguments:
+            key {str|int|tuple[int]} -- the key, as returned by make_key
+
+        Returns:
+            str -- the word or phrase
+        """
+
+        if self.vocab is None or isinstance(key, str):
+            return key
+        elif isinstance(key, tuple):
+            return " ".join(self.vocab[t] for t in key)
+        return self.vocab[key]
+
+    def decode_tokens(self, tokens):
+        """Returns the words of a sentence of token IDs.
+
+        Arguments:
+            tokens {iterable[int]} -- the token IDs
+
+        Returns:
+            list[str] -- the words
+        """
+
+        return [self.vocab[t] for t in tokens]
+
+    def encode(self, word):
+        """Returns the key under which a single word from a results or words of interest file is counted.
+
+        Arguments:
+            word {str} -- the word
+
+        Returns:
+            str|int|None -- the key, or None if the word does not appear in the vocabulary
+        """
+
+        if self.vocab is None:
+            return word
+        return self.word_index.get(word)
+
+    def tag_words(self, words):
+        """Returns the PoS tag of each distinct word specified. Returns "N/A" for any words not recognised.
+
+        When the tagged corpus is enabled, the most common tag of each word within the resource is used. Any
+        other words are tagged on their own, in a single batch.
+
+        Arguments:
+            words {iterable[str]} -- the words to be tagged
+
+        Returns:
+            dict{str:str} -- the abbreviated part of speech tag of each word
+        """
+
+        tags = {}
+        untagged = []
+        for word in dict.fromkeys(words):
+            if self.lexicon is not None and word in self.lexicon:
+                tags[word] = self.lexicon[word]
+            elif not word:
+                tags[word] = "N/A"
+            else:
+                untagged.append(word)
+
+        for word, tagged in zip(untagged, nltk.pos_tag_sents([[word] for word in untagged])):
+            tags[word] = tagged[0][1] if tagged else "N/A"
+
+        return tags
+
+    def write_results(self, columns, encoding=None):
+        """Writes the results to csv at the path specified by the configs, and if enabled to a binary file of
+        typed columns alongside it.
+
+        The rows are streamed to the csv file straight from the columns, without building a dataframe. The
+        binary file is a numpy .npz archive holding one array per column, which loads without parsing.
+
+        Arguments:
+            columns {dict{str:list|np.ndarray}} -- the values of each column in order, None marking a missing value
+            encoding {str} -- the encoding of the csv file (default: {the output encoding of the language})
+        """
+
+        columns = {name: values.tolist() if isinstance(values, np.ndarray) else list(values) for name, values in columns.items()}
+
+        # create results folder
+        if not os.path.isdir(self.results_folder):
+            os.mkdir(self.results_folder)
+
+        # stream rows to csv
+        filename = self.dest_filename.format(l=self.language)
+        with open(filename + '.csv', 'w', encoding=encoding or co.OUT_ENCODING[self.language], newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*columns.values()))
+
+        # write typed columns
+        if self.configs["binary_results"]:
+            np.savez(filename + '.npz', **{name: self.typed_column(values) for name, values in columns.items()})
+
+    @staticmethod
+    def typed_column(values):
+        """Returns a column of results as an array of its natural type, filling any missing values with an
+        empty string, or with 0 for integers and NaN for floats.
+
+        Arguments:
+            values {list} -- the values of the column
+
+        Returns:
+            np.ndarray -- the typed column
+        """
+
+        present = [v for v in values if v is not None]
+        if present and all(isinstance(v, str) for v in present):
+            return np.array(["" if v is None else v for v in values], dtype=str)
+        elif present and all(isinstance(v, int) for v in present):
+            return np.array([0 if v is None else v for v in values], dtype=np.int64)
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+    def chunk_tasks(self, filename):
+        """Splits a raw resource file into the tasks which pre-process each of its chunks, as the method to be
+        executed and its arguments after the number of the chunk.
+
+        An uncompressed file is split into byte ranges and a BGZF file into ranges of blocks, which the workers
+        read themselves. Any other compressed file is decompressed from the start by the parent, which passes
+        the text of each chunk to the workers as it goes.
 
         Arguments:
             filename {str} -- path to the raw resource file
 
-        Yields:
-            str -- the chunk of text
+        Returns:
+            list[tuple]|generator -- the method and arguments of each task
         """
 
-        # open resource file in binary
-        with open(filename, 'rb') as resource:
+        if not CompressedResource.is_compressed(filename):
+            return [(self.pre_process_range, (filename, start, end)) for start, end in self.chunk_ranges(filename)]
 
-            # instantiate chunk start byte and trailing line string
-            p = 0
-            overlap = ''
+        blocks = CompressedResource.bgzf_blocks(filename)
+        if blocks is not None:
+            ranges = CompressedResource.block_ranges(blocks, self.task_size(sum(block[2] for block in blocks)))
+            return [(self.pre_process_blocks, (filename,) + block_range) for block_range in ranges]
 
-            while p <= self.file_size:
+        chunk_size = self.task_size(os.path.getsize(filename))
+        return ((self.pre_process_bytes, (data,)) for data in CompressedResource.stream_chunks(filename, chunk_size))
 
-                try:
-                    if self.file_size - p < self.chunk_size:
-                        buffer = overlap + resource.read(self.file_size - p).decode("UTF-8")
-                    else:
-                        buffer = overlap + resource.read(self.chunk_size).decode("UTF-8")
-                except:
-                    p += self.chunk_size
-                    continue
+    def task_size(self, file_size):
+        """Returns the size of each chunk of a raw resource file in bytes.
+
+        When the chunk size is "auto", it is chosen from the size of the file so that every processor is given
+        several chunks, within limits which keep the parts large enough to be worth a task and small enough to
+        be analysed in memory. The compressed size is used for a file which is streamed, as its size once
+        decompressed is not known in advance.
+
+        Arguments:
+            file_size {int} -- the size of the file
+
+        Returns:
+            int -- the chunk size
+        """
+
+        if self.chunk_size == "auto":
+            return min(max(file_size // (8 * self.configs["n_processors"]), 2 ** 20), 2 ** 24)
+        return self.chunk_size
+
+    def chunk_ranges(self, filename):
+        """Splits a raw resource file into ranges of roughly the chunk size in bytes, each ending at the end of a
+        line. Only the bytes around each boundary are read, through a memory map, so a file of any size is split
+        without reading it.
+
+        Arguments:
+            filename {str} -- path to the raw resource file
+
+        Returns:
+            list[tuple[int, int]] -- the start and end byte of each range
+        """
+
+        file_size = os.path.getsize(filename)
+        if not file_size:
+            return []
+        chunk_size = self.task_size(file_size)
+
+        # move each boundary forward to the start of the next line
+        ranges = []
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as resource:
+            start = 0
+            while start < file_size:
+                end = resource.find(b"\n", min(start + chunk_size, file_size) - 1) + 1 or file_size
+                ranges.append((start, end))
+                start = end
+
+        return ranges
+
+    def pre_process_range(self, i, filename, start, end):
+        """Reads a range of a raw resource file through a memory map and pre-processes it as the part of the
+        same number.
+
+        Arguments:
+            i {int} -- the number of the range
+            filename {str} -- path to the raw resource file
+            start {int} -- the first byte of the range
+            end {int} -- the byte after the end of the range
+
+        Returns:
+            tuple -- if de-duplicating, the path of the part and the hash and count of each of its sentences
+        """
+
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as resource:
+            data = resource[start:end]
+
+        return self.pre_process_bytes(i, data)
+
+    def pre_process_blocks(self, i, filename, previous, start, end):
+        """Decompresses a range of blocks of a BGZF file and pre-processes it as the part of the same number.
+
+        Arguments:
+            i {int} -- the number of the range
+            filename {str} -- path to the raw resource file
+            previous {int} -- the offset of the last block before the range which is not empty, or None
+            start {int} -- the offset of the first block of the range
+            end {int} -- the offset after the last block of the range
 
-                # remove and store trailing sentence
-                buffer, overlap = buffer.rsplit('\n', maxsplit=1)
+        Returns:
+            tuple -- if de-duplicating, the path of the part and the hash and count of each of its sentences
+        """
 
-                yield buffer
+        return self.pre_process_bytes(i, CompressedResource.read_block_range(filename, previous, start, end))
 
-                p += self.chunk_size
+    def pre_process_bytes(self, i, data):
+        """Decodes a chunk of a raw resource file and pre-processes it as the part of the same number.
 
-    def pre_process_chunk(self, chunk):
-        """[summary]
+        Any bytes which are not valid in the input encoding are replaced rather than the chunk being skipped.
 
         Arguments:
+            i {int} -- the number of the chunk
+            data {bytes} -- the chunk of text to be processed
+
+        Returns:
+            tuple -- if de-duplicating, the path of the part and the hash and count of each of its sentences
+        """
+
+        return self.pre_process_chunk(i, data.decode(co.IN_ENCODING[self.language], errors="replace"))
+
+    def pre_process_chunk(self, i, chunk):
+        """Pre-processes a chunk of text and writes it as the part of the same number, along with its sentence
+        offsets and any metadata stripped from its sentences.
+
+        The characters of the whole chunk are normalised at once, after which each line only needs to be split
+        and stripped. Both steps are those of pre_process_line, so the parts follow the same rules as any single
+        line.
+
+        Arguments:
+            i {int} -- the number of the chunk
             chunk {str} -- the chunk of text to be processed
+
+        Returns:
+            tuple -- if de-duplicating, the path of the part and the hash and count of each of its sentences
         """
-        
-        text = ""
-        for line in chunk.splitlines():
-            text += self.pre_process_line(line) + "\n"
 
-        for i in range(1000):
-            fn = os.path.join(self.pre_processed_folder, self.language + "_part_{0:0=3d}".format(i) + ".txt")
-            if not os.path.exists(fn):
-                with open(fn, 'w', encoding="UTF-8") as chunk_file:
-                    chunk_file.write(text)
-                break
+        # normalising leaves the line breaks in place, so the lines match those of the raw chunk
+        lines = [" ".join(self.strip_metadata(line.split())) + "\n" for line in self.normalise_text(chunk).splitlines()]
+
+        # keep the metadata stripped from each line
+        strip = self.configs["resources"][self.resource_type]
+        sources = [self.source_fields(line) for line in chunk.splitlines()] if strip["lstrip"] or strip["rstrip"] else None
+
+        # keep the first copy of each sentence of the chunk
+        if self.configs["pre_processing"]["deduplicate"]:
+            lines, sources, hashes, counts = Deduplicator.unique_lines(lines, sources)
+
+        fn = self.part_path(i)
+        PartFile.write(fn, "".join(lines))
+
+        # record the sentence offsets and the stripped metadata
+        SentenceIndex.index_part(fn)
+        if sources is not None:
+            SentenceIndex.save_sources(fn, sources)
+
+        if self.configs["pre_processing"]["deduplicate"]:
+            return fn, hashes, counts
+
+    def part_path(self, i):
+        """Returns the path of a pre-processed part.
+
+        Arguments:
+            i {int} -- the number of the part
+
+        Returns:
+            str -- path to the pre-processed text file, which is compressed if enabled
+        """
+
+        extension = ".txt.gz" if self.configs["pre_processing"]["compress_parts"] else ".txt"
+        return os.path.join(self.pre_processed_folder, self.language + "_part_{0:0=3d}".format(i) + extension)
+
+    def find_parts(self):
+        """Returns the paths of every pre-processed part, in order of their numbers.
+
+        Returns:
+            list[str] -- paths to the pre-processed text files
+        """
+
+        parts = [os.path.join(self.pre_processed_folder, f) for f in os.listdir(self.pre_processed_folder)]
+        return sorted((part for part in parts if self.part_number(part) is not None), key=self.part_number)
+
+    def part_number(self, part):
+        """Returns the number of a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            int -- the number of the part, or None if the path is not a part of the resource
+        """
+
+        match = re.fullmatch(re.escape(self.language) + r"_part_(\d+)\.txt(\.gz)?", os.path.basename(part))
+        return int(match.group(1)) if match else None
 
     def pre_process_line(self, line):
         """Pre-processed one line of text by normalising characters and stripping any metadata.
@@ -161,14 +989,83 @@ class AnalyserTemplate:
             str -- the pre-processed sentence
         """
 
-        line = line.lower()
-        line = line.translate(co.NORM_TABLE)
-        line = line.translate(co.PUNC_TABLE)
-        line = line.split()
-        line = line[self.configs["resources"][self.resource_type]["lstrip"]:]
+        return " ".join(self.strip_metadata(self.normalise(line)))
+
+    def normalise(self, line):
+        """Normalises the characters of a line of text and splits it into words.
+
+        Arguments:
+            line {str} -- the text
+
+        Returns:
+            list[str] -- the normalised words
+        """
+
+        return self.normalise_text(line).split()
+
+    @staticmethod
+    def normalise_text(text):
+        """Normalises the characters of a text, which may be a whole chunk of lines.
+
+        Arguments:
+            text {str} -- the text
+
+        Returns:
+            str -- the lowercased text, with characters normalised and punctuation removed
+        """
+
+        text = text.lower()
+        text = text.translate(co.NORM_TABLE)
+        return text.translate(co.PUNC_TABLE)
+
+    def strip_metadata(self, words):
+        """Strips the metadata of the resource, such as the sentence ID of Tatoeba, from the words of a line.
+
+        Arguments:
+            words {list[str]} -- the words of the line
+
+        Returns:
+            list[str] -- the words without the first lstrip and last rstrip words
+        """
+
+        words = words[self.configs["resources"][self.resource_type]["lstrip"]:]
         if self.configs["resources"][self.resource_type]["rstrip"]:
-            line = line[:-self.configs["resources"][self.resource_type]["rstrip"]]
-        return " ".join(line)
+            words = words[:-self.configs["resources"][self.resource_type]["rstrip"]]
+        return words
+
+    def source_fields(self, line):
+        """Returns the metadata stripped from one line of raw text, such as the sentence ID of Tatoeba, as the
+        fields of the raw line which are removed by lstrip and rstrip.
+
+        Arguments:
+            line {str} -- the raw sentence
+
+        Returns:
+            str -- the stripped fields, separated by tabs
+        """
+
+        fields = line.split()
+        lstrip = self.configs["resources"][self.resource_type]["lstrip"]
+        rstrip = self.configs["resources"][self.resource_type]["rstrip"]
+        return "\t".join(fields[:lstrip] + (fields[max(len(fields) - rstrip, lstrip):] if rstrip else []))
+
+    def find_word_freq(self, filename):
+        """Returns the path to the frequency data, preferring the results of the frequency analysis over a
+        file placed in the resource folder.
+
+        Arguments:
+            filename {str} -- name of the frequency data file
+
+        Returns:
+            str -- path to the frequency data
+        """
+
+        filename = filename.format(l=self.language)
+        file_path = os.path.join(self.results_folder, filename)
+        if not os.path.isfile(file_path):
+            file_path = os.path.join(self.resource_folder, filename)
+
+        return file_path
 
     def load_word_freq(self, file_path):
         """Loads the previously calculated phrase frequency data for phrases up to 8 words long.
@@ -190,14 +1087,16 @@ class AnalyserTemplate:
         with open(file_path, 'r', encoding=co.OUT_ENCODING[self.language]) as f:
             reader = csv.reader(f, delimiter=',')
 
-            # skip header
-            next(reader)
+            # locate columns from header, falling back to the phrase and count being first
+            header = next(reader)
+            phrase_col = header.index("phrase") if "phrase" in header else 0
+            count_col = header.index("count") if "count" in header else 1
 
             # iterate through csv and add values to dictionary
             for row in reader:
                 try:
                     # freq[int(row[3])][row[0]] = int(row[1])
-                    freq[1][row[0]] = int(row[1])
+                    freq[1][row[phrase_col]] = int(row[count_col])
                 except ValueError:
                     pass
 
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class Association:
+    """Association measures computed as whole-array operations over every (word, collocate) pair of a
+    co-occurrence table.
+
+    Each pair is treated as a 2x2 contingency table whose marginals are taken from the co-occurrence table
+    itself: the total number of collocates counted for the word, the total number of times the collocate was
+    counted for any word, and the total of the whole table. The expected count of a pair is then the product
+    of its marginals divided by the total.
+    """
+
+    # the measures which may be used to rank the collocates of each word
+    measures = ["count", "relative_frequency", "pmi", "log_likelihood", "t_score"]
+
+    @staticmethod
+    def scores(rows, cols, counts):
+        """Computes pointwise mutual information, log-likelihood and t-score for every pair.
+
+        Arguments:
+            rows {np.ndarray} -- the index of the word of each pair
+            cols {np.ndarray} -- the index of the collocate of each pair
+            counts {np.ndarray} -- the count of each pair
+
+        Returns:
+            dict{str:np.ndarray} -- the value of each measure for every pair
+        """
+
+        observed = np.asarray(counts, dtype=np.float64)
+        row_totals = np.bincount(rows, weights=observed)[rows]
+        col_totals = np.bincount(cols, weights=observed)[cols]
+        total = observed.sum()
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = row_totals * col_totals / total
+
+            # log-likelihood sums over every cell of the contingency table of the pair
+            cells = [
+                (observed, expected),
+                (row_totals - observed, row_totals - expected),
+                (col_totals - observed, col_totals - expected),
+                (total - row_totals - col_totals + observed, total - row_totals - col_totals + expected)
+                ]
+            log_likelihood = 2 * sum(np.where(o > 0, o * np.log(o / e), 0) for o, e in cells)
+
+            return {
+                "pmi": np.log2(observed / expected),
+                "log_likelihood": log_likelihood,
+                "t_score": (observed - expected) / np.sqrt(observed)
+                }
+
+    @staticmethod
+    def top_k(rows, score, k):
+        """Selects the k pairs with the highest score for every word.
+
+        Arguments:
+            rows {np.ndarray} -- the index of the word of each pair
+            score {np.ndarray} -- the score of each pair
+            k {int} -- the number of pairs per word
+
+        Returns:
+            np.ndarray -- the indices of the selected pairs, grouped by word in descending order of score
+        """
+
+        # order by word and then descending score, ties keeping their original order
+        order = np.lexsort((-score, rows))
+        sorted_rows = rows[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows)
+
+        return order[rank < k]
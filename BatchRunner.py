@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import tqdm
+import heapq
+import queue
+import itertools
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from Executor import Executor, pair_ready, reduce_batch
+from FusedAnalyser import FusedAnalyser
+
+
+# the jobs loaded by each worker, least recently used first, and how many are kept at once
+_jobs = OrderedDict()
+_capacity = 1
+
+
+class BatchRunner:
+    """This executes a matrix of analyses over several datasets and languages on a single long-lived pool of
+    workers, rather than starting a separate process and pool for each.
+
+    Each dataset and language is a group whose analyses are executed together as in a single run, pass by
+    pass, where each pass is a job. The groups are started largest resource first, each once the chunks of
+    the jobs already started are about to run out, and the chunks of every started job are queued largest job
+    first. Each group is loaded by a background thread, which pre-processes its resource if required on the
+    same pool, so that the jobs already started carry on being processed, combined and saved meanwhile. The results of each job are combined pairwise in the pool as they arrive, exactly as in a single
+    run, and each finished job is saved by a background thread while the workers carry on processing the
+    chunks of the other jobs. A pass which uses the frequency results is started once the pass before it has
+    been saved.
+
+    The prepared analyses of each job are written to a temporary file once, which each worker loads the first
+    time it processes a chunk of the job.
+    """
+
+    def __init__(self, groups, use_cache=True):
+
+        # load configuration file
+        with open(os.path.join(os.path.dirname(__file__), "config.json")) as f:
+            self.configs = json.load(f)
+
+        self.groups = sorted(groups, key=self.resource_size, reverse=True)
+        self.use_cache = use_cache
+
+    def resource_size(self, group):
+        """Returns the size of the raw resource files of a group, before it has been loaded.
+
+        Arguments:
+            group {tuple[list[type], str, str]} -- the analysis classes, language and dataset
+
+        Returns:
+            int -- the total size of the files in bytes, or 0 if the resource folder does not exist
+        """
+
+        _, language, dataset = group
+        folder = os.path.join(os.path.dirname(__file__), self.configs["resource_path"], dataset, language)
+        if not os.path.isdir(folder):
+            return 0
+
+        files = [os.path.join(folder, f) for f in os.listdir(folder)]
+        return sum(os.path.getsize(f) for f in files if os.path.isfile(f))
+
+    def execute(self):
+        """Executes every job of the batch and prints a summary of each.
+        """
+
+        n_processors = self.configs["n_processors"]
+        limit = 2 * n_processors
+
+        self.folder = tempfile.mkdtemp(prefix="batch_")
+        self.events = queue.Queue()
+        self.queued = []
+        self.sequence = itertools.count()
+        self.jobs = []
+        self.skipped = []
+        self.loading = False
+        self.active = 0
+        self.in_flight = 0
+
+        start = time.time()
+        try:
+            with Pool(n_processors, initializer=init_worker, initargs=(self.configs["batch"]["worker_jobs"],)) as self.pool, \
+                    ThreadPoolExecutor(max_workers=1) as self.saver, ThreadPoolExecutor(max_workers=1) as self.loader, \
+                    tqdm.tqdm(total=0) as self.progress:
+                remaining = deque(self.groups)
+                while remaining or self.active:
+
+                    # load the next group once the queued chunks are about to run out, one group at a time
+                    if remaining and not self.loading and len(self.queued) < limit:
+                        self.start_group(remaining.popleft())
+
+                    # keep the pool busy, largest job first
+                    while self.queued and self.in_flight < limit:
+                        _, _, _, job, batch = heapq.heappop(self.queued)
+                        self.submit(job, batch)
+
+                    if self.active:
+                        self.handle(*self.events.get())
+        finally:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+        self.summary(time.time() - start)
+
+    def start_group(self, group):
+        """Hands a group to the loading thread, whose analyses pre-process the resource if required on the
+        shared pool.
+
+        Arguments:
+            group {tuple[list[type], str, str]} -- the analysis classes, language and dataset
+        """
+
+        classes, language, dataset = group
+        name = "{}/{}".format(dataset, language)
+        self.loading = True
+        self.active += 1
+        future = self.loader.submit(lambda: FusedAnalyser([cls(language, dataset, self.use_cache, workers=self.pool) for cls in classes]))
+        future.add_done_callback(lambda future: self.events.put(("loaded", name, future)))
+
+    def finish_group(self, name, future):
+        """Starts the first pass of a loaded group, skipping it if its resource files cannot be found.
+
+        Arguments:
+            name {str} -- the dataset and language of the group
+            future {Future} -- the loading of the group, whose result is its analyses
+        """
+
+        self.loading = False
+        self.active -= 1
+        try:
+            fused = future.result()
+        except FileNotFoundError as e:
+            print("Skipping {}: {}".format(name, e))
+            self.skipped.append(name)
+            return
+
+        self.start_job(name, fused.stages())
+
+    def start_job(self, name, stages):
+        """Prepares the first of the remaining passes of a group and queues its chunks.
+
+        Arguments:
+            name {str} -- the dataset and language of the group
+            stages {list[list[AnalyserTemplate]]} -- the analyses of each remaining pass
+        """
+
+        stage = stages[0]
+        runner = FusedAnalyser(stage)
+        runner.prepare_stage(stage)
+
+        # write the prepared analyses once for the workers to load
+        path = os.path.join(self.folder, "{}.pkl".format(len(self.jobs)))
+        with open(path, 'wb') as f:
+            pickle.dump(runner, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # split into batches as a single run would, the largest chunks first
+        items = sorted(stage[0].pool, key=os.path.getsize, reverse=True)
+        n_batches = min(len(items), self.configs["n_processors"] * Executor.batches_per_processor)
+        batches = [items[i::n_batches] for i in range(n_batches)]
+
+        job = {
+            "name": "{} {}".format(name, "+".join(type(analyser).__name__ for analyser in stage)),
+            "group": name,
+            "runner": runner,
+            "path": path,
+            "stages": stages[1:],
+            "chunks": len(items),
+            "size": sum(os.path.getsize(item) for item in items),
+            "done": 0,
+            "ready": [],
+            "merging": 0,
+            "saving": False,
+            "start": time.time()
+            }
+        self.jobs.append(job)
+        self.active += 1
+        self.progress.total += job["chunks"]
+        self.progress.refresh()
+
+        for batch in batches:
+            heapq.heappush(self.queued, (-job["size"], -sum(map(os.path.getsize, batch)), next(self.sequence), job, batch))
+
+        self.check_finished(job)
+
+    def submit(self, job, batch):
+        """Sends a batch of chunks of a job to the pool.
+
+        Arguments:
+            job {dict} -- the job
+            batch {list[str]} -- paths to the pre-processed resource files
+        """
+
+        self.in_flight += 1
+        self.pool.apply_async(
+            process_batch, (job["path"], batch),
+            callback=lambda result: self.events.put(("batch", job, result)),
+            error_callback=lambda error: self.events.put(("error", job, error))
+            )
+
+    def handle(self, kind, job, result):
+        """Handles an event from the pool, the saving thread or the loading thread.
+
+        Arguments:
+            kind {str} -- "batch", "merged", "saved", "loaded" or "error"
+            job {dict|str} -- the job the event belongs to, or the name of the group which was loaded
+            result {object} -- the chunks covered by and the result of a batch or merge, the loading of a group,
+                or the exception raised
+        """
+
+        if kind == "error":
+            raise result
+
+        if kind == "loaded":
+            self.finish_group(job, result)
+            return
+
+        if kind == "batch":
+            self.in_flight -= 1
+            job["done"] += len(result[0])
+            job["ready"].append(result)
+            self.progress.update(len(result[0]))
+        elif kind == "merged":
+            job["merging"] -= 1
+            job["ready"].append(result)
+        elif kind == "saved":
+            self.finish_job(job)
+            return
+
+        self.pair(job)
+        self.check_finished(job)
+
+    def pair(self, job):
+        """Sends pairs of waiting results of a job to the pool to be combined, pairing results covering the same
+        number of chunks until every chunk of the job has been processed.
+
+        Arguments:
+            job {dict} -- the job
+        """
+
+        for (chunks_a, a), (chunks_b, b) in pair_ready(job["ready"], job["done"] == job["chunks"]):
+            job["merging"] += 1
+            self.pool.apply_async(
+                combine_pair, (job["path"], a, b),
+                callback=lambda result, chunks=chunks_a + chunks_b: self.events.put(("merged", job, (chunks, result))),
+                error_callback=lambda error: self.events.put(("error", job, error))
+                )
+
+    def check_finished(self, job):
+        """Hands a job to the saving thread once every chunk has been processed and combined.
+
+        Arguments:
+            job {dict} -- the job
+        """
+
+        if job["saving"] or job["done"] < job["chunks"] or job["merging"] or len(job["ready"]) > 1:
+            return
+
+        job["saving"] = True
+        counts = job["ready"][0][1] if job["ready"] else None
+        future = self.saver.submit(job["runner"].save_stage, counts)
+        future.add_done_callback(lambda future: self.events.put(
+            ("saved", job, None) if future.exception() is None else ("error", job, future.exception())
+            ))
+
+    def finish_job(self, job):
+        """Records the end of a saved job and starts the next pass of its group.
+
+        Arguments:
+            job {dict} -- the job
+        """
+
+        job["end"] = time.time()
+        job["runner"], job["ready"] = None, []
+        os.remove(job["path"])
+        self.active -= 1
+
+        if job["stages"]:
+            self.start_job(job["group"], job["stages"])
+
+    def summary(self, elapsed):
+        """Prints the wall time and throughput of every job.
+
+        Arguments:
+            elapsed {float} -- the wall time of the whole batch in seconds
+        """
+
+        print("{:<48} {:>8} {:>10} {:>9} {:>9} {:>10}".format("job", "chunks", "MB", "time (s)", "MB/s", "chunks/s"))
+        for job in self.jobs:
+            wall = max(job["end"] - job["start"], 1e-9)
+            print("{:<48} {:>8} {:>10.1f} {:>9.1f} {:>9.2f} {:>10.2f}".format(
+                job["name"], job["chunks"], job["size"] / 2**20, wall, job["size"] / 2**20 / wall, job["chunks"] / wall
+                ))
+        for name in self.skipped:
+            print("{:<48} skipped".format(name))
+
+        size = sum(job["size"] for job in self.jobs)
+        print("Executed {} jobs over {:.1f} MB in {:.1f}s, {:.2f} MB/s".format(len(self.jobs), size / 2**20, elapsed, size / 2**20 / max(elapsed, 1e-9)))
+
+
+def init_worker(capacity):
+    """Pool initializer which sets how many jobs each worker keeps loaded.
+
+    Arguments:
+        capacity {int} -- the number of jobs
+    """
+
+    global _capacity
+    _capacity = capacity
+
+
+def load_job(path):
+    """Loads the prepared analyses of a job in a worker, keeping the most recently used jobs loaded.
+
+    Arguments:
+        path {str} -- path to the pickled analyses
+
+    Returns:
+        FusedAnalyser -- the analyses of the job
+    """
+
+    if path in _jobs:
+        _jobs.move_to_end(path)
+        return _jobs[path]
+
+    with open(path, 'rb') as f:
+        _jobs[path] = pickle.load(f)
+    while len(_jobs) > _capacity:
+        _jobs.popitem(last=False)
+
+    return _jobs[path]
+
+
+def process_batch(path, batch):
+    """Processes a batch of chunks of a job in a worker, combining their results locally.
+
+    Arguments:
+        path {str} -- path to the pickled analyses of the job
+        batch {list[str]} -- paths to the pre-processed resource files
+
+    Returns:
+        tuple, object -- the chunks processed and their combined result
+    """
+
+    job = load_job(path)
+    return reduce_batch(batch, job.process, job.combine)
+
+
+def combine_pair(path, a, b):
+    """Combines two partial results of a job in a worker.
+
+    Arguments:
+        path {str} -- path to the pickled analyses of the job
+        a {object} -- a partial result
+        b {object} -- a partial result
+
+    Returns:
+        object -- the combined result
+    """
+
+    return load_job(path).combine(a, b)
@@ -0,0 +1,81 @@
+import os
+import time
+import pickle
+
+
+class Checkpoint:
+    """This periodically saves the partial results of a pass to disk, so that a run which dies can be resumed
+    without processing the chunks it had already completed.
+
+    Each partial result is saved with the chunks it covers. The checkpoint is written to a temporary file which
+    then replaces the previous checkpoint, so a run which dies while writing it always leaves a complete
+    checkpoint behind. To keep the cost of writing checkpoints small, a checkpoint is only written once the
+    interval has passed since the last, and once the time spent writing checkpoints is at most max_overhead
+    of the time spent processing.
+    """
+
+    def __init__(self, path, configs, resume):
+
+        self.path = path
+        self.interval = configs["interval"]
+        self.max_overhead = configs["max_overhead"]
+        self.resume = resume
+        self.start = time.time()
+        self.last = self.start
+        self.writing = 0.0
+        self.written = False
+
+    def load(self):
+        """Loads the partial results of the last checkpoint if resuming.
+
+        Returns:
+            list[tuple[tuple[str], object]] -- the chunks covered by each partial result and the result
+        """
+
+        if not self.resume or not os.path.exists(self.path):
+            return []
+
+        with open(self.path, 'rb') as f:
+            partials = pickle.load(f)
+        print("Resuming from a checkpoint covering {} chunks...".format(sum(len(chunks) for chunks, _ in partials)))
+
+        return partials
+
+    def due(self):
+        """Checks whether the next checkpoint should be written.
+
+        Returns:
+            bool -- whether both the interval and the overhead allow writing a checkpoint
+        """
+
+        now = time.time()
+        return now - self.last >= self.interval and self.writing <= self.max_overhead * (now - self.start)
+
+    def save(self, partials):
+        """Writes a checkpoint atomically.
+
+        Arguments:
+            partials {list[tuple[tuple[str], object]]} -- the chunks covered by each partial result and the result
+        """
+
+        start = time.time()
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.mkdir(os.path.dirname(self.path))
+
+        temp = self.path + ".tmp"
+        with open(temp, 'wb') as f:
+            pickle.dump(partials, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+        self.last = time.time()
+        self.writing += self.last - start
+        self.written = True
+
+    def remove(self):
+        """Removes the checkpoint once the results of the pass have been saved.
+        """
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
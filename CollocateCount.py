@@ -0,0 +1,324 @@
+import heapq
+import numpy as np
+from itertools import chain
+from operator import itemgetter
+from collections import Counter
+
+
+class CollocateCount:
+    """The collocate counts of each word, as a dict of Counters which is sent between processes in a compact
+    columnar form.
+
+    Within a process the counts are updated like any dict of Counters. When they are pickled, every distinct
+    collocate is written once and the counts become arrays of (collocate_id, count) grouped by word, rather than
+    pickling every key of every Counter as a separate object. Collocates of token IDs are written as a flat array
+    of IDs with the length of each tuple, text collocates are joined into a single string, and every array uses
+    the smallest unsigned type which holds its values.
+
+    An unpickled count keeps its compact form until its counters are first accessed, so results which are only
+    passing through a process, such as the partial results the parent forwards to be merged, are never decoded.
+
+    Once summarised, the counter of each word is a Space-Saving summary which keeps at most `capacity`
+    collocates. Each estimated count never underestimates the true count, the error of each collocate bounds
+    the overestimate, and any collocate which is not kept occurred at most the threshold of its word. Summaries
+    are merged as in SpaceSaving, word by word, while the pinned keys, such as a total, are always kept exactly.
+    """
+
+    def __init__(self, words=(), state=None, capacity=None, pinned=(), thresholds=None, errors=None):
+
+        self._counts = None if state is not None else {word: Counter() for word in words}
+        self._state = state
+        self.capacity = capacity
+        self.pinned = frozenset(pinned)
+        self.thresholds = thresholds if thresholds is not None else {word: 0 for word in words}
+        self._errors = errors if errors is not None else {word: Counter() for word in words}
+
+    @property
+    def counts(self):
+        """The counter of each word, decoded from the compact form if required.
+        """
+
+        if self._counts is None:
+            self._counts = self.decode(*self._state)
+            if self.capacity is not None:
+                self._errors = self.decode_errors(self._counts, self._errors)
+            self._state = None
+
+        return self._counts
+
+    @property
+    def errors(self):
+        """The error of each kept collocate of each word whose error is not 0.
+        """
+
+        # the errors are decoded together with the counts
+        self.counts
+        return self._errors
+
+    def __getitem__(self, word):
+
+        return self.counts[word]
+
+    def __iter__(self):
+
+        return iter(self.counts)
+
+    def __len__(self):
+
+        return len(self.counts)
+
+    def items(self):
+
+        return self.counts.items()
+
+    def update(self, other):
+        """Adds the counts of another count of the same words, merging the summaries of each word if either
+        count has been summarised.
+
+        Arguments:
+            other {CollocateCount} -- the collocate counts
+
+        Returns:
+            CollocateCount -- this count, updated in place
+        """
+
+        if self.capacity is None and other.capacity is None:
+            for word, counter in self.counts.items():
+                counter.update(other[word])
+            return self
+
+        # decode before the capacity changes how the compact form is read
+        words = list(self.counts)
+        self.capacity = min(c for c in [self.capacity, other.capacity] if c is not None)
+        self.pinned |= other.pinned
+        for word in words:
+            self.merge(word, other[word], other.thresholds.get(word, 0), other.errors.get(word, Counter()))
+
+        return self
+
+    def summarise(self, capacity, pinned=()):
+        """Reduces the counter of each word to its most common collocates, as a chunk's Space-Saving summary.
+
+        Arguments:
+            capacity {int} -- the number of collocates kept for each word
+            pinned {iterable} -- keys which are always kept exactly, and not counted towards the capacity
+
+        Returns:
+            CollocateCount -- this count, summarised in place
+        """
+
+        self.capacity = capacity
+        self.pinned = frozenset(pinned)
+        for word in self.counts:
+            self.merge(word, Counter(), 0, Counter())
+
+        return self
+
+    def merge(self, word, other, other_threshold, other_errors):
+        """Merges a summary into the summary of a word, keeping the capacity largest estimates.
+
+        Arguments:
+            word {str|int} -- the word
+            other {Counter} -- the estimated count of each collocate of the other summary
+            other_threshold {int} -- the largest count of a collocate the other summary does not keep
+            other_errors {Counter} -- the error of each collocate of the other summary
+        """
+
+        counter, threshold, errors = self.counts[word], self.thresholds.get(word, 0), self.errors.get(word, Counter())
+
+        # a key missing from a summary may have occurred as often as its threshold, except for the pinned keys
+        estimates = Counter()
+        merged_errors = Counter()
+        for key in counter.keys() | other.keys():
+            if key in self.pinned:
+                estimates[key] = counter.get(key, 0) + other.get(key, 0)
+                continue
+            estimates[key] = counter.get(key, threshold) + other.get(key, other_threshold)
+            merged_errors[key] = (errors.get(key, 0) if key in counter else threshold) + \
+                (other_errors.get(key, 0) if key in other else other_threshold)
+
+        # keep the largest estimates, a discarded key may have occurred as often as the largest discarded
+        kept = {key: estimates.pop(key) for key in self.pinned if key in estimates}
+        top = heapq.nlargest(self.capacity + 1, estimates.items(), key=itemgetter(1))
+        threshold += other_threshold
+        if len(top) > self.capacity:
+            threshold = max(threshold, top[self.capacity][1])
+        kept.update(top[:self.capacity])
+
+        self.counts[word] = Counter(kept)
+        self.thresholds[word] = threshold
+        self._errors[word] = Counter({key: merged_errors[key] for key in kept if merged_errors[key]})
+
+    def error(self, word, key):
+        """Returns the bound on how far the estimated count of a collocate of a word may exceed its true count.
+
+        Arguments:
+            word {str|int} -- the word
+            key {str|int|tuple[int]} -- the collocate
+
+        Returns:
+            int -- the error bound, which is 0 for exact counts
+        """
+
+        if self.capacity is None:
+            return 0
+        return self.errors[word].get(key, 0) if key in self.counts[word] else self.thresholds[word]
+
+    def guaranteed(self, k):
+        """Counts the words whose k most common collocates are certain to be among those kept, which holds when
+        the k-th largest lower bound of the kept collocates is at least the threshold of the word.
+
+        Arguments:
+            k {int} -- the number of collocates
+
+        Returns:
+            int -- the number of words
+        """
+
+        n = 0
+        for word, counter in self.counts.items():
+            lower = sorted((c - self.errors[word].get(key, 0) for key, c in counter.items() if key not in self.pinned), reverse=True)
+            if len(lower) >= k:
+                n += lower[k - 1] >= self.thresholds[word]
+            else:
+                n += not self.thresholds[word]
+
+        return n
+
+    def arrays(self):
+        """Returns every (word, collocate, count) entry, numbering the distinct collocates.
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray, list -- the word and collocate index of each entry, its count,
+                and the collocate of each index
+        """
+
+        words, _, _, _, _, lengths, cols, counts = self.encode(self.counts)
+        rows = np.repeat(np.arange(len(words)), lengths)
+        keys = list(dict.fromkeys(chain.from_iterable(self.counts.values())))
+
+        return rows, cols.astype(np.int64), counts.astype(np.int64), keys
+
+    def __reduce__(self):
+
+        if self.capacity is None:
+            return CollocateCount, ((), self._state if self._state is not None else self.encode(self._counts))
+
+        # the errors of a summary are sent as an array in the same order as its counts
+        if self._state is not None:
+            return CollocateCount, ((), self._state, self.capacity, self.pinned, self.thresholds, self._errors)
+        errors = [self._errors[word].get(key, 0) for word, counter in self._counts.items() for key in counter]
+        errors = np.array(errors, dtype=self.smallest_type(max(errors, default=0)))
+        return CollocateCount, ((), self.encode(self._counts), self.capacity, self.pinned, self.thresholds, errors)
+
+    @staticmethod
+    def encode(counts):
+        """Returns the compact form of the counter of each word.
+
+        Arguments:
+            counts {dict{str|int:Counter}} -- the counter of each word
+
+        Returns:
+            tuple -- the words, the text collocates, and the arrays described in decode
+        """
+
+        words = list(counts)
+        counters = [counts[word] for word in words]
+
+        # number every distinct collocate in the order in which they first appear
+        collocates = list(chain.from_iterable(counters))
+        index = {key: i for i, key in enumerate(dict.fromkeys(collocates))}
+        keys = list(index)
+
+        # whether each collocate is text (0), a bare token ID (1) or a tuple of token IDs (2)
+        kinds = [0 if isinstance(key, str) else 1 if isinstance(key, int) else 2 for key in keys]
+        tokens = list(chain.from_iterable((key,) if kind == 1 else key for key, kind in zip(keys, kinds) if kind))
+        sizes = [len(key) for key, kind in zip(keys, kinds) if kind == 2]
+        counts = list(chain.from_iterable(counter.values() for counter in counters))
+        smallest_type = CollocateCount.smallest_type
+
+        return (
+            words,
+            "\n".join(key for key, kind in zip(keys, kinds) if not kind),
+            np.array(kinds, dtype=np.uint8),
+            np.array(tokens, dtype=smallest_type(max(tokens, default=0))),
+            np.array(sizes, dtype=smallest_type(max(sizes, default=0))),
+            np.array([len(counter) for counter in counters], dtype=smallest_type(len(keys))),
+            np.array(list(map(index.__getitem__, collocates)), dtype=smallest_type(len(keys))),
+            np.array(counts, dtype=smallest_type(max(counts, default=0)))
+            )
+
+    @staticmethod
+    def decode(words, text, kinds, tokens, sizes, lengths, cols, counts):
+        """Rebuilds the counter of each word from the compact form.
+
+        Arguments:
+            words {list[str|int]} -- the words whose collocates are counted
+            text {str} -- the text collocates, separated by newlines
+            kinds {np.ndarray} -- whether each collocate is text (0), a bare token ID (1) or a tuple of token IDs (2)
+            tokens {np.ndarray} -- the token IDs of every collocate which is not text
+            sizes {np.ndarray} -- the number of token IDs in each tuple
+            lengths {np.ndarray} -- the number of collocates counted for each word
+            cols {np.ndarray} -- the index of the collocate of each count
+            counts {np.ndarray} -- the counts, grouped by word
+
+        Returns:
+            dict{str|int:Counter} -- the counter of each word
+        """
+
+        # unpack the collocates in the order in which they were numbered
+        text = iter(text.split("\n"))
+        sizes = iter(sizes.tolist())
+        tokens = tokens.tolist()
+        keys = []
+        p = 0
+        for kind in kinds.tolist():
+            if not kind:
+                keys.append(next(text))
+            elif kind == 1:
+                keys.append(tokens[p])
+                p += 1
+            else:
+                size = next(sizes)
+                keys.append(tuple(tokens[p:p+size]))
+                p += size
+
+        # rebuild the counter of each word from its slice of the counts
+        bounds = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).tolist()
+        cols, counts = list(map(keys.__getitem__, cols.tolist())), counts.tolist()
+
+        return {
+            word: Counter(dict(zip(cols[start:end], counts[start:end])))
+            for word, start, end in zip(words, bounds[:-1], bounds[1:])
+            }
+
+    @staticmethod
+    def decode_errors(counts, errors):
+        """Rebuilds the errors of each word from the array sent alongside the compact form.
+
+        Arguments:
+            counts {dict{str|int:Counter}} -- the decoded counter of each word
+            errors {np.ndarray} -- the error of every count, in the order of the counts
+
+        Returns:
+            dict{str|int:Counter} -- the error of each collocate of each word whose error is not 0
+        """
+
+        errors = iter(errors.tolist())
+        return {word: Counter({key: e for key, e in zip(counter, errors) if e}) for word, counter in counts.items()}
+
+    @staticmethod
+    def smallest_type(n):
+        """Returns the smallest unsigned integer type which holds every value up to n.
+
+        Arguments:
+            n {int} -- the largest value
+
+        Returns:
+            type -- the numpy integer type
+        """
+
+        for dtype in [np.uint8, np.uint16, np.uint32]:
+            if n <= np.iinfo(dtype).max:
+                return dtype
+        return np.uint64
@@ -0,0 +1,133 @@
+import numpy as np
+from NgramCount import NgramCount
+
+
+class CollocateMatrix:
+    """A sparse co-occurrence matrix of headwords and their collocates, used by the matrix collocate engine.
+
+    Each headword is given a row, found from its token ID with a single array lookup. The collocates one word
+    before or after a headword are counted in a matrix with a column per token ID, and the collocates two words
+    before or after in a matrix with a column per pair of token IDs. Both are held in coordinate form as counts
+    of packed (row, token...) keys, so merging the matrices of two chunks is a sparse matrix addition.
+    """
+
+    def __init__(self, singles, pairs):
+
+        self.singles = singles
+        self.pairs = pairs
+
+    @classmethod
+    def empty(cls, vocab_size):
+        """Returns a matrix containing no co-occurrences.
+
+        Arguments:
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            CollocateMatrix -- the empty matrix
+        """
+
+        return cls(NgramCount.empty(2, vocab_size), NgramCount.empty(3, vocab_size))
+
+    @staticmethod
+    def row_index(words, vocab_size):
+        """Returns the lookup from token ID to row, where any token which is not a headword has no row.
+
+        Arguments:
+            words {list[int]} -- the token IDs of the headwords
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            np.ndarray -- the row of each token ID, or -1
+        """
+
+        rows = np.full(vocab_size, -1, dtype=np.int64)
+        rows[np.asarray(words, dtype=np.int64)] = np.arange(len(words))
+        return rows
+
+    @classmethod
+    def from_chunk(cls, chunk, rows, vocab_size):
+        """Counts the collocates up to two words before or after every headword of the chunk, within its sentence,
+        weighting each by the weight of its sentence.
+
+        Arguments:
+            chunk {TokenChunk} -- the memory-mapped tokens and sentence offsets
+            rows {np.ndarray} -- the row of each token ID, as returned by row_index
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            CollocateMatrix -- the co-occurrence counts of the chunk
+        """
+
+        tokens = np.asarray(chunk.tokens, dtype=np.int64)
+        offsets = np.asarray(chunk.offsets, dtype=np.int64)
+        weights = chunk.token_weights()
+        lengths = np.diff(offsets)
+        sentence_start = np.repeat(offsets[:-1], lengths)
+        sentence_end = np.repeat(offsets[1:], lengths)
+
+        # find the position of every headword
+        hits = np.flatnonzero(rows[tokens] >= 0)
+        start, end = sentence_start[hits], sentence_end[hits]
+
+        # the single words immediately before and after
+        before = hits[hits - 1 >= start]
+        after = hits[hits + 1 < end]
+        heads = np.concatenate([before, after])
+        singles = NgramCount.from_columns([
+            rows[tokens[heads]],
+            tokens[np.concatenate([before - 1, after + 1])]
+            ], vocab_size, weights[heads] if weights is not None else None)
+
+        # the pairs of words immediately before and after
+        before = hits[hits - 2 >= start]
+        after = hits[hits + 2 < end]
+        heads = np.concatenate([before, after])
+        pairs = NgramCount.from_columns([
+            rows[tokens[heads]],
+            tokens[np.concatenate([before - 2, after + 1])],
+            tokens[np.concatenate([before - 1, after + 2])]
+            ], vocab_size, weights[heads] if weights is not None else None)
+
+        return cls(singles, pairs)
+
+    def __add__(self, other):
+
+        if not isinstance(other, CollocateMatrix):
+            return NotImplemented
+
+        return CollocateMatrix(self.singles + other.singles, self.pairs + other.pairs)
+
+    def resize(self, vocab_size):
+        """Returns the matrix with its keys packed for a larger vocabulary.
+
+        Arguments:
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            CollocateMatrix -- the same matrix, repacked if the vocabulary needs more bits per token
+        """
+
+        return CollocateMatrix(self.singles.resize(vocab_size), self.pairs.resize(vocab_size))
+
+    def arrays(self):
+        """Returns every (headword, collocate, count) entry of both matrices, numbering the distinct collocates.
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray, list -- the row and collocate index of each entry, its count,
+                and the collocate of each index as the key used by the counter engine
+        """
+
+        # gather both matrices, where the second token of a single collocate is -1
+        row, first = self.singles.columns()
+        pair_row, pair_first, pair_second = self.pairs.columns()
+        row = np.concatenate([row, pair_row])
+        first = np.concatenate([first, pair_first])
+        second = np.concatenate([np.full(len(self.singles), -1, dtype=np.int64), pair_second])
+        counts = np.concatenate([self.singles.counts, self.pairs.counts])
+
+        # number the distinct collocates
+        collocates, cols = np.unique(np.stack([first, second], axis=1), axis=0, return_inverse=True)
+        keys = [a if b < 0 else (a, b) for a, b in collocates.tolist()]
+
+        return row, cols.reshape(-1), counts, keys
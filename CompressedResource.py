@@ -0,0 +1,163 @@
+import os
+import bz2
+import gzip
+import lzma
+import mmap
+import struct
+
+
+class CompressedResource:
+    """This reads raw resource files compressed with gzip, bz2 or xz without decompressing them to disk first.
+
+    Most compressed files can only be decompressed from the start, so they are streamed, cutting the text into
+    chunks of whole lines as it is decompressed. A gzip file made of independently compressed BGZF blocks, as
+    written by bgzip, records the compressed and uncompressed size of every block, so it is indexed instead:
+    the blocks are grouped into ranges up front and each worker decompresses its own range from the file.
+    """
+
+    # the module which decompresses each format, by file extension
+    openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+    @staticmethod
+    def is_compressed(filename):
+        """Checks whether a raw resource file is compressed in a supported format, from its extension.
+
+        Arguments:
+            filename {str} -- path to the raw resource file
+
+        Returns:
+            bool -- whether the file is compressed
+        """
+
+        return os.path.splitext(filename)[1] in CompressedResource.openers
+
+    @staticmethod
+    def stream_chunks(filename, chunk_size):
+        """Decompresses a file from the start, yielding chunks of roughly the chunk size which end at the end of
+        a line.
+
+        Arguments:
+            filename {str} -- path to the raw resource file
+            chunk_size {int} -- the size of each chunk in uncompressed bytes
+
+        Yields:
+            bytes -- the chunk of text
+        """
+
+        with CompressedResource.openers[os.path.splitext(filename)[1]](filename, 'rb') as resource:
+            while True:
+                data = resource.read(chunk_size)
+                if not data:
+                    break
+                yield data + resource.readline()
+
+    @staticmethod
+    def bgzf_blocks(filename):
+        """Lists the blocks of a BGZF file from their headers and trailers, without decompressing them.
+
+        Arguments:
+            filename {str} -- path to the raw resource file
+
+        Returns:
+            list[tuple[int, int, int]] -- the offset, compressed size and uncompressed size of each block, or None
+                if the file is not made of BGZF blocks
+        """
+
+        if not filename.endswith(".gz") or not os.path.getsize(filename):
+            return None
+
+        blocks = []
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            p = 0
+            while p < len(data):
+                size = CompressedResource.block_size(data, p)
+                if size is None:
+                    return None
+
+                # the trailer ends with the uncompressed size
+                blocks.append((p, size, struct.unpack("<I", data[p + size - 4:p + size])[0]))
+                p += size
+
+        return blocks
+
+    @staticmethod
+    def block_size(data, p):
+        """Reads the compressed size of a BGZF block from the single extra field of its header.
+
+        Arguments:
+            data {mmap.mmap} -- the compressed file
+            p {int} -- the offset of the block
+
+        Returns:
+            int -- the size of the block, or None if it is not a BGZF block
+        """
+
+        header = data[p:p + 18]
+        if len(header) < 18 or header[:4] != b"\x1f\x8b\x08\x04" or header[10:16] != b"\x06\x00BC\x02\x00":
+            return None
+        return struct.unpack("<H", header[16:18])[0] + 1
+
+    @staticmethod
+    def block_ranges(blocks, chunk_size):
+        """Groups the blocks of a BGZF file into ranges of roughly the chunk size in uncompressed bytes.
+
+        Arguments:
+            blocks {list[tuple[int, int, int]]} -- the blocks, as returned by bgzf_blocks
+            chunk_size {int} -- the size of each range in uncompressed bytes
+
+        Returns:
+            list[tuple[int, int, int]] -- the offset of the last block before each range which is not empty, or
+                None if there is none, and the start and end offset of the range
+        """
+
+        ranges = []
+        previous, last = None, None
+        start, size = 0, 0
+        for i, (offset, length, block_size) in enumerate(blocks):
+            size += block_size
+            if block_size:
+                last = offset
+            if size >= chunk_size or i + 1 == len(blocks):
+                ranges.append((previous, start, offset + length))
+                previous, start, size = last, offset + length, 0
+
+        return ranges
+
+    @staticmethod
+    def read_block_range(filename, previous, start, end):
+        """Decompresses a range of BGZF blocks, keeping every line which starts within the range.
+
+        A line which started in an earlier range is left to that range, while the last line of the range is
+        completed from the blocks which follow it.
+
+        Arguments:
+            filename {str} -- path to the raw resource file
+            previous {int} -- the offset of the last block before the range which is not empty, or None
+            start {int} -- the offset of the first block of the range
+            end {int} -- the offset after the last block of the range
+
+        Returns:
+            bytes -- the lines of the range
+        """
+
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = gzip.decompress(data[start:end])
+
+            # skip the end of a line which started before the range
+            if previous is not None:
+                before = gzip.decompress(data[previous:previous + CompressedResource.block_size(data, previous)])
+                if not before.endswith(b"\n"):
+                    text = text[text.find(b"\n") + 1:] if b"\n" in text else b""
+
+            # complete the last line
+            p = end
+            while text and not text.endswith(b"\n") and p < len(data):
+                size = CompressedResource.block_size(data, p)
+                block = gzip.decompress(data[p:p + size])
+                cut = block.find(b"\n") + 1
+                text += block[:cut] if cut else block
+                if cut:
+                    break
+                p += size
+
+        return text
@@ -0,0 +1,183 @@
+import os
+import zlib
+import numpy as np
+from TokenCorpus import TokenCorpus
+from SentenceIndex import SentenceIndex
+from AnalyserTemplate import AnalyserTemplate
+
+
+class Concordance(AnalyserTemplate):
+    """This looks up example sentences for a list of words or phrases, giving each occurrence as a keyword in
+    context: the words to its left, the keyword itself and the words to its right.
+
+    The occurrences are found from the positional index rather than by scanning the corpus, and only the
+    sentences of the selected examples are read, from the memory-mapped text files through the sentence
+    offset index. Each example is traced back to its sentence and to any metadata stripped from it, such as
+    the sentence ID of Tatoeba.
+    """
+
+    def prepare(self):
+        """Initialises the configurations and loads the queries of the concordance.
+
+        The first n_examples occurrences of each word or phrase listed in the text file specified in the configs
+        are selected, or if random is set, n_examples occurrences drawn at random using the seed.
+        """
+
+        # initialise configurations
+        self.task_configs = self.configs["concordance"]
+        self.dest_filename = os.path.join(self.results_folder, self.task_configs["dest_filename"].split('.')[0])
+
+        # check the index is available
+        if not self.index:
+            raise ValueError("The concordance requires the index pre-processing option to be enabled...")
+
+        # load the queries, where a query containing any word outside the vocabulary cannot occur
+        self.queries = self.load_queries(os.path.join(self.resource_folder, self.task_configs["queries_filename"].format(l=self.language)))
+        self.phrases = [[self.encode(word) for word in query.split()] for query in self.queries]
+        self.phrases = [phrase if phrase and None not in phrase else [] for phrase in self.phrases]
+
+    def process_chunk(self, chunk):
+        """Finds every occurrence of each query in a single chunk, keeping those which may be selected.
+
+        Arguments:
+            chunk {TokenChunk} -- the memory-mapped tokens and sentence offsets of the chunk
+
+        Returns:
+            list[list] -- the number of occurrences of each query and its candidate examples
+        """
+
+        index = TokenCorpus.load_index(chunk.path)
+        tokens = np.asarray(chunk.tokens, dtype=np.int64)
+        offsets = np.asarray(chunk.offsets, dtype=np.int64)
+        weights = np.asarray(chunk.sentence_weights(), dtype=np.int64)
+        part = self.part_number(chunk.path)
+
+        results = self.empty()
+        for i, phrase in enumerate(self.phrases):
+            if not phrase:
+                continue
+
+            # find the occurrences of the first word which the rest of the phrase follows within the sentence
+            positions = index.postings(phrase[0])
+            sentence = np.searchsorted(offsets, positions, side="right") - 1
+            found = positions + len(phrase) <= offsets[sentence + 1]
+            for k, token in enumerate(phrase[1:], 1):
+                found[found] = tokens[positions[found] + k] == token
+            positions, sentence = positions[found], sentence[found]
+            matches = int(weights[sentence].sum())
+
+            # order the occurrences by position, or at random
+            if self.task_configs["random"]:
+                seed = [self.task_configs["seed"], zlib.crc32(self.queries[i].encode()), part]
+                keys = np.random.default_rng(seed).random(len(positions))
+            else:
+                keys = np.zeros(len(positions))
+
+            # keep the first n_examples, as no more can be selected from this chunk
+            selected = np.lexsort((positions, keys))[:self.task_configs["n_examples"]]
+            start = positions[selected] - offsets[sentence[selected]]
+            results[i] = [matches, [
+                (key, part, line, word)
+                for key, line, word in zip(keys[selected].tolist(), sentence[selected].tolist(), start.tolist())
+                ]]
+
+        return results
+
+    def cache_state(self):
+        """Returns the configurations which the occurrences found in a chunk depend on.
+
+        Returns:
+            dict -- the queries and how the examples are selected
+        """
+
+        return {
+            "queries": self.queries,
+            "n_examples": self.task_configs["n_examples"],
+            "random": self.task_configs["random"],
+            "seed": self.task_configs["seed"]
+            }
+
+    def empty(self):
+        """Returns the occurrences found in an empty chunk.
+
+        Returns:
+            list[list] -- no occurrences of each query
+        """
+
+        return [[0, []] for _ in self.queries]
+
+    def combine(self, results, other):
+        """Combines the occurrences found in two chunks, keeping the first n_examples of each query.
+
+        Arguments:
+            results {list[list]} -- the occurrences of each query, updated in place
+            other {list[list]} -- the occurrences of each query
+
+        Returns:
+            list[list] -- the combined occurrences
+        """
+
+        for result, (total, examples) in zip(results, other):
+            result[0] += total
+            result[1] = sorted(result[1] + examples)[:self.task_configs["n_examples"]]
+
+        return results
+
+    def save(self):
+        """Saves the examples to csv at the path specified by the configs, reading only the sentences of the
+        selected examples.
+        """
+
+        width = self.task_configs["width"]
+        parts = {self.part_number(part): part for part in self.pool}
+        names = ["query", "matches"] + (["matches_low", "matches_high"] if self.sampler else []) + ["part", "sentence", "source", "left", "keyword", "right"]
+        columns = {name: [] for name in names}
+
+        # sampled matches are scaled up to the whole resource, with the bounds of their confidence intervals
+        totals = [total for total, _ in self.master_count]
+        matches = [(total, total, total) for total in totals]
+        if self.sampler:
+            matches = list(zip(*[values.tolist() for values in self.sampler.counts(totals)]))
+
+        for query, phrase, (_, examples), (total, low, high) in zip(self.queries, self.phrases, self.master_count, matches):
+            print("Found {} occurrences of '{}'".format(total, query))
+
+            # read the sentences of the examples, part by part
+            sentences = {}
+            for part in sorted({example[1] for example in examples}):
+                lines = [example[2] for example in examples if example[1] == part]
+                texts = SentenceIndex.read_sentences(parts[part], lines)
+                sources = SentenceIndex.read_sources(parts[part], lines)
+                sentences.update({(part, line): (text.split(), source) for line, text, source in zip(lines, texts, sources)})
+
+            # split each sentence around its keyword
+            for _, part, line, start in examples:
+                words, source = sentences[(part, line)]
+                end = start + len(phrase)
+                columns["query"].append(query)
+                columns["matches"].append(total)
+                if self.sampler:
+                    columns["matches_low"].append(low)
+                    columns["matches_high"].append(high)
+                columns["part"].append(os.path.basename(parts[part]))
+                columns["sentence"].append(line)
+                columns["source"].append(source)
+                columns["left"].append(" ".join(words[max(start - width, 0):start]))
+                columns["keyword"].append(" ".join(words[start:end]))
+                columns["right"].append(" ".join(words[end:end + width]))
+
+        self.write_results(columns)
+
+    def load_queries(self, queries_file):
+        """Loads the words or phrases to be looked up, normalising them in the same way as the resource.
+
+        Arguments:
+            queries_file {str} -- path to the queries file, with one word or phrase per line
+
+        Returns:
+            list[str] -- the normalised queries
+        """
+
+        with open(queries_file, 'r', encoding="UTF-8") as f:
+            queries = [" ".join(self.normalise(line)) for line in f]
+        return [query for query in queries if query]
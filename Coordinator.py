@@ -0,0 +1,306 @@
+import os
+import time
+import tqdm
+import queue
+import pickle
+import socket
+import itertools
+import threading
+import traceback
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from Executor import reduce_batch
+
+
+# the coordinator of this process, which keeps its workers connected from one pass of the analysis to the next
+_coordinator = None
+
+# the environment variable holding the key shared by the coordinator and its workers
+AUTHKEY_VARIABLE = "ANALYSE_AUTHKEY"
+
+
+class Coordinator:
+    """This executes the processing of every chunk on worker processes on any number of hosts, which connect
+    over TCP, as an alternative to the pool of a single machine.
+
+    Each worker which connects is sent the processing and combining functions of the current pass once, and
+    then tasks of a few chunk paths at a time, so every host must see the pre-processed resource at the same
+    path, such as on a shared filesystem. Each worker combines the results of the chunks of a task locally and
+    returns them, and the coordinator combines the results of the tasks as they arrive. A task whose worker
+    disconnects or does not answer within the timeout is handed to the next free worker, and a result which
+    arrives for a task that has already completed is ignored, so losing a worker never loses or double counts
+    a chunk.
+
+    The connections are authenticated with the key in the ANALYSE_AUTHKEY environment variable, as the
+    messages are pickled, and no connection is made without one.
+
+    Given a checkpoint, the combined result is saved to it from time to time with the chunks it covers, and the
+    chunks covered by a checkpoint which is resumed are not sent to the workers again.
+    """
+
+    def __init__(self, address, configs):
+
+        self.address = address
+        self.configs = configs
+        self.ids = itertools.count()
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.workers = 0
+        self.lock = threading.Lock()
+        self.job = 0
+        self.payload = None
+
+        self.listener = Listener(address, authkey=authkey())
+        threading.Thread(target=self.accept, daemon=True).start()
+        print("Waiting for workers on {}:{}...".format(*address))
+
+    @staticmethod
+    def instance(address, configs):
+        """Returns the coordinator of this process, creating it if required.
+
+        Arguments:
+            address {tuple[str, int]} -- the host and port to listen on
+            configs {dict} -- the distributed configs
+
+        Returns:
+            Coordinator -- the coordinator
+        """
+
+        global _coordinator
+        if _coordinator is None or _coordinator.address != address:
+            _coordinator = Coordinator(address, configs)
+
+        return _coordinator
+
+    @staticmethod
+    def parse_address(address):
+        """Parses an address of the form HOST:PORT.
+
+        Arguments:
+            address {str} -- the address
+
+        Returns:
+            tuple[str, int] -- the host and port
+        """
+
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError("The address must be given as HOST:PORT...")
+        return host, int(port)
+
+    def start_job(self, process, combine, checkpoint=None):
+        """Sets the processing and combining functions of the next pass, which are sent to each worker before
+        its first task of the pass.
+
+        Arguments:
+            process {callable} -- processes a single chunk
+            combine {callable} -- combines two results into one
+            checkpoint {Checkpoint} -- where to save the partial results of the pass, if anywhere
+
+        Returns:
+            Coordinator -- the coordinator, to be entered as a context manager like an Executor
+        """
+
+        self.combine = combine
+        self.checkpoint = checkpoint
+        self.payload = pickle.dumps((process, combine), protocol=pickle.HIGHEST_PROTOCOL)
+        self.job += 1
+
+        return self
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # drop the tasks of a failed pass, leaving the workers connected
+        while not self.tasks.empty():
+            self.tasks.get()
+
+    def accept(self):
+        """Accepts workers for the lifetime of the process, serving each from its own thread.
+        """
+
+        while True:
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError:
+                print("Rejected a worker which failed to authenticate...")
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def serve(self, connection):
+        """Sends tasks to a single worker and collects their results until the worker is lost, in which case its
+        current task is queued again.
+
+        Arguments:
+            connection {Connection} -- the connection to the worker
+        """
+
+        task, name, joined, job = None, "unknown", False, None
+        try:
+            _, host, pid = connection.recv()
+            name = "{}:{}".format(host, pid)
+            with self.lock:
+                self.workers += 1
+            joined = True
+
+            while True:
+                task = self.tasks.get()
+                task_id, task_job, batch = task
+
+                # send the functions of the pass first if the worker does not have them yet
+                if task_job != self.job:
+                    task = None
+                    continue
+                if job != task_job:
+                    connection.send(("job", self.payload))
+                    job = task_job
+
+                connection.send(("task", task_id, batch))
+                if not connection.poll(self.configs["task_timeout"]):
+                    raise TimeoutError("no result within {}s".format(self.configs["task_timeout"]))
+                kind, task_id, size, result = connection.recv()
+                self.results.put((kind, task_id, size, result))
+                task = None
+
+        except (EOFError, OSError, TimeoutError) as e:
+            if task is not None:
+                print("Lost worker {} ({}), reassigning {} chunks...".format(name, type(e).__name__, len(task[2])))
+                self.tasks.put(task)
+        finally:
+            if joined:
+                with self.lock:
+                    self.workers -= 1
+            connection.close()
+
+    def map_reduce(self, items):
+        """Processes every item on the workers and combines the results as they arrive.
+
+        Arguments:
+            items {list} -- the items to be processed
+
+        Returns:
+            object -- the combined result, or None if there were no items
+        """
+
+        # start from the result of the checkpoint, skipping the chunks it covers
+        count, done = None, []
+        for chunks, result in self.checkpoint.load() if self.checkpoint else []:
+            count = result if count is None else self.combine(count, result)
+            done.extend(chunks)
+        skipped = set(done)
+        remaining = [item for item in items if item not in skipped]
+
+        n = self.configs["chunks_per_task"]
+        pending = {next(self.ids): remaining[i:i+n] for i in range(0, len(remaining), n)}
+        for task_id, batch in pending.items():
+            self.tasks.put((task_id, self.job, batch))
+
+        # combine the result of each task once, ignoring any repeated by a task which was reassigned
+        start = time.time()
+        with tqdm.tqdm(total=len(items), initial=len(done)) as progress:
+            while pending:
+                kind, task_id, size, result = self.results.get()
+                if task_id not in pending:
+                    continue
+                if kind == "error":
+                    raise Exception("A worker failed to process {}...\n{}".format(pending[task_id], result))
+                done.extend(pending.pop(task_id))
+                count = result if count is None else self.combine(count, result)
+                progress.update(size)
+                if self.checkpoint and self.checkpoint.due():
+                    self.checkpoint.save([(tuple(done), count)])
+
+        # keep the final result until it has been saved if the pass was long enough to be checkpointed
+        if self.checkpoint and self.checkpoint.written:
+            self.checkpoint.save([(tuple(done), count)])
+
+        print("Processed {} chunks on {} workers in {:.1f}s".format(len(remaining), self.workers, time.time() - start))
+
+        return count
+
+
+def authkey():
+    """Returns the key shared by the coordinator and its workers, which must be set in the ANALYSE_AUTHKEY
+    environment variable, as anyone holding the key can have pickled messages unpickled on the other side.
+
+    Returns:
+        bytes -- the key
+    """
+
+    key = os.environ.get(AUTHKEY_VARIABLE, "")
+    if len(key) < 16:
+        raise ValueError("Set {} to a secret of at least 16 characters, shared by the coordinator and its workers...".format(AUTHKEY_VARIABLE))
+
+    return key.encode()
+
+
+def connect(address, authkey, wait):
+    """Connects to a coordinator, retrying until it is listening.
+
+    Arguments:
+        address {tuple[str, int]} -- the host and port of the coordinator
+        authkey {bytes} -- the key shared with the coordinator
+        wait {float} -- how long to keep retrying in seconds
+
+    Returns:
+        Connection -- the connection, or None if the coordinator did not start listening in time
+    """
+
+    deadline = time.time() + wait
+    while True:
+        try:
+            return Client(address, authkey=authkey)
+        except (ConnectionRefusedError, ConnectionResetError, EOFError):
+            if time.time() > deadline:
+                return None
+            time.sleep(1)
+
+
+def work(address, authkey, wait):
+    """Processes the tasks of a coordinator, reconnecting if the connection is lost, until no coordinator has
+    been listening for the wait time, or until the job of the coordinator cannot be loaded.
+
+    Arguments:
+        address {tuple[str, int]} -- the host and port of the coordinator
+        authkey {bytes} -- the key shared with the coordinator
+        wait {float} -- how long to wait for the coordinator in seconds
+    """
+
+    while True:
+        connection = connect(address, authkey, wait)
+        if connection is None:
+            return
+
+        with connection:
+            connection.send(("hello", socket.gethostname(), os.getpid()))
+            process, combine, failure = None, None, None
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    break
+
+                # keep the error of a job which cannot be loaded on this host, such as one needing a missing module
+                if message[0] == "job":
+                    try:
+                        process, combine, failure = *pickle.loads(message[1]), None
+                    except Exception:
+                        failure = traceback.format_exc()
+
+                # report the error as the result of the first task of the job rather than dying silently, so the
+                # pass fails instead of its tasks being handed to workers which die in the same way
+                elif message[0] == "task" and failure is not None:
+                    connection.send(("error", message[1], 0, "Failed to load the job on {}...\n{}".format(socket.gethostname(), failure)))
+                    return
+
+                elif message[0] == "task":
+                    _, task_id, batch = message
+                    try:
+                        _, result = reduce_batch(batch, process, combine)
+                        connection.send(("result", task_id, len(batch), result))
+                    except Exception:
+                        connection.send(("error", task_id, 0, traceback.format_exc()))
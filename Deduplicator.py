@@ -0,0 +1,128 @@
+import os
+import hashlib
+import numpy as np
+from collections import Counter, OrderedDict
+from PartFile import PartFile
+from SentenceIndex import SentenceIndex
+
+
+class Deduplicator:
+    """This de-duplicates the sentences of a resource as it is pre-processed, so that each distinct sentence is
+    stored and analysed once, weighted by the number of times it occurred.
+
+    The workers remove the repeats within their own chunk and return an 8 byte BLAKE2b hash and count of each
+    remaining sentence. The parent then checks the chunks in order against the hashes seen in earlier chunks:
+    a sentence seen before is given a weight of 0 and its count is added to the first copy. The hashes are held
+    in a bounded least recently used table, so memory stays flat however large the resource is; a sentence
+    evicted from the table is simply stored again, which costs some repeated work but never changes the counts.
+    Once every chunk has been checked, the extra counts are added to the weights of the first copies and the
+    sentences with a weight of 0 are removed from their parts.
+    """
+
+    def __init__(self, capacity):
+
+        self.capacity = capacity
+        self.parts = []
+        self.seen = OrderedDict()
+        self.extra = {}
+
+    @staticmethod
+    def unique_lines(lines, sources=None):
+        """Removes the repeats of each line within a chunk.
+
+        Arguments:
+            lines {list[str]} -- the pre-processed lines of the chunk
+            sources {list[str]} -- the metadata stripped from each line, if kept (default: {None})
+
+        Returns:
+            list[str], list[str], np.ndarray, np.ndarray -- the distinct lines in order of first occurrence, the
+                metadata of the first occurrence of each, their hashes and the number of times each occurred
+        """
+
+        counts = Counter(lines)
+        first = {}
+        for i, line in enumerate(lines):
+            first.setdefault(line, i)
+
+        unique = list(counts)
+        hashes = [hashlib.blake2b(line.encode("UTF-8"), digest_size=8).digest() for line in unique]
+        hashes = [int.from_bytes(h, "little") for h in hashes]
+
+        return (
+            unique,
+            [sources[first[line]] for line in unique] if sources is not None else None,
+            np.array(hashes, dtype=np.uint64),
+            np.array([counts[line] for line in unique], dtype=np.int64)
+            )
+
+    def add(self, part, hashes, counts):
+        """Checks the distinct sentences of the next part against those of earlier parts, and writes their
+        weights.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+            hashes {np.ndarray} -- the hash of each sentence of the part
+            counts {np.ndarray} -- the number of times each sentence occurred in the chunk
+        """
+
+        # the first copy of each sentence is recorded as its part number and line packed into a single integer
+        p = len(self.parts) << 32
+        self.parts.append(part)
+
+        weights = counts.copy()
+        for line, h in enumerate(hashes.tolist()):
+            first = self.seen.get(h)
+            if first is None:
+                self.seen[h] = p | line
+                if len(self.seen) > self.capacity:
+                    self.seen.popitem(last=False)
+            else:
+                self.seen.move_to_end(h)
+                self.extra.setdefault(self.parts[first >> 32], Counter())[first & 0xffffffff] += int(weights[line])
+                weights[line] = 0
+
+        np.save(PartFile.weights_path(part), weights)
+
+    def extra_counts(self, part):
+        """Returns the counts of the later copies of the sentences of a part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            np.ndarray, np.ndarray -- the line of each sentence and the count of its later copies
+        """
+
+        extra = self.extra.get(part, Counter())
+        return np.array(list(extra.keys()), dtype=np.int64), np.array(list(extra.values()), dtype=np.int64)
+
+    @staticmethod
+    def compact(part, lines, extra):
+        """Adds the counts of the later copies of the sentences of a part to their weights, and removes any
+        sentences whose weight is 0 from the part, its sentence offsets and its metadata.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+            lines {np.ndarray} -- the line of each sentence with later copies
+            extra {np.ndarray} -- the count of the later copies of each sentence
+        """
+
+        weights = np.load(PartFile.weights_path(part))
+        np.add.at(weights, lines, extra)
+        keep = weights > 0
+
+        if not keep.all():
+            keep_list = keep.tolist()
+            with PartFile.open(part) as f:
+                text = [line for line, k in zip(f, keep_list) if k]
+            PartFile.write(part, "".join(text))
+            SentenceIndex.index_part(part)
+
+            source_path = SentenceIndex.paths(part)[1]
+            if os.path.exists(source_path):
+                with open(source_path, 'r', encoding="UTF-8") as f:
+                    sources = [source for source, k in zip(f, keep_list) if k]
+                with open(source_path, 'w', encoding="UTF-8") as f:
+                    f.write("".join(sources))
+
+        np.save(PartFile.weights_path(part), weights[keep])
@@ -0,0 +1,225 @@
+import time
+import tqdm
+import queue
+import itertools
+from multiprocessing import Pool
+
+
+# the processing and combining functions of the executor, set once in each worker by the pool initializer
+_process = None
+_combine = None
+
+
+class Executor:
+    """This executes the processing of every chunk with the multiprocessing library and reduces their results
+    as a tree within the same pool.
+
+    The chunks are split into a few batches per process, and each worker combines the results of the chunks in
+    its batch locally, which forms the bottom of the tree without sending anything between processes. The
+    results of the batches are then folded as they arrive: whenever two partial results covering the same
+    number of chunks are waiting in the parent, they are sent back to the pool to be combined, so merging runs
+    in parallel with the processing of the remaining batches and the parent never holds more than a few partial
+    results at once.
+
+    The processing and combining functions, and with them the analyser and any resources it has loaded, are
+    handed to each worker once by the pool initializer, so that each task only sends the paths of its chunks.
+
+    Every partial result carries the chunks it covers. Given a checkpoint, the partial results waiting in the
+    parent or being merged are saved to it from time to time, and the chunks covered by a checkpoint which is
+    resumed are not processed again.
+    """
+
+    # the number of batches per process, more batches balance the load better but send more results
+    batches_per_processor = 4
+
+
+    def __init__(self, n_processors, process, combine, checkpoint=None):
+
+        self.n_processors = n_processors
+        self.process = process
+        self.combine = combine
+        self.checkpoint = checkpoint
+
+    def __enter__(self):
+
+        self.pool = Pool(self.n_processors, initializer=init_worker, initargs=(self.process, self.combine))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.pool.close()
+        else:
+            self.pool.terminate()
+        self.pool.join()
+
+    def map_reduce(self, items):
+        """Processes every item and combines the results pairwise until a single result remains.
+
+        Arguments:
+            items {list} -- the items to be processed
+
+        Returns:
+            object -- the combined result, or None if there were no items
+        """
+
+        self.ready = []
+        self.merging = {}
+        self.merge_ids = itertools.count()
+        self.merged = queue.Queue()
+
+        # start from the partial results of the checkpoint, skipping the chunks they cover
+        if self.checkpoint:
+            self.ready = self.checkpoint.load()
+            done = {chunk for chunks, _ in self.ready for chunk in chunks}
+            remaining = [item for item in items if item not in done]
+        else:
+            remaining = items
+
+        # split into batches, interleaving the items so that the batches are similar in size
+        n_batches = min(len(remaining), self.n_processors * self.batches_per_processor)
+        batches = [remaining[i::n_batches] for i in range(n_batches)]
+
+        # process batch by batch, pairing up results as they arrive
+        start = time.time()
+        with tqdm.tqdm(total=len(items), initial=len(items) - len(remaining)) as progress:
+            for chunks, result in self.pool.imap_unordered(process_batch, batches):
+                progress.update(len(chunks))
+                self.ready.append((chunks, result))
+                while not self.merged.empty():
+                    self.receive(self.merged.get())
+                self.pair(final=False)
+                if self.checkpoint and self.checkpoint.due():
+                    self.save_checkpoint()
+        processed = time.time()
+
+        # wait for the remaining merges, now pairing results of any size
+        self.pair(final=True)
+        while self.merging:
+            self.receive(self.merged.get())
+            self.pair(final=True)
+        end = time.time()
+
+        # keep the final result until it has been saved if the pass was long enough to be checkpointed
+        if self.checkpoint and self.checkpoint.written:
+            self.save_checkpoint()
+
+        print("Processed {} chunks in {:.1f}s, merge tail {:.1f}s".format(len(remaining), processed - start, end - processed))
+
+        return self.ready[0][1] if self.ready else None
+
+    def pair(self, final):
+        """Sends pairs of waiting results to the pool to be combined.
+
+        Arguments:
+            final {bool} -- whether every chunk has been processed, in which case results of any size are paired
+        """
+
+        for pair in pair_ready(self.ready, final):
+            merge_id = next(self.merge_ids)
+            self.merging[merge_id] = pair
+            (chunks_a, a), (chunks_b, b) = pair
+            self.pool.apply_async(
+                combine_pair, (a, b),
+                callback=lambda result, merge_id=merge_id, chunks=chunks_a + chunks_b: self.merged.put((merge_id, True, chunks, result)),
+                error_callback=lambda error, merge_id=merge_id: self.merged.put((merge_id, False, (), error))
+                )
+
+    def receive(self, merged):
+        """Collects the result of a completed merge.
+
+        Arguments:
+            merged {tuple[int, bool, tuple, object]} -- the merge, whether it succeeded, the chunks it covers,
+                and its result or exception
+        """
+
+        merge_id, success, chunks, result = merged
+        del self.merging[merge_id]
+        if not success:
+            raise result
+        self.ready.append((chunks, result))
+
+    def save_checkpoint(self):
+        """Saves every partial result held by the parent, including both halves of each merge in progress.
+        """
+
+        self.checkpoint.save(self.ready + [item for pair in self.merging.values() for item in pair])
+
+
+def init_worker(process, combine):
+    """Pool initializer which stores the processing and combining functions once per worker process.
+
+    Arguments:
+        process {callable} -- processes a single item
+        combine {callable} -- combines two results into one
+    """
+
+    global _process, _combine
+    _process, _combine = process, combine
+
+
+def process_batch(batch):
+    """Processes a batch of items in a worker, combining their results locally.
+
+    Arguments:
+        batch {list} -- the items to be processed
+
+    Returns:
+        tuple, object -- the items processed and their combined result
+    """
+
+    return reduce_batch(batch, _process, _combine)
+
+
+def combine_pair(a, b):
+    """Combines two partial results in a worker.
+
+    Arguments:
+        a {object} -- a partial result
+        b {object} -- a partial result
+
+    Returns:
+        object -- the combined result
+    """
+
+    return _combine(a, b)
+
+
+def pair_ready(ready, final):
+    """Takes the pairs of waiting partial results to be combined next, pairing the results covering the fewest
+    chunks first and, until every chunk has been processed, only results covering the same number of chunks.
+
+    Arguments:
+        ready {list[tuple[tuple, object]]} -- the chunks covered by each waiting result and the result, from
+            which the pairs are removed
+        final {bool} -- whether every chunk has been processed, in which case results of any size are paired
+
+    Returns:
+        list[tuple[tuple, tuple]] -- the pairs of results to be combined
+    """
+
+    ready.sort(key=lambda item: len(item[0]), reverse=True)
+    pairs = []
+    while len(ready) >= 2 and (final or len(ready[-1][0]) == len(ready[-2][0])):
+        pairs.append((ready.pop(), ready.pop()))
+
+    return pairs
+
+
+def reduce_batch(batch, process, combine):
+    """Processes a batch of items and combines their results, as each worker does locally.
+
+    Arguments:
+        batch {list} -- the items to be processed
+        process {callable} -- processes a single item
+        combine {callable} -- combines two results into one
+
+    Returns:
+        tuple, object -- the items processed and their combined result
+    """
+
+    result = process(batch[0])
+    for item in batch[1:]:
+        result = combine(result, process(item))
+
+    return tuple(batch), result
@@ -6,95 +6,215 @@ import glob
 import nltk
 import pprint
 import argparse
-import pandas as pd
 import constants as co
 from collections import Counter
 from multiprocessing import Pool
+from shutil import rmtree
+from NgramCount import NgramCount
+from SpillCount import SpillCount
+from SpaceSaving import SpaceSaving
 from AnalyserTemplate import AnalyserTemplate
 
 class Frequency(AnalyserTemplate):
     """This analysis performs a basic frequency count on words or phrases of any length.
     """
 
-    def execute(self):
-        """Executes the general collocate frequency analysis.
+    def prepare(self):
+        """Initialises the configurations of the frequency analysis.
 
-        Using the multiprocessing library, count the frequency of each word or phrase in the resource file.
+        The counting engine is selected in the configs: "counter" counts each phrase in a Counter, while
+        "numpy" counts whole chunks of the binary token corpus at once. If memory is limited, the counter
+        engine counts exactly by spilling sorted partial counts to disk instead of discarding rare phrases.
+        Alternatively, the approximate mode reduces each chunk to a fixed-size Space-Saving summary.
         """
 
         # initialise configurations
         self.task_configs = self.configs["frequency"]
         self.dest_filename = os.path.join(self.results_folder, self.task_configs["dest_filename"].split('.')[0])
 
-        # multiprocess chunk by chunk
-        with Pool(self.configs["n_processors"]) as p:
-            counts = []
-            for count in tqdm.tqdm(p.imap_unordered(self.process, self.pool), total=len(self.pool)):
-                counts.append(count)
+        # check the numpy engine has a binary corpus to work on
+        if self.task_configs["engine"] == "numpy" and self.vocab is None:
+            raise ValueError("The numpy engine requires the token_ids pre-processing option to be enabled...")
 
-        # initialise master counter
-        self.master_count = Counter()
+        # create the folder for the partial counts spilled to disk
+        if self.task_configs["limit_memory_enabled"]:
+            if self.task_configs["engine"] != "counter":
+                raise ValueError("Limiting memory is only supported by the counter engine...")
+            if self.task_configs["approximate"]:
+                raise ValueError("Limiting memory and approximate counting cannot be combined...")
+            self.spill_folder = os.path.join(self.resource_folder, "spill")
+            if not os.path.exists(self.spill_folder):
+                os.mkdir(self.spill_folder)
 
-        # merge counts from multiprocessing
-        for count in counts:
-            self.master_count += count
+    def cache_state(self):
+        """Returns the configurations which the frequency results of a chunk depend on.
 
-        self.save()
+        Returns:
+            dict -- the relevant configurations, or None if the results are spilled to disk
+        """
+
+        if self.task_configs["limit_memory_enabled"]:
+            return None
+
+        return {key: self.task_configs[key] for key in ["phrase_length", "engine", "discard_threshold", "approximate", "summary_capacity"]}
+
+    def restore(self, state):
+        """Returns the saved frequency results, with the phrases of the numpy engine packed for the current
+        vocabulary.
 
-    def process(self, file):
+        Arguments:
+            state {dict} -- the saved state
+
+        Returns:
+            Counter|NgramCount|SpaceSaving -- the saved frequency results, or None if they cannot be updated
+        """
+
+        count = super().restore(state)
+        if isinstance(count, NgramCount):
+            count = count.resize(len(self.vocab))
+
+        return count
+
+    def process_chunk(self, chunk):
         """Processes a single chunk, counting the frequency of each word.
 
         Arguments:
-            file {str} -- path to pre-processed resource file
+            chunk {iterable[list]} -- the tokenised sentences of the chunk
 
         Returns:
-            dict{str:Counter} -- frequency results
+            Counter|NgramCount|SpillCount|SpaceSaving -- frequency results
         """
 
         # get phrase length
         l = self.task_configs["phrase_length"]
 
+        # count the whole chunk at once
+        if self.task_configs["engine"] == "numpy":
+            count = NgramCount.from_chunk(chunk, l, len(self.vocab))
+            if self.task_configs["approximate"]:
+                return SpaceSaving.from_count(count, self.task_configs["summary_capacity"])
+            return count.reduce(self.task_configs["discard_threshold"])
+
         # initialise counter
         count = Counter()
 
-        # iterate over lines in chunk
-        with open(file, 'r', encoding="UTF-8") as f:
-            for line in f:
+        # count exactly, spilling to disk whenever the counter exceeds its size limit
+        if self.task_configs["limit_memory_enabled"]:
+            spill = SpillCount(self.spill_folder)
+            for line, weight in zip(chunk, chunk.sentence_weights()):
+                for group in self.generate_groups(line, l):
+                    count[group] += weight
+                if len(count) > self.task_configs["counter_size_limit"]:
+                    spill.spill(count)
+            spill.spill(count)
+            return spill
+
+        # iterate over lines in chunk, each weighted by the number of times it occurred
+        for line, weight in zip(chunk, chunk.sentence_weights()):
 
-                # generate groups and increment counter
-                for group in self.generate_groups(line.split(), l):
-                    count[group] += 1
+            # generate groups and increment counter
+            for group in self.generate_groups(line, l):
+                count[group] += weight
+
+        # summarise the most common phrases
+        if self.task_configs["approximate"]:
+            return SpaceSaving.from_count(count, self.task_configs["summary_capacity"])
 
         return self.reduce_count(count)
 
+    def empty(self):
+        """Returns the frequency results of an empty chunk.
+
+        Returns:
+            Counter|NgramCount|SpillCount|SpaceSaving -- the empty frequency results
+        """
+
+        if self.task_configs["approximate"]:
+            return SpaceSaving(self.task_configs["summary_capacity"])
+        elif self.task_configs["limit_memory_enabled"]:
+            return SpillCount(self.spill_folder)
+        elif self.task_configs["engine"] == "numpy":
+            return NgramCount.empty(self.task_configs["phrase_length"], len(self.vocab))
+        return Counter()
+
+    def combine(self, count, other):
+        """Combines the frequency results of two chunks.
+
+        Arguments:
+            count {Counter|NgramCount|SpillCount|SpaceSaving} -- frequency results, updated in place if possible
+            other {Counter|NgramCount|SpillCount|SpaceSaving} -- frequency results
+
+        Returns:
+            Counter|NgramCount|SpillCount|SpaceSaving -- the combined frequency results
+        """
+
+        # update counters in place rather than rebuilding them
+        if isinstance(count, Counter):
+            count.update(other)
+            return count
+
+        return count + other
+
     def save(self):
         """Saves the results to csv at the path specified by the configs.
         """
 
-        # create results folder
-        if not os.path.isdir(self.results_folder):
-            os.mkdir(self.results_folder)
+        # find most common phrases, which for spilled counts also tallies the total in the same pass
+        most_common = self.master_count.most_common(self.task_configs["n_most_common"])
 
-        # initialise csv writer
-        with open(self.dest_filename.format(l=self.language) + '.csv', 'w', encoding=co.OUT_ENCODING[self.language], newline='') as f:
-            writer = csv.writer(f)
+        # calculate total count
+        if isinstance(self.master_count, Counter):
+            total_count = self.total_count(self.master_count)
+        else:
+            total_count = self.master_count.total()
+
+        # build columns, tagging each phrase once
+        phrases = [self.decode(w) for w, _ in most_common]
+        tags = self.tag_words(phrases)
+        counts = [c for _, c in most_common]
+        columns = {
+            "phrase": phrases,
+            "type": [tags[w] for w in phrases],
+            "count": counts,
+            "relative_frequency": [c/total_count for c in counts]
+            }
+
+        # sampled counts are scaled up to the whole resource, with the bounds of their confidence intervals
+        if self.sampler:
+            columns["count"], columns["count_low"], columns["count_high"] = self.sampler.counts(counts)
+            columns["relative_frequency_low"], columns["relative_frequency_high"] = self.sampler.proportions(columns["relative_frequency"], [total_count] * len(counts))
+            columns = {name: columns[name] for name in ["phrase", "type", "count", "count_low", "count_high", "relative_frequency", "relative_frequency_low", "relative_frequency_high"]}
+
+        # approximate counts also record how far each count may be overestimated
+        if isinstance(self.master_count, SpaceSaving):
+            errors = [self.master_count.error(w) for w, _ in most_common]
+            columns["error_bound"] = self.sampler.counts(errors)[0] if self.sampler else errors
+
+        self.write_results(columns)
+
+        # remove partial counts spilled to disk
+        if isinstance(self.master_count, SpillCount):
+            rmtree(self.spill_folder)
+
+    def ranking(self, count):
+        """Returns the most common phrases counted so far.
 
-            # write header
-            writer.writerow(['phrase', 'type', 'count', 'relative_frequency'])
+        Arguments:
+            count {Counter|NgramCount|SpillCount|SpaceSaving} -- the combined frequency results so far
 
-            # calculate total count
-            total_count = self.total_count(self.master_count)
+        Returns:
+            list[tuple[str, int]] -- the top_n phrases of the sampling configs and their counts
+        """
 
-            # iterate through words and write to file
-            for w, c in self.master_count.most_common(self.task_configs["n_most_common"]):    
-                writer.writerow([w, nltk.pos_tag([w])[0][1], c, c/total_count])
+        return [(self.decode(w), c) for w, c in count.most_common(self.configs["sampling"]["top_n"])]
 
     def reduce_count(self, cnt):
         """Returns the count, keeping only values whose count exceeds the threshold.
         
         To limit memory usage, some of the least frequently occuring words must be discarded.
         After each chunk has finished processing, this function is called to filter out any very
-        low frequency words.
+        low frequency words. This makes the results approximate, as phrases which are rare in every
+        chunk can still be frequent overall, so enabling limit_memory_enabled counts exactly instead.
 
         Arguments:
             cnt {Counter} --  The full count
@@ -121,13 +241,13 @@ class Frequency(AnalyserTemplate):
             "brown fox"
 
         Arguments:
-            line {list[str]} -- the pre-processed, untagged sentence
+            line {list[str]|list[int]} -- the pre-processed, untagged sentence
 
         Yields:
-            str -- the word or phrase
+            str|int|tuple[int] -- the word or phrase, as counted by make_key
         """
 
         # create phrases of l words from sentence string
-        for i in range(len(line)-l):
-            s = ' '.join(line[i:i+l])
+        for i in range(len(line)-l+1):
+            s = self.make_key(line[i:i+l])
             yield s
@@ -0,0 +1,189 @@
+from Frequency import Frequency
+
+
+class FusedAnalyser:
+    """This executes several analyses of the same resource in a single pass over the corpus. Each chunk is read
+    and tokenised once and then processed by every analysis, after which each analysis combines and saves its own
+    results exactly as it would if executed alone.
+
+    Analyses which use the frequency results can only start once the frequency analysis has been saved, so if
+    the frequency analysis is among those selected, they are executed in a second pass.
+    """
+
+    def __init__(self, analysers):
+
+        self.analysers = analysers
+
+    def execute(self):
+        """Executes the analyses, pass by pass.
+        """
+
+        for stage in self.stages():
+            self.execute_stage(stage)
+
+    def stages(self):
+        """Groups the analyses into the passes required to satisfy their dependency on the frequency results.
+
+        Returns:
+            list[list[AnalyserTemplate]] -- the analyses of each pass
+        """
+
+        if not any(isinstance(analyser, Frequency) for analyser in self.analysers):
+            return [self.analysers]
+
+        first = [analyser for analyser in self.analysers if not analyser.uses_frequency]
+        second = [analyser for analyser in self.analysers if analyser.uses_frequency]
+        return [stage for stage in [first, second] if stage]
+
+    def execute_stage(self, stage):
+        """Executes a single pass over the corpus for the analyses specified.
+
+        Arguments:
+            stage {list[AnalyserTemplate]} -- the analyses to be executed
+        """
+
+        # initialise configurations and load additional resources
+        self.prepare_stage(stage)
+
+        # multiprocess chunk by chunk, where every analysis of the pass shares the sample of the first
+        checkpoint = stage[0].checkpoint(stage)
+        with stage[0].executor(self.process, self.combine, checkpoint) as executor:
+            if stage[0].sampler:
+                counts = stage[0].sampler.map_reduce(executor, self.combine, self.ranking)
+                for analyser in stage:
+                    analyser.sampler = stage[0].sampler
+            else:
+                counts = executor.map_reduce(stage[0].pool)
+
+        # save the results of each analysis
+        self.save_stage(counts)
+
+        if checkpoint:
+            checkpoint.remove()
+
+    def ingest(self, filename):
+        """Adds new sentences to the resource and updates the saved results of every analysis with them, pass by
+        pass, processing only the parts which the saved results do not cover.
+
+        Arguments:
+            filename {str} -- path to the file of new sentences, or "-" to read them from stdin
+        """
+
+        self.analysers[0].append_parts(filename)
+        for analyser in self.analysers[1:]:
+            analyser.load_resource()
+
+        for stage in self.stages():
+            self.ingest_stage(stage)
+
+    def ingest_stage(self, stage):
+        """Combines the saved results of the analyses of a pass with the results of the parts they do not cover
+        and saves them. Analyses which cover the same parts are processed together in a single pass over them.
+
+        Arguments:
+            stage {list[AnalyserTemplate]} -- the analyses to be updated
+        """
+
+        # initialise configurations and load additional resources
+        self.prepare_stage(stage)
+
+        # restore the saved results of each analysis, grouping the analyses by the parts they do not cover
+        groups = {}
+        for analyser in stage:
+            state = analyser.load_state()
+            if state is None:
+                print("Skipping {}, which has no saved results, enable save_state and execute it in full first...".format(type(analyser).__name__))
+                continue
+            parts = analyser.unprocessed_parts(state)
+            count = analyser.restore(state) if parts is not None else None
+            if count is None:
+                print("Skipping {}, whose saved results cannot be updated, execute it in full first...".format(type(analyser).__name__))
+                continue
+            groups.setdefault(tuple(parts), []).append((analyser, count))
+
+        # process the new parts and add their results to the saved results
+        for parts, group in groups.items():
+            self.stage = [analyser for analyser, _ in group]
+            counts = [count for _, count in group]
+            if parts:
+                with self.stage[0].executor(self.process, self.combine) as executor:
+                    counts = self.combine(counts, executor.map_reduce(list(parts)))
+            self.save_stage(counts, always_save_state=True)
+
+    def prepare_stage(self, stage):
+        """Initialises the configurations and loads the additional resources of every analysis of a pass.
+
+        Arguments:
+            stage {list[AnalyserTemplate]} -- the analyses of the pass
+        """
+
+        self.stage = stage
+        for analyser in stage:
+            analyser.prepare()
+
+    def save_stage(self, counts, always_save_state=False):
+        """Saves the results of every analysis of the current pass.
+
+        Arguments:
+            counts {list[object]} -- the combined results of each analysis, or None if there were no chunks
+            always_save_state {bool} -- whether to keep the combined results for later ingests even if save_state
+                is disabled (default: {False})
+        """
+
+        # keep the cache within its size limit
+        if self.stage[0].cache:
+            self.stage[0].cache.evict()
+
+        # save the results of each analysis, keeping its combined results for later ingests
+        for i, analyser in enumerate(self.stage):
+            analyser.master_count = counts[i] if counts is not None else analyser.empty()
+            analyser.save_state(always_save_state)
+            analyser.save()
+
+    def process(self, file):
+        """Reads a single chunk once and processes it with every analysis of the current pass whose results
+        are not already cached.
+
+        Arguments:
+            file {str} -- path to pre-processed resource file
+
+        Returns:
+            list[object] -- the results of the chunk for each analysis
+        """
+
+        results = [analyser.load_cached(file) for analyser in self.stage]
+        if any(result is None for result in results):
+            chunk = self.stage[0].read_chunk(file)
+            for i, analyser in enumerate(self.stage):
+                if results[i] is None:
+                    results[i] = analyser.process_chunk(chunk)
+                    analyser.store_cached(file, results[i])
+
+        return results
+
+    def ranking(self, counts):
+        """Returns the top of the ranking of every analysis of the current pass which ranks its results.
+
+        Arguments:
+            counts {list[object]} -- the combined results of each analysis so far
+
+        Returns:
+            list[tuple] -- the top (key, count) pairs of each ranked analysis in turn, or None if none are ranked
+        """
+
+        rankings = [analyser.ranking(count) for analyser, count in zip(self.stage, counts)]
+        rankings = [ranking for ranking in rankings if ranking is not None]
+        return [pair for ranking in rankings for pair in ranking] if rankings else None
+
+    def combine(self, counts, others):
+        """Combines the results of two chunks for every analysis of the current pass.
+
+        Arguments:
+            counts {list[object]} -- the results of each analysis
+            others {list[object]} -- the results of each analysis
+
+        Returns:
+            list[object] -- the combined results of each analysis
+        """
+
+        return [analyser.combine(count, other) for analyser, count, other in zip(self.stage, counts, others)]
@@ -6,10 +6,13 @@ import glob
 import nltk
 import pprint
 import argparse
-import pandas as pd
+import numpy as np
 import constants as co
 from collections import Counter
 from multiprocessing import Pool
+from CollocateCount import CollocateCount
+from CollocateMatrix import CollocateMatrix
+from Association import Association
 from AnalyserTemplate import AnalyserTemplate
 
 class GeneralCollocate(AnalyserTemplate):
@@ -19,12 +22,18 @@ class GeneralCollocate(AnalyserTemplate):
 
     """
     
-    def execute(self):
-        """Executes the general collocate frequency analysis.
+    # the headwords are the most frequent words found by the frequency analysis
+    uses_frequency = True
 
-        Using the multiprocessing library, count the frequency of word or phrase appearing before or after any of
-        the 1000 most frequently occuring words in the resource. Calculate their relative frequencies and return the
-        collocates with the highest relative frequency.
+    def prepare(self):
+        """Initialises the configurations and loads the frequency data of the general collocate analysis.
+
+        The frequency of words or phrases appearing before or after any of the most frequently occuring
+        words in the resource are counted, and the collocates with the highest relative frequency are saved.
+
+        The counting engine is selected in the configs: "counter" counts the collocates of each headword in a
+        Counter, while "matrix" requires the binary token corpus and counts whole chunks at once into a sparse
+        co-occurrence matrix with a row per headword.
         """
 
         # initialise configurations
@@ -33,122 +42,185 @@ class GeneralCollocate(AnalyserTemplate):
         self.n = self.task_configs["n"]
 
         # load additional resources
-        self.freq = self.load_word_freq(os.path.join(self.resource_folder, self.task_configs["frequency_filename"].format(l=self.language)))
-        self.words = list(self.freq[1].keys())
-
-        # multiprocess chunk by chunk
-        with Pool(self.configs["n_processors"]) as p:
-            counts = []
-            for count in tqdm.tqdm(p.imap_unordered(self.process, self.pool), total=len(self.pool)):
-                counts.append(count)
-
-        # initialise master count 
-        self.master_count = {word: Counter() for word in self.words}
-
-        # re-merge counters from multiprocessing
-        for count in counts:
-            for word in self.master_count:
-                self.master_count[word] += count[word]
-
-        self.save()
-
-    def process(self, file):
+        self.freq = self.load_word_freq(self.find_word_freq(self.task_configs["frequency_filename"]))
+        # each headword has a single row of results, so any repeated or blank word is only counted once
+        self.words = [self.encode(word) for word in self.freq[1].keys() if word]
+        self.words = list(dict.fromkeys(word for word in self.words if word is not None))[:self.task_configs["n_headwords"]]
+
+        # check the matrix engine has a binary corpus to work on, and is not asked to summarise
+        if self.task_configs["engine"] == "matrix" and self.task_configs["approximate"]:
+            raise ValueError("Approximate collocate counts require the counter engine...")
+        if self.task_configs["engine"] == "matrix":
+            if self.vocab is None:
+                raise ValueError("The matrix engine requires the token_ids pre-processing option to be enabled...")
+            self.rows = CollocateMatrix.row_index(self.words, len(self.vocab))
+
+    def process_chunk(self, chunk):
         """Processes a single chunk, counting the frequency of the collocates.
 
         Arguments:
-            file {str} -- path to pre-processed resource file
+            chunk {iterable[list]} -- the tokenised sentences of the chunk
 
         Returns:
-            dict{str:Counter} -- collocate frequency results
+            CollocateCount|CollocateMatrix -- collocate frequency results
         """
 
+        # count the whole chunk at once
+        if self.task_configs["engine"] == "matrix":
+            return CollocateMatrix.from_chunk(chunk, self.rows, len(self.vocab))
+
         # initialise counter
-        count = {word: Counter() for word in self.words}
+        count = CollocateCount(self.words)
+        words = set(self.words)
 
         # iterate over lines in chunk
-        with open(file, encoding='UTF-8') as f:
-            for line in f:
+        for line, weight in zip(chunk, chunk.sentence_weights()):
+
+            # process line
+            count = self.process_line(count, line, words, weight)
 
-                # process line
-                count = self.process_line(count, line, self.words)
+        # summarise the most common collocates of each word
+        if self.task_configs["approximate"]:
+            count.summarise(self.task_configs["summary_capacity"])
 
-        # print([count[key].most_common(5) for key in count])
         return count
 
-    def save(self):
-        """Saves the results to csv at the path specified by the configs.
+    def cache_state(self):
+        """Returns the resources which the collocate frequency results of a chunk depend on.
+
+        Returns:
+            dict -- the words whose collocates are counted, the counting engine and how they are summarised
         """
 
-        print("Adding words to dataframe...")
-        
-        # initialise dataframe
-        df = pd.DataFrame(columns=["word", "collocate", "count", "relative_frequency"])
+        return {
+            "words": self.words,
+            "engine": self.task_configs["engine"],
+            "approximate": self.task_configs["approximate"],
+            "summary_capacity": self.task_configs["summary_capacity"]
+            }
 
-        # iterate over words of interest and their collocate counts
-        for word, count in tqdm.tqdm(self.master_count.items(), total=1000):
+    def restore(self, state):
+        """Returns the saved collocate frequency results, counting the collocates of new chunks for the same
+        headwords as the saved results rather than those of the latest frequency results.
 
-            # iterate over most common collocates
-            for collocate, c in count.most_common(100):
+        Arguments:
+            state {dict} -- the saved state
 
-                # calculate relative frequency
-                try:
-                    rf = c/self.freq[1][word]
-                
-                # set relative frequency to 0 if not found in frequency analysis
-                except KeyError:
-                    rf = 0
-                
-                # add line to df
-                df = df.append(pd.Series([word, collocate, c, rf], index=df.columns), ignore_index=True)
+        Returns:
+            CollocateCount|CollocateMatrix -- the saved collocate frequency results, or None if they cannot be
+                updated
+        """
 
-        print("Sorting dataframe and saving to csv...")
+        self.words = state["state"]["words"]
+        if self.task_configs["engine"] == "matrix":
+            self.rows = CollocateMatrix.row_index(self.words, len(self.vocab))
 
-        # enrich with word types
-        df["word_type"] = df["word"].apply(lambda w: self.tag(w))
-        df["collocate_type"] = df["collocate"].apply(lambda w: self.tag(w))
+        count = super().restore(state)
+        if isinstance(count, CollocateMatrix):
+            count = count.resize(len(self.vocab))
+
+        return count
 
-        # create results folder
-        if not os.path.isdir(self.results_folder):
-            os.mkdir(self.results_folder)
+    def empty(self):
+        """Returns the collocate frequency results of an empty chunk.
+
+        Returns:
+            CollocateCount|CollocateMatrix -- the empty collocate frequency results
+        """
 
-        # order by relative frequency and save to csv
-        df = df.sort_values(by="relative_frequency", ascending=False)
-        df.to_csv(self.dest_filename.format(l=self.language) + '.csv', ',', index=False, encoding=co.OUT_ENCODING[self.language])
+        if self.task_configs["engine"] == "matrix":
+            return CollocateMatrix.empty(len(self.vocab))
+        return CollocateCount(self.words)
 
-    @staticmethod
-    def tag(word):
-        """Return the PoS tag for the word specified. Returns "N/A" for any words not recognised.
+    def combine(self, count, other):
+        """Combines the collocate frequency results of two chunks.
 
         Arguments:
-            word {str} -- the word to be tagged
+            count {CollocateCount|CollocateMatrix} -- collocate frequency results, updated in place if possible
+            other {CollocateCount|CollocateMatrix} -- collocate frequency results
 
         Returns:
-            str -- the abbreviated part of speech tag
+            CollocateCount|CollocateMatrix -- the combined collocate frequency results
         """
-        try:
-            tag = nltk.pos_tag([word])[0][1]
-        except IndexError:
-            tag = "N/A"
 
-        return tag
+        if isinstance(count, CollocateMatrix):
+            return count + other
+        return count.update(other)
 
+    def save(self):
+        """Saves the results to csv at the path specified by the configs.
+
+        Every measure is computed over every (word, collocate) pair at once, after which the top_k collocates
+        of each word are selected by the score specified in the configs. The rows are ordered by that score, or
+        by relative frequency when ranking by count.
+        """
 
-    @staticmethod
-    def process_line(count, line, words):
+        print("Scoring collocates...")
+
+        # gather every pair as arrays
+        rows, cols, counts, keys = self.master_count.arrays()
+        words = [self.decode(word) for word in self.words]
+
+        # relative frequency measures the collocate count against the frequency of the word alone, or is 0 if
+        # the word was not found in the frequency analysis
+        word_freq = np.array([self.freq[1].get(word, 0) for word in words], dtype=np.float64)[rows]
+        scores = Association.scores(rows, cols, counts)
+        scores["count"] = counts
+        scores["relative_frequency"] = np.divide(counts, word_freq, out=np.zeros(len(counts)), where=word_freq > 0)
+
+        # sampled counts are scaled up to the whole resource, with the bounds of their confidence intervals,
+        # while the association measures are those of the sample
+        measures = Association.measures
+        if self.sampler:
+            scores["count"], scores["count_low"], scores["count_high"] = self.sampler.counts(counts)
+            scores["relative_frequency"], scores["relative_frequency_low"], scores["relative_frequency_high"] = self.sampler.ratios(counts, word_freq)
+            measures = ["count", "count_low", "count_high", "relative_frequency", "relative_frequency_low", "relative_frequency_high"] + measures[2:]
+
+        # select the top collocates of each word
+        score = self.task_configs["score"]
+        if score not in Association.measures:
+            raise ValueError("Unknown score, choose from {}...".format(", ".join(Association.measures)))
+        top = Association.top_k(rows, scores[score].astype(np.float64), self.task_configs["top_k"])
+
+        # order by score
+        by = scores["relative_frequency" if score == "count" else score][top]
+        top = top[np.argsort(-by, kind="stable")]
+
+        print("Saving to csv...")
+
+        # build columns from the selected pairs, tagging each distinct word once
+        word_column = [words[r] for r in rows[top].tolist()]
+        collocate_column = [self.decode(keys[c]) for c in cols[top].tolist()]
+        tags = self.tag_words(word_column + collocate_column)
+        columns = {"word": word_column, "collocate": collocate_column}
+        columns.update({measure: scores[measure][top] for measure in measures})
+        columns["word_type"] = [tags[w] for w in word_column]
+        columns["collocate_type"] = [tags[w] for w in collocate_column]
+
+        # approximate counts also record how far each count may be overestimated
+        if isinstance(self.master_count, CollocateCount) and self.master_count.capacity is not None:
+            errors = [self.master_count.error(self.words[r], keys[c]) for r, c in zip(rows[top].tolist(), cols[top].tolist())]
+            columns["error_bound"] = self.sampler.counts(errors)[0] if self.sampler else errors
+            print("The top {} collocates by count are guaranteed for {} of {} words...".format(
+                self.task_configs["top_k"], self.master_count.guaranteed(self.task_configs["top_k"]), len(self.words)))
+
+        self.write_results(columns)
+
+    def process_line(self, count, line, words, weight=1):
         """Processes a single line and updates the frequency count with any matched collocates.
 
+        The collocates are the one or two words immediately before or after each word of interest, within
+        the sentence.
+
         Arguments:
-            count {Counter} -- frequency count
-            line {str} -- the sentence to be analysed
-            words {list[str]} -- words of interest
-            n {int} -- number of words before or after word of interest
+            count {CollocateCount} -- frequency count
+            line {list[str]|list[int]} -- the tokenised sentence to be analysed
+            words {set[str]} -- words of interest
+            weight {int} -- the number of times the sentence occurred (default: {1})
 
         Returns:
-            Counter -- updated frequency count
+            CollocateCount -- updated frequency count
         """
-        
-        # get word list from string
-        line = line.split()
 
         # iterate over words in sentence
         for i, word in enumerate(line):
@@ -158,26 +230,12 @@ class GeneralCollocate(AnalyserTemplate):
 
                 for n in [-2, -1, 1, 2]:
 
-                    # do forwards and backwards index logic
-                    neg = n if n < 0 else 1
-                    pos = n + 1 if n > 0 else 0
-
-                    try:
-
-                        # catch outside range limits
-                        if i-neg < 0: 
-                            raise IndexError()
-                        elif i+pos > len(line)-1:
-                            raise IndexError()
-                        
-                        # generate phrase
-                        phrase_list = line[i+neg:i+pos]
-                        phrase = " ".join(phrase_list)
-                        
-                        # increment counter
-                        count[word][phrase] += 1
-
-                    except IndexError:
-                        pass
+                    # find the phrase of n words before or after, skipping any which overrun the sentence
+                    start, end = (i + n, i) if n < 0 else (i + 1, i + n + 1)
+                    if start < 0 or end > len(line):
+                        continue
+
+                    # increment counter
+                    count[word][self.make_key(line[start:end])] += weight
 
         return count
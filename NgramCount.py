@@ -0,0 +1,216 @@
+import numpy as np
+
+
+class NgramCount:
+    """An array-backed count of phrases of token IDs, used by the numpy frequency engine.
+
+    Each phrase of l consecutive token IDs is packed into a single unsigned 64 bit key, using just enough bits
+    per token to hold the largest ID in the vocabulary. Counting a chunk is then a single sort of the keys,
+    and merging two counts is a concatenation followed by another sort. Phrases too long to fit into 64 bits
+    are kept as rows of token IDs instead.
+    """
+
+    def __init__(self, keys, counts, l, bits):
+
+        self.keys = keys
+        self.counts = counts
+        self.l = l
+        self.bits = bits
+
+    @classmethod
+    def empty(cls, l, vocab_size):
+        """Returns a count containing no phrases.
+
+        Arguments:
+            l {int} -- the phrase length
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            NgramCount -- the empty count
+        """
+
+        bits = cls.key_bits(vocab_size)
+        shape = (0,) if bits * l <= 64 else (0, l)
+        return cls(np.zeros(shape, dtype=np.uint64), np.zeros(0, dtype=np.int64), l, bits)
+
+    @classmethod
+    def from_chunk(cls, chunk, l, vocab_size):
+        """Counts every phrase of l consecutive tokens which is fully contained within a sentence of the chunk,
+        weighting each by the weight of its sentence.
+
+        Arguments:
+            chunk {TokenChunk} -- the memory-mapped tokens and sentence offsets
+            l {int} -- the phrase length
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            NgramCount -- the count of each phrase in the chunk
+        """
+
+        tokens = np.asarray(chunk.tokens, dtype=np.uint64)
+        offsets = np.asarray(chunk.offsets, dtype=np.int64)
+
+        # a phrase may start at any position whose sentence does not end within the next l tokens
+        sentence_end = np.repeat(offsets[1:], np.diff(offsets))
+        starts = np.flatnonzero(np.arange(len(tokens)) + l <= sentence_end)
+        weights = chunk.token_weights()
+
+        return cls.from_columns([tokens[starts + k] for k in range(l)], vocab_size, weights[starts] if weights is not None else None)
+
+    @classmethod
+    def from_columns(cls, columns, vocab_size, weights=None):
+        """Counts phrases given as columns of token IDs, where the k-th array holds the k-th token of every phrase.
+
+        Arguments:
+            columns {list[np.ndarray]} -- the token IDs of each position in the phrases
+            vocab_size {int} -- the number of distinct token IDs
+            weights {np.ndarray} -- the weight of each phrase (default: {1 for every phrase})
+
+        Returns:
+            NgramCount -- the count of each phrase
+        """
+
+        # pack the tokens of each phrase into a single key
+        l = len(columns)
+        bits = cls.key_bits(vocab_size)
+        columns = [np.asarray(column, dtype=np.uint64) for column in columns]
+        if bits * l <= 64:
+            keys = np.zeros(len(columns[0]), dtype=np.uint64)
+            for column in columns:
+                keys = (keys << np.uint64(bits)) | column
+        else:
+            keys = np.stack(columns, axis=1)
+
+        keys, counts = cls.unique(keys, weights if weights is not None else np.ones(len(keys), dtype=np.int64))
+        return cls(keys, counts, l, bits)
+
+    @staticmethod
+    def key_bits(vocab_size):
+        """Returns the number of bits required to hold any token ID.
+
+        Arguments:
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            int -- the number of bits per token
+        """
+
+        return max(1, int(vocab_size - 1).bit_length())
+
+    def resize(self, vocab_size):
+        """Returns the count with its keys packed for a larger vocabulary, such as one which new words have been
+        appended to.
+
+        Arguments:
+            vocab_size {int} -- the number of distinct token IDs
+
+        Returns:
+            NgramCount -- the same count, repacked if the vocabulary needs more bits per token
+        """
+
+        if self.key_bits(vocab_size) == self.bits:
+            return self
+        if not len(self.counts):
+            return self.empty(self.l, vocab_size)
+
+        return self.from_columns(self.columns(), vocab_size, self.counts)
+
+    @staticmethod
+    def unique(keys, counts):
+        """Sorts the keys and sums the counts of any duplicates.
+
+        Arguments:
+            keys {np.ndarray} -- packed phrase keys, or rows of token IDs
+            counts {np.ndarray} -- count of each key
+
+        Returns:
+            np.ndarray, np.ndarray -- the sorted unique keys and their summed counts
+        """
+
+        axis = 0 if keys.ndim > 1 else None
+        keys, inverse = np.unique(keys, return_inverse=True, axis=axis)
+        counts = np.bincount(inverse.reshape(-1), weights=counts, minlength=len(keys)).astype(np.int64)
+        return keys, counts
+
+    def __add__(self, other):
+
+        if not isinstance(other, NgramCount):
+            return NotImplemented
+
+        keys, counts = self.unique(np.concatenate([self.keys, other.keys]), np.concatenate([self.counts, other.counts]))
+        return NgramCount(keys, counts, self.l, self.bits)
+
+    def __len__(self):
+
+        return len(self.counts)
+
+    def reduce(self, thresh):
+        """Returns the count, keeping only the phrases whose count exceeds the threshold.
+
+        Arguments:
+            thresh {int} -- the discard threshold
+
+        Returns:
+            NgramCount -- only the phrases whose count was over the threshold
+        """
+
+        mask = self.counts > thresh
+        return NgramCount(self.keys[mask], self.counts[mask], self.l, self.bits)
+
+    def total(self):
+        """Returns the sum of all the counts.
+
+        Returns:
+            int -- the total count
+        """
+
+        return int(self.counts.sum())
+
+    def most_common(self, n):
+        """Returns the n most common phrases, unpacked to the keys used by the counter engine.
+
+        Arguments:
+            n {int} -- the number of phrases
+
+        Returns:
+            list[tuple] -- (key, count) pairs, ordered by descending count
+        """
+
+        # partially sort to find the top n, then fully sort only those
+        n = min(n, len(self.counts))
+        top = np.argpartition(-self.counts, n - 1)[:n] if n else np.array([], dtype=np.int64)
+        top = top[np.lexsort((top, -self.counts[top]))]
+
+        return [(self.unpack(self.keys[i]), int(self.counts[i])) for i in top]
+
+    def columns(self):
+        """Unpacks every phrase key into its token IDs.
+
+        Returns:
+            list[np.ndarray] -- the token IDs of each position in the phrases
+        """
+
+        if self.keys.ndim > 1:
+            return [self.keys[:, k].astype(np.int64) for k in range(self.l)]
+
+        mask = np.uint64((1 << self.bits) - 1)
+        return [((self.keys >> np.uint64(self.bits * (self.l - 1 - k))) & mask).astype(np.int64) for k in range(self.l)]
+
+    def unpack(self, key):
+        """Unpacks a phrase key into its token IDs.
+
+        Arguments:
+            key {np.uint64|np.ndarray} -- the packed key, or the row of token IDs
+
+        Returns:
+            int|tuple[int] -- the token ID of a single word, or the token IDs of a phrase
+        """
+
+        if np.ndim(key):
+            tokens = [int(t) for t in key]
+        else:
+            key = int(key)
+            mask = (1 << self.bits) - 1
+            tokens = [(key >> (self.bits * (self.l - 1 - k))) & mask for k in range(self.l)]
+
+        return tokens[0] if self.l == 1 else tuple(tokens)
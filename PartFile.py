@@ -0,0 +1,108 @@
+import os
+import gzip
+import numpy as np
+
+
+class PartFile:
+    """This reads and writes the text files of the pre-processed parts, which are either plain text or, to save
+    disk space, compressed with gzip. Every reader of a part opens it through here, so a compressed part is
+    read back exactly like a plain one. If the resource was de-duplicated, each part is also stored with the
+    number of times each of its sentences occurred.
+    """
+
+    # the compression level of compressed parts, favouring speed as the parts are written by every worker
+    compress_level = 1
+
+    @staticmethod
+    def stem(part):
+        """Returns the path of a part without its extensions, to which the extensions of its other files are
+        added.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            str -- the path without the .txt or .txt.gz extension
+        """
+
+        if part.endswith(".gz"):
+            part = part[:-len(".gz")]
+        return os.path.splitext(part)[0]
+
+    @staticmethod
+    def open(part):
+        """Opens a part to be read as text.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            file -- the text file
+        """
+
+        if part.endswith(".gz"):
+            return gzip.open(part, 'rt', encoding="UTF-8")
+        return open(part, 'r', encoding="UTF-8")
+
+    @staticmethod
+    def read_bytes(part):
+        """Reads the whole of a part as UTF-8 encoded bytes.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            bytes -- the content of the part
+        """
+
+        if part.endswith(".gz"):
+            with gzip.open(part, 'rb') as f:
+                return f.read()
+        with open(part, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def write(part, text):
+        """Writes a part, compressing it if its path ends with .gz. The time is left out of the gzip header so
+        that the same text always gives the same file.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+            text {str} -- the content of the part
+        """
+
+        if part.endswith(".gz"):
+            with open(part, 'wb') as f, gzip.GzipFile("", 'wb', PartFile.compress_level, f, mtime=0) as gz:
+                gz.write(text.encode("UTF-8"))
+        else:
+            with open(part, 'w', encoding="UTF-8") as f:
+                f.write(text)
+
+    @staticmethod
+    def weights_path(part):
+        """Returns the path of the sentence multiplicities of a de-duplicated part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            str -- path to the weight array
+        """
+
+        return PartFile.stem(part) + ".weights.npy"
+
+    @staticmethod
+    def load_weights(part):
+        """Loads the number of times each sentence of a de-duplicated part occurred in the resource.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            np.ndarray -- the multiplicity of each sentence, or None if the part was not de-duplicated
+        """
+
+        path = PartFile.weights_path(part)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
@@ -6,10 +6,13 @@ import glob
 import nltk
 import pprint
 import argparse
-import pandas as pd
+import numpy as np
 import constants as co
 from collections import Counter
 from multiprocessing import Pool
+from PoSTagger import PoSTagger
+from TokenCorpus import TokenCorpus
+from TaggedCorpus import TaggedCorpus
 from AnalyserTemplate import AnalyserTemplate
 
 class PoSFrequency(AnalyserTemplate):
@@ -20,39 +23,49 @@ class PoSFrequency(AnalyserTemplate):
 
     """
 
-    def execute(self):
-        """Executes the part of speech frequency analysis.
-
-        Using the multiprocessing library, count the frequency of the parts of speech 
-        of pairs of consecutive words and save the results to CSV.
+    def prepare(self):
+        """Initialises the configurations of the part of speech frequency analysis.
         """
 
         # initialise configurations
         self.task_configs = self.configs["pos_frequency"]
         self.dest_filename = os.path.join(self.results_folder, self.task_configs["dest_filename"].split('.')[0])
 
-        # create results folder
-        if not os.path.isdir(self.results_folder):
-            os.mkdir(self.results_folder)
+    def cache_state(self):
+        """Returns the configurations which the part of speech frequency results of a chunk depend on.
 
-        # multiprocess chunk by chunk
-        with Pool(self.configs["n_processors"]) as p:
-            counts = []
-            for count in tqdm.tqdm(p.imap_unordered(self.process, self.pool), total=len(self.pool)):
-                counts.append(count)
+        Returns:
+            dict -- the tagger model
+        """
 
-        # initialise master count 
-        self.master_count = {word: Counter() for word in co.POS_TAGS}
+        return {"tagger": PoSTagger.fingerprint()}
 
-        # re-merge counters from multiprocessing
-        for count in counts:
-            for word in self.master_count:
-                self.master_count[word] += count[word]
+    def empty(self):
+        """Returns the part of speech frequency results of an empty chunk.
 
+        Returns:
+            np.ndarray, Counter -- the empty tag pair counts and tagging statistics
+        """
 
-        self.save()
+        return np.zeros((len(co.POS_TAGS), len(co.POS_TAGS) + 1), dtype=np.int64), Counter()
 
-    def process(self, file):
+    def combine(self, count, other):
+        """Combines the part of speech frequency results of two chunks.
+
+        Arguments:
+            count {tuple[np.ndarray, Counter]} -- part of speech frequency results, updated in place
+            other {tuple[np.ndarray, Counter]} -- part of speech frequency results
+
+        Returns:
+            np.ndarray, Counter -- the combined tag pair counts and tagging statistics
+        """
+
+        count[0][...] += other[0]
+        count[1].update(other[1])
+
+        return count
+
+    def process_chunk(self, chunk):
         """Processes a single chunk, counting the frequency of part of speech pairs.
 
         Iterating on each pair of consecutive words, record the frequency of the PoS tags.
@@ -62,65 +75,120 @@ class PoSFrequency(AnalyserTemplate):
             1 * JJ > JJ
             1 * JJ > NN 
 
+        When the tagged corpus is enabled, the stored tags of the chunk are counted without calling the tagger.
+        Otherwise, sentences are tagged in batches, and the tags of repeated sentences are memoised by the tagger
+        of each process.
+
         Arguments:
-            file {str} -- path to pre-processed resource file
+            chunk {TokenChunk|TextChunk} -- the tokenised sentences of the chunk
 
         Returns:
-            dict{str:Counter} -- part of speech frequency results
+            np.ndarray, Counter -- tag pair counts and tagging statistics
         """
 
-        # initialise counter
-        count = {tag: Counter() for tag in co.POS_TAGS}
+        # count the stored tags
+        if self.lexicon is not None:
+            tags, offsets, tagset = TaggedCorpus.load_part(chunk.path)
+            weights = chunk.sentence_weights() if chunk.weights is not None else None
+            return self.count_pairs(self.tag_ids(tagset)[tags], offsets, weights), Counter()
+
+        vocabulary = TokenCorpus(self.pre_processed_folder, self.language).vocab_path if self.vocab is not None else None
+        tagger = PoSTagger.instance(self.task_configs["tag_cache_size"], vocabulary)
+        hits, misses = tagger.hits, tagger.misses
+        decode = self.decode_tokens if self.vocab is not None else None
+
+        # sentences of fewer than two words have no pairs
+        sentences, weights = [], []
+        for line, weight in zip(chunk, chunk.sentence_weights()):
+            if len(line) > 1:
+                sentences.append(line)
+                weights.append(weight)
+
+        # tag batch by batch, numbering the tags by their index in constants.POS_TAGS
+        n_tags = len(co.POS_TAGS)
+        tags = []
+        offsets = [0]
+        for sentence_tags in tagger.tag_chunk(sentences, self.task_configs["batch_size"], decode):
+            tags.extend(co.POS_TAG_INDEX.get(tag, n_tags) for tag in sentence_tags)
+            offsets.append(len(tags))
+
+        count = self.count_pairs(
+            np.array(tags, dtype=np.int64), np.array(offsets, dtype=np.int64),
+            weights if chunk.weights is not None else None
+            )
+
+        return count, Counter({"hits": tagger.hits - hits, "misses": tagger.misses - misses})
+
+    @staticmethod
+    def tag_ids(tagset):
+        """Returns the index in constants.POS_TAGS of every tag of a tagged part.
 
-        # iterate over lines in chunk
-        with open(file, 'r', encoding=self.configs["encoding"][self.language]) as f:
-            for line in f:
-
-                # generate groups and increment counter
-                for first, second in self.generate_groups(line.split()):
-                    try:
-                        count[first][second] += 1
-                    except KeyError:
-                        pass
-        return count
+        Arguments:
+            tagset {list[str]} -- every tag of the part in ID order
 
-    def save(self):
-        """Saves the results to csv at the path specified by the configs.
+        Returns:
+            np.ndarray -- the index of each tag, or len(POS_TAGS) for tags which are not in POS_TAGS
         """
 
-        # create results folder
-        if not os.path.isdir(self.results_folder):
-            os.mkdir(self.results_folder)
-        
-        # initialise csv writer
-        with open(self.dest_filename.format(l=self.language) + '.csv', 'w', encoding=co.OUT_ENCODING[self.language], newline='') as f:
-            writer = csv.writer(f)
+        return np.array([co.POS_TAG_INDEX.get(tag, len(co.POS_TAGS)) for tag in tagset], dtype=np.int64)
 
-            # write header
-            writer.writerow(["PoS"] + list(self.master_count.keys()))
+    @staticmethod
+    def count_pairs(tags, offsets, weights=None):
+        """Counts every pair of consecutive tags within the same sentence.
 
-            # iterate through words and write to file
-            for first, count in self.master_count.items():    
-                total_count = max(self.total_count(count), 1)
-                writer.writerow([first] + [count[second]/total_count for second in self.master_count.keys()])
+        The pairs are counted in an array indexed by constants.POS_TAGS. Pairs whose first tag is not in
+        POS_TAGS, such as punctuation, are left out, while pairs whose second tag is not are counted in an
+        extra final column, so that they still count towards the total of the first tag.
 
-    def generate_groups(self, line):
-        """Generates every pair of consecutive words in a line.
+        Arguments:
+            tags {np.ndarray} -- the index in POS_TAGS of the tag of every token, or len(POS_TAGS) if not in it
+            offsets {np.ndarray} -- the offsets at which each sentence starts, followed by the number of tokens
+            weights {list[int]} -- the number of times each sentence occurred, if de-duplicated (default: {None})
 
-        For example, ["the", "quick", "brown", "fox"] would yield:
+        Returns:
+            np.ndarray -- the tag pair counts
+        """
 
-            "the", "quick"
-            "quick", "brown"
-            "brown", "fox"
+        n_tags = len(co.POS_TAGS)
+        if len(tags) < 2:
+            return np.zeros((n_tags, n_tags + 1), dtype=np.int64)
 
-        Arguments:
-            line {list[str]} -- the pre-processed, untagged sentence
+        # a pair is only valid within a sentence, that is if its second token does not start a new sentence
+        starts = np.zeros(len(tags) + 1, dtype=bool)
+        starts[offsets] = True
+        valid = ~starts[1:len(tags)] & (tags[:-1] < n_tags)
 
-        Yields:
-            str, str -- the first and second word in the pair
+        codes = tags[:-1][valid] * (n_tags + 1) + tags[1:][valid]
+        if weights is not None:
+            weights = np.repeat(np.asarray(weights, dtype=np.int64), np.diff(offsets))[:-1][valid]
+            count = np.bincount(codes, weights=weights, minlength=n_tags * (n_tags + 1)).astype(np.int64)
+        else:
+            count = np.bincount(codes, minlength=n_tags * (n_tags + 1))
+        return count.reshape(n_tags, n_tags + 1)
+
+    def save(self):
+        """Saves the results to csv at the path specified by the configs.
         """
 
-        # yield each pair of consecutive words
-        line = nltk.pos_tag(line)
-        for i in range(len(line)-1):
-            yield line[i][1], line[i+1][1]
+        count, tagging = self.master_count
+
+        # report how many sentences were tagged rather than found in the cache
+        lookups = tagging["hits"] + tagging["misses"]
+        if lookups:
+            print("Tagged {} of {} sentences, cache hit rate {:.1%}".format(tagging["misses"], lookups, tagging["hits"] / lookups))
+
+        # measure each pair against the total of its first tag
+        totals = count.sum(axis=1)
+        frequencies = count[:, :-1] / np.maximum(totals, 1)[:, None]
+
+        columns = {"PoS": co.POS_TAGS}
+        columns.update({tag: frequencies[:, j] for j, tag in enumerate(co.POS_TAGS)})
+
+        # sampled frequencies are written with the bounds of their confidence intervals
+        if self.sampler:
+            low, high = self.sampler.proportions(frequencies, totals[:, None])
+            for j, tag in enumerate(co.POS_TAGS):
+                columns[tag + "_low"] = low[:, j]
+                columns[tag + "_high"] = high[:, j]
+
+        self.write_results(columns)
@@ -0,0 +1,135 @@
+import os
+import nltk
+from collections import OrderedDict
+
+
+# the tagger of this process, shared by every chunk it processes
+_tagger = None
+
+# the fingerprint of the tagger model, found once per process
+_fingerprint = None
+
+
+class PoSTagger:
+    """Tags sentences in batches through nltk.pos_tag_sents, memoising the tags of repeated sentences.
+
+    The tags of each sentence are stored in a bounded least recently used cache keyed by the tuple of its tokens,
+    so repeated sentences are only tagged once per process. Token IDs only identify a sentence within their own
+    vocabulary, so a process which tags the corpora of several vocabularies starts a new cache for each.
+    """
+
+    # the locations of the tagger model used by nltk.pos_tag, newest first
+    models = ["taggers/averaged_perceptron_tagger_eng/", "taggers/averaged_perceptron_tagger/"]
+
+    def __init__(self, capacity, vocabulary=None):
+
+        self.capacity = capacity
+        self.vocabulary = vocabulary
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def instance(capacity, vocabulary=None):
+        """Returns the tagger of this process, creating it if required.
+
+        Arguments:
+            capacity {int} -- the maximum number of sentences memoised
+            vocabulary {str} -- path to the vocabulary of the token IDs tagged, or None if tagging words
+                (default: {None})
+
+        Returns:
+            PoSTagger -- the tagger
+        """
+
+        global _tagger
+        if _tagger is None or _tagger.capacity != capacity or _tagger.vocabulary != vocabulary:
+            _tagger = PoSTagger(capacity, vocabulary)
+
+        return _tagger
+
+    @staticmethod
+    def fingerprint():
+        """Returns a description of the tagger model, which changes whenever nltk or the model is updated.
+
+        Returns:
+            str -- the fingerprint
+        """
+
+        global _fingerprint
+        if _fingerprint is None:
+            _fingerprint = "nltk " + nltk.__version__
+            for model in PoSTagger.models:
+                try:
+                    path = nltk.data.find(model)
+                except LookupError:
+                    continue
+                for root, _, files in os.walk(path):
+                    for name in sorted(files):
+                        stat = os.stat(os.path.join(root, name))
+                        _fingerprint += ";{}:{}:{}".format(name, stat.st_size, stat.st_mtime_ns)
+                break
+
+        return _fingerprint
+
+    def tag_sents(self, sentences, decode=None):
+        """Returns the tags of each sentence, tagging only the unseen sentences.
+
+        Arguments:
+            sentences {list[list]} -- the tokenised sentences
+            decode {callable} -- converts a sentence of token IDs to words, if required (default: {None})
+
+        Returns:
+            list[tuple[str]] -- the tags of each sentence
+        """
+
+        tags = [None] * len(sentences)
+
+        # look up each sentence, grouping the positions of those which must be tagged
+        missing = OrderedDict()
+        for i, sentence in enumerate(sentences):
+            key = tuple(sentence)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                tags[i] = self.cache[key]
+                self.hits += 1
+            elif key in missing:
+                missing[key].append(i)
+                self.hits += 1
+            else:
+                missing[key] = [i]
+                self.misses += 1
+
+        # tag every unseen sentence in a single batch
+        words = [decode(key) if decode else list(key) for key in missing]
+        for (key, positions), tagged in zip(missing.items(), nltk.pos_tag_sents(words)):
+            value = tuple(tag for _, tag in tagged)
+
+            # memoise, evicting the least recently used sentences
+            self.cache[key] = value
+            if len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+
+            for i in positions:
+                tags[i] = value
+
+        return tags
+
+    def tag_chunk(self, chunk, batch_size, decode=None):
+        """Tags every sentence of a chunk, batch by batch.
+
+        Arguments:
+            chunk {iterable[list]} -- the tokenised sentences
+            batch_size {int} -- the number of sentences tagged at once
+            decode {callable} -- converts a sentence of token IDs to words, if required (default: {None})
+
+        Returns:
+            list[tuple[str]] -- the tags of each sentence
+        """
+
+        sentences = list(chunk)
+        tags = []
+        for i in range(0, len(sentences), batch_size):
+            tags.extend(self.tag_sents(sentences[i:i+batch_size], decode))
+
+        return tags
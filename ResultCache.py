@@ -0,0 +1,114 @@
+import os
+import json
+import pickle
+import hashlib
+
+
+# content hashes of the chunk files already read by this process
+_chunk_hashes = {}
+
+
+class ResultCache:
+    """A content-addressed cache of the results of each chunk.
+
+    Results are stored under a key derived from the content of the chunk file, the analysis type and everything
+    else the processing of the chunk depends on, so a re-run only processes chunks whose content or relevant
+    configuration has changed. Reading a result refreshes its modification time, and once the cache exceeds its
+    size limit the least recently used results are evicted.
+    """
+
+    def __init__(self, folder, size_limit):
+
+        self.folder = folder
+        self.size_limit = size_limit
+
+        if not os.path.exists(self.folder):
+            os.mkdir(self.folder)
+
+    @staticmethod
+    def chunk_hash(file):
+        """Returns the hash of the content of a chunk file, hashing each file only once per process.
+
+        Arguments:
+            file {str} -- path to the chunk file
+
+        Returns:
+            str -- the hex digest of the content
+        """
+
+        stat = os.stat(file)
+        memo = (file, stat.st_size, stat.st_mtime_ns)
+        if memo not in _chunk_hashes:
+            h = hashlib.sha1()
+            with open(file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            _chunk_hashes[memo] = h.hexdigest()
+
+        return _chunk_hashes[memo]
+
+    def key(self, file, analysis, state):
+        """Returns the key of the results of a chunk.
+
+        Arguments:
+            file {str} -- path to the chunk file
+            analysis {str} -- the analysis type
+            state {object} -- JSON serialisable description of everything else the results depend on
+
+        Returns:
+            str -- the key
+        """
+
+        description = json.dumps([self.chunk_hash(file), analysis, state], sort_keys=True)
+        return hashlib.sha1(description.encode("UTF-8")).hexdigest()
+
+    def get(self, key):
+        """Loads cached results, marking them as recently used.
+
+        Arguments:
+            key {str} -- the key
+
+        Returns:
+            object -- the results, or None if they are not cached
+        """
+
+        path = os.path.join(self.folder, key + ".pkl")
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+        return result
+
+    def put(self, key, result):
+        """Stores results, writing to a temporary file first so that a partial file is never read.
+
+        Arguments:
+            key {str} -- the key
+            result {object} -- the results
+        """
+
+        path = os.path.join(self.folder, key + ".pkl")
+        tmp_path = path + ".{}.tmp".format(os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Deletes the least recently used results until the cache is within its size limit.
+        """
+
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.size_limit:
+                break
+            os.remove(path)
+            size -= entry_size
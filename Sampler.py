@@ -0,0 +1,155 @@
+import numpy as np
+from statistics import NormalDist
+
+
+class Sampler:
+    """This estimates the results of an analysis from a random sample of the chunks of a resource, for
+    exploratory work where exact counts over the whole resource are not needed.
+
+    The chunks are shuffled with the seed and the first fraction of them is processed in rounds, each round
+    being a further random sample of the resource. After each round the current estimates are reported, and
+    if the analysis ranks its results, processing stops early once the top of the ranking has not changed for
+    several rounds. The counts of the chunks processed are then scaled up by the inverse of the fraction of
+    the sentences of the resource they hold, as the chunks are not all the same size.
+
+    The confidence intervals treat every occurrence as if it was sampled independently, with the probability
+    of the fraction of the sentences processed. Words which cluster in a few chunks, such as the names in a
+    single film, vary more between samples than this assumes, so their intervals are too narrow. For the same
+    reason a de-duplicated resource, whose repeated sentences are weighted on the part of their first copy,
+    cannot be sampled.
+    """
+
+    def __init__(self, pool, sizes, fraction, seed, configs):
+
+        if not 0 < fraction <= 1:
+            raise ValueError("The sample fraction must be greater than 0 and at most 1...")
+
+        self.population = len(pool)
+        self.total_size = sum(sizes)
+        self.configs = configs
+        self.z = NormalDist().inv_cdf((1 + configs["confidence"]) / 2)
+
+        # keep the chunks in shuffled order, so that the chunks processed before stopping early are also a
+        # random sample
+        order = np.random.default_rng(seed).permutation(len(pool))
+        n = min(max(int(round(fraction * len(pool))), 1), len(pool))
+        self.pool = [pool[i] for i in order[:n].tolist()]
+        self.sizes = [sizes[i] for i in order[:n].tolist()]
+        self.processed, self.processed_size = 0, 0
+
+    @property
+    def fraction(self):
+        """The fraction of the sentences of the resource in the chunks which have been processed.
+        """
+
+        return self.processed_size / self.total_size if self.processed_size else 1.0
+
+    def map_reduce(self, executor, combine, ranking):
+        """Processes the sampled chunks round by round, reporting the estimates after each round and stopping
+        early once the ranking is stable.
+
+        Arguments:
+            executor {Executor} -- the executor processing the chunks
+            combine {callable} -- combines two results into one
+            ranking {callable} -- returns the current top (key, count) pairs of a result, or None if the results
+                are not ranked
+
+        Returns:
+            object -- the combined result of the chunks processed, or None if there were none
+        """
+
+        self.processed, self.processed_size = 0, 0
+        if not self.pool:
+            return None
+
+        print("Sampling {} of {} chunks...".format(len(self.pool), self.population))
+
+        # split the sample into rounds of consecutive chunks
+        count, previous, unchanged = None, None, 0
+        rounds = [r.tolist() for r in np.array_split(np.arange(len(self.pool)), min(self.configs["rounds"], len(self.pool)))]
+        for i, chunks in enumerate(rounds):
+            result = executor.map_reduce([self.pool[c] for c in chunks])
+            count = result if count is None else combine(count, result)
+            self.processed += len(chunks)
+            self.processed_size += sum(self.sizes[c] for c in chunks)
+
+            # report the estimates of the top of the ranking
+            top = ranking(count)
+            if top is None:
+                print("Round {} of {}: processed {} of {} chunks...".format(i + 1, len(rounds), self.processed, self.population))
+                continue
+            estimates, low, high = self.counts(np.array([c for _, c in top], dtype=np.int64))
+            print("Round {} of {}: processed {} of {} chunks, leading with {}...".format(
+                i + 1, len(rounds), self.processed, self.population,
+                ", ".join("'{}' {} ({}-{})".format(k, e, l, h) for (k, _), e, l, h in list(zip(top, estimates.tolist(), low.tolist(), high.tolist()))[:3])
+                ))
+
+            # stop once the order of the top keys has settled
+            keys = [k for k, _ in top]
+            unchanged = unchanged + 1 if keys == previous else 0
+            previous = keys
+            if self.configs["stable_rounds"] and unchanged >= self.configs["stable_rounds"] and i + 1 < len(rounds):
+                print("Top {} unchanged for {} rounds, stopping early...".format(len(keys), unchanged))
+                break
+
+        return count
+
+    def counts(self, counts):
+        """Scales the counts of the sample up to estimates for the whole resource, with confidence intervals.
+
+        Arguments:
+            counts {np.ndarray} -- the counts in the sample
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray -- the estimated count and the lower and upper bounds of its
+                interval, where the lower bound is never below the count in the sample
+        """
+
+        counts = np.asarray(counts, dtype=np.float64)
+        f = self.fraction
+        estimates = counts / f
+        margin = self.z * np.sqrt(counts * (1 - f)) / f
+
+        return (
+            np.rint(estimates).astype(np.int64),
+            np.floor(np.maximum(estimates - margin, counts)).astype(np.int64),
+            np.ceil(estimates + margin).astype(np.int64)
+            )
+
+    def proportions(self, proportions, totals):
+        """Returns the confidence intervals of proportions measured in the sample.
+
+        Arguments:
+            proportions {np.ndarray} -- the proportions, which are estimated by their value in the sample
+            totals {np.ndarray} -- the count in the sample that each proportion is measured against
+
+        Returns:
+            np.ndarray, np.ndarray -- the lower and upper bounds of each interval
+        """
+
+        p = np.asarray(proportions, dtype=np.float64)
+        totals = np.asarray(totals, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margin = self.z * np.sqrt(np.where(totals > 0, p * (1 - p) * (1 - self.fraction) / totals, 0))
+
+        return np.clip(p - margin, 0, 1), np.clip(p + margin, 0, 1)
+
+    def ratios(self, counts, references):
+        """Returns estimated counts measured against fixed reference counts, with confidence intervals, such
+        as the count of a collocate against the frequency of the word alone.
+
+        Arguments:
+            counts {np.ndarray} -- the counts in the sample
+            references {np.ndarray} -- the count each is measured against, where 0 gives a ratio of 0
+
+        Returns:
+            np.ndarray, np.ndarray, np.ndarray -- the ratio of each estimated count and the lower and upper
+                bounds of its interval
+        """
+
+        references = np.asarray(references, dtype=np.float64)
+        ratios = []
+        for values in self.counts(counts):
+            ratios.append(np.divide(values, references, out=np.zeros(len(references)), where=references > 0))
+
+        return tuple(ratios)
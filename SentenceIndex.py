@@ -0,0 +1,124 @@
+import os
+import mmap
+import numpy as np
+from PartFile import PartFile
+
+
+class SentenceIndex:
+    """This handles the sentence offset index of a pre-processed resource. Each part is stored alongside the
+    byte offset at which each of its lines starts, so any sentence can be read from the memory-mapped text file
+    without scanning it. Any metadata stripped from the raw sentences, such as the sentence IDs of Tatoeba, is
+    kept in a tab-separated file with one line per sentence so that each sentence can be traced back to its source.
+    """
+
+    @staticmethod
+    def paths(part):
+        """Returns the paths of the sentence offsets and source metadata belonging to a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            str, str -- paths to the offset array and the source file
+        """
+
+        stem = PartFile.stem(part)
+        return stem + ".lines.npy", stem + ".source.tsv"
+
+    @staticmethod
+    def exists(parts):
+        """Checks whether the sentence offsets of every part have been written.
+
+        Arguments:
+            parts {list[str]} -- paths to the pre-processed text files
+
+        Returns:
+            bool -- whether the index is complete
+        """
+
+        return all(os.path.exists(SentenceIndex.paths(part)[0]) for part in parts)
+
+    @staticmethod
+    def index_part(part):
+        """Builds the sentence offsets of a single part from its text file, as the byte offset at which each line
+        starts followed by the size of the file.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+        """
+
+        text = np.frombuffer(PartFile.read_bytes(part), dtype=np.uint8)
+
+        # every line of a pre-processed part ends with a newline
+        offsets = np.concatenate([[0], np.flatnonzero(text == ord("\n")) + 1])
+        np.save(SentenceIndex.paths(part)[0], offsets.astype(np.int64))
+
+    @staticmethod
+    def count(part):
+        """Counts the sentences of a part from its sentence offsets, including every copy of a de-duplicated
+        sentence.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            int -- the number of sentences
+        """
+
+        weights = PartFile.load_weights(part)
+        if weights is not None:
+            return int(weights.sum())
+        return len(np.load(SentenceIndex.paths(part)[0], mmap_mode='r')) - 1
+
+    @staticmethod
+    def save_sources(part, sources):
+        """Writes the metadata stripped from each sentence of a part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+            sources {list[str]} -- the metadata of each sentence
+        """
+
+        with open(SentenceIndex.paths(part)[1], 'w', encoding="UTF-8") as f:
+            f.write("".join(source + "\n" for source in sources))
+
+    @staticmethod
+    def read_sentences(part, sentences):
+        """Reads the specified sentences of a part from the memory-mapped text file, or from the decompressed text
+        if the part is compressed.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+            sentences {list[int]} -- the line numbers of the sentences
+
+        Returns:
+            list[str] -- the pre-processed text of each sentence
+        """
+
+        offsets = np.load(SentenceIndex.paths(part)[0], mmap_mode='r')
+        if part.endswith(".gz") or not os.path.getsize(part):
+            text = PartFile.read_bytes(part)
+            return [text[offsets[i]:offsets[i + 1]].decode("UTF-8").rstrip("\n") for i in sentences]
+
+        with open(part, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+            return [text[offsets[i]:offsets[i + 1]].decode("UTF-8").rstrip("\n") for i in sentences]
+
+    @staticmethod
+    def read_sources(part, sentences):
+        """Reads the metadata of the specified sentences of a part, if any was stripped.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+            sentences {list[int]} -- the line numbers of the sentences
+
+        Returns:
+            list[str] -- the metadata of each sentence, which is empty if none was kept
+        """
+
+        source_path = SentenceIndex.paths(part)[1]
+        if not os.path.exists(source_path):
+            return ["" for _ in sentences]
+
+        with open(source_path, 'r', encoding="UTF-8") as f:
+            sources = f.read().split("\n")
+        return [sources[i] for i in sentences]
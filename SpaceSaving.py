@@ -0,0 +1,105 @@
+import heapq
+from collections import Counter
+from operator import itemgetter
+
+
+class SpaceSaving:
+    """A fixed-size, mergeable summary of the most frequent phrases, following the Space-Saving algorithm.
+
+    At most `capacity` phrases are monitored, each with an estimated count which never underestimates the true
+    count, and an error which bounds the overestimate. Any phrase which is not monitored occurred at most
+    `threshold` times. Two summaries are merged by summing the estimates of each phrase, using the threshold of
+    the other summary where a phrase is missing from it, and keeping the `capacity` largest.
+    """
+
+    def __init__(self, capacity, counts=None, errors=None, threshold=0, total=0):
+
+        self.capacity = capacity
+        self.counts = counts or {}
+        self.errors = errors or {}
+        self.threshold = threshold
+        self.total_count = total
+
+    @classmethod
+    def from_count(cls, count, capacity):
+        """Summarises an exact count, keeping the most common phrases.
+
+        Arguments:
+            count {Counter|NgramCount} -- the exact count of a chunk
+            capacity {int} -- the number of phrases to monitor
+
+        Returns:
+            SpaceSaving -- the summary
+        """
+
+        top = count.most_common(capacity + 1)
+        total = sum(count.values()) if isinstance(count, Counter) else count.total()
+
+        # any phrase which is not kept occurs at most as often as the most common phrase discarded
+        threshold = top[capacity][1] if len(top) > capacity else 0
+
+        return cls(capacity, dict(top[:capacity]), {}, threshold, total)
+
+    def __add__(self, other):
+
+        if not isinstance(other, SpaceSaving):
+            return NotImplemented
+
+        counts = {}
+        errors = {}
+        for key in self.counts.keys() | other.counts.keys():
+            counts[key] = self.counts.get(key, self.threshold) + other.counts.get(key, other.threshold)
+            errors[key] = (self.errors.get(key, 0) if key in self.counts else self.threshold) + \
+                (other.errors.get(key, 0) if key in other.counts else other.threshold)
+
+        # keep the largest estimates, a discarded phrase may have occurred as often as the largest discarded
+        top = heapq.nlargest(self.capacity + 1, counts.items(), key=itemgetter(1))
+        threshold = self.threshold + other.threshold
+        if len(top) > self.capacity:
+            threshold = max(threshold, top[self.capacity][1])
+        top = top[:self.capacity]
+
+        return SpaceSaving(
+            self.capacity,
+            dict(top),
+            {key: errors[key] for key, _ in top if errors[key]},
+            threshold,
+            self.total_count + other.total_count
+            )
+
+    def __len__(self):
+
+        return len(self.counts)
+
+    def error(self, key):
+        """Returns the bound on how far the estimated count of a phrase may exceed its true count.
+
+        Arguments:
+            key {str|int|tuple[int]} -- the phrase, as returned by make_key
+
+        Returns:
+            int -- the error bound
+        """
+
+        return self.errors.get(key, 0) if key in self.counts else self.threshold
+
+    def most_common(self, n):
+        """Returns the n phrases with the largest estimated counts.
+
+        Arguments:
+            n {int} -- the number of phrases
+
+        Returns:
+            list[tuple] -- (key, count) pairs, ordered by descending estimated count
+        """
+
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+    def total(self):
+        """Returns the exact sum of all the counts, including those of phrases which are not monitored.
+
+        Returns:
+            int -- the total count
+        """
+
+        return self.total_count
@@ -5,9 +5,13 @@ import json
 import glob
 import pprint
 import argparse
+import numpy as np
 import constants as co
 from collections import Counter
 from multiprocessing import Pool
+from TokenCorpus import TokenCorpus
+from CollocateCount import CollocateCount
+from Association import Association
 from AnalyserTemplate import AnalyserTemplate
 
 class SpecificCollocate(AnalyserTemplate):
@@ -23,113 +27,239 @@ class SpecificCollocate(AnalyserTemplate):
 
     """
     
-    def execute(self):
-        """Executes the specific collocate frequency analysis.
+    # the relative frequencies are measured against the frequency analysis
+    uses_frequency = True
 
-        Using the multiprocessing library, count the frequency of word or phrases appearing before or after any of
-        the words listed in the text file specified in the configs.
+    def prepare(self):
+        """Initialises the configurations and loads the words of interest and frequency data of the specific
+        collocate analysis.
+
+        The frequency of words or phrases appearing before or after any of the words listed in the text file
+        specified in the configs are counted.
         """
 
         # initialise configurations
-        self.task_configs = self.configs["collocate"]
+        self.task_configs = self.configs["specific_collocate"]
         self.dest_filename = os.path.join(self.results_folder, self.task_configs["dest_filename"].split('.')[0])
         self.n = self.task_configs["n"]
 
         # load additional resources
-        self.words = self.load_words_of_interest(self.task_configs["words_of_interest_filename"])
-        self.freq = self.load_word_freq(os.path.join(self.resource_folder, self.task_configs["frequency_filename"]))
-
-        # multiprocess chunk by chunk
-        with Pool(self.configs["n_processors"]) as p:
-            counts = []
-            for count in tqdm.tqdm(p.imap_unordered(self.process, self.pool), total=len(self.pool)):
-                counts.append(count)
-
-        # initialise master count 
-        self.master_count = {word: Counter() for word in self.words}
-
-        # re-merge counters from multiprocessing
-        for count in counts:
-            for word in self.master_count:
-                self.master_count[word] += count[word]
-        
-        self.save()
-
-    def process(self, file):
+        self.words = self.load_words_of_interest(os.path.join(self.resource_folder, self.task_configs["words_of_interest_filename"].format(l=self.language)))
+        # each word of interest has a single row of results, so any repeated or blank word is only counted once
+        self.words = [self.encode(word) for word in self.words if word]
+        self.words = list(dict.fromkeys(word for word in self.words if word is not None))
+        self.freq = self.load_word_freq(self.find_word_freq(self.task_configs["frequency_filename"]))
+
+        # check the settings are valid
+        if self.n == 0:
+            raise ValueError("The number of words before or after the words of interest cannot be 0...")
+        if self.task_configs["use_index"] and not self.index:
+            raise ValueError("Using the index requires the index pre-processing option to be enabled...")
+
+    def process_chunk(self, chunk):
         """Processes a single chunk, counting the frequency of the collocates.
 
+        If enabled, the collocates are gathered from the positional index of the chunk, so only the
+        occurrences of the words of interest are visited rather than every sentence.
+
         Arguments:
-            file {str} -- path to pre-processed resource file
+            chunk {TokenChunk|TextChunk} -- the tokenised sentences of the chunk
 
         Returns:
-            dict{str:Counter} -- collocate frequency results
+            CollocateCount -- collocate frequency results
         """
 
+        if self.task_configs["use_index"]:
+            return self.process_postings(chunk)
+
         # initialise counter
-        count = {word: Counter() for word in self.words}
+        count = CollocateCount(self.words)
+        words = set(self.words)
 
         # iterate over lines in chunk
-        with open(file, encoding='UTF-8') as f:
-            for line in f:
+        for line, weight in zip(chunk, chunk.sentence_weights()):
+
+            # process line
+            count = self.process_line(count, line, words, self.n, weight)
+
+        return self.summarise(count)
+
+    def process_postings(self, chunk):
+        """Processes a single chunk through its positional index, counting the frequency of the collocates.
+
+        Arguments:
+            chunk {TokenChunk} -- the memory-mapped tokens and sentence offsets of the chunk
+
+        Returns:
+            CollocateCount -- collocate frequency results
+        """
 
-                # process line
-                count = self.process_line(count, line, self.words, self.n)
+        index = TokenCorpus.load_index(chunk.path)
+        tokens = np.asarray(chunk.tokens, dtype=np.int64)
+        offsets = np.asarray(chunk.offsets, dtype=np.int64)
+        weights = np.asarray(chunk.sentence_weights(), dtype=np.int64)
+        n = self.n
+
+        # initialise counter
+        count = CollocateCount(self.words)
+
+        for word in self.words:
+
+            # find every occurrence of the word
+            positions = index.postings(word)
+            if not len(positions):
+                continue
+            sentence = np.searchsorted(offsets, positions, side="right") - 1
+            count[word]['TOTAL'] += int(weights[sentence].sum())
+
+            # find the phrase of n words before or after, skipping any which overrun the sentence
+            start, end = (positions + n, positions) if n < 0 else (positions + 1, positions + n + 1)
+            inside = (start >= offsets[sentence]) & (end <= offsets[sentence + 1])
+            start, sentence = start[inside], sentence[inside]
+
+            # count each distinct phrase, weighted by its sentence
+            phrases = np.stack([tokens[start + k] for k in range(abs(n))], axis=1)
+            phrases, inverse = np.unique(phrases, axis=0, return_inverse=True)
+            counts = np.bincount(inverse.reshape(-1), weights=weights[sentence], minlength=len(phrases)).astype(np.int64)
+            for phrase, c in zip(phrases.tolist(), counts.tolist()):
+                count[word][self.make_key(phrase)] += c
+
+        return self.summarise(count)
+
+    def summarise(self, count):
+        """Summarises the most common collocates of each word of interest if approximate counts are enabled,
+        always keeping the total count of the word exactly.
+
+        Arguments:
+            count {CollocateCount} -- the collocate frequency results of a chunk
+
+        Returns:
+            CollocateCount -- the collocate frequency results, summarised if enabled
+        """
+
+        if self.task_configs["approximate"]:
+            count.summarise(self.task_configs["summary_capacity"], ['TOTAL'])
 
         return count
 
-    def save(self):
-        """Saves the results to csv at the path specified by the configs.
+    def cache_state(self):
+        """Returns the configurations and resources which the collocate frequency results of a chunk depend on.
+
+        Returns:
+            dict -- the words of interest, the number of words before or after them and how the collocates are
+                summarised
         """
 
-        # create results folder
-        if not os.path.isdir(self.results_folder):
-            os.mkdir(self.results_folder)
+        return {
+            "words": self.words,
+            "n": self.n,
+            "approximate": self.task_configs["approximate"],
+            "summary_capacity": self.task_configs["summary_capacity"]
+            }
 
-        with open(self.dest_filename.format(l=self.language) + '.csv', 'w', encoding='UTF-8', newline='') as f:
+    def empty(self):
+        """Returns the collocate frequency results of an empty chunk.
 
-            # instantiate csv writer
-            writer = csv.writer(f)
+        Returns:
+            CollocateCount -- the empty collocate frequency results
+        """
 
-            # create column headings
-            headings = ['word', 'count']
-            for i in range(1,11):
-                headings.append("collocate_{}".format(i)) 
-                headings.append("count_{}".format(i)) 
-                headings.append("relative_frequency_{}".format(i)) 
-            writer.writerow(headings)
+        return CollocateCount(self.words)
 
-            # iterate over words of interest
-            for word, cnt in self.master_count.items():
+    def combine(self, count, other):
+        """Combines the collocate frequency results of two chunks.
 
-                # build row
-                row = [word, cnt['TOTAL']]
-                for w, c in cnt.most_common(11)[1:]:
-                    row.append(w)
-                    row.append(c)
-                    try:
-                        row.append(c/self.freq[abs(self.n)][w])
-                    except KeyError:
-                        row.append(0)
+        Arguments:
+            count {CollocateCount} -- collocate frequency results, updated in place
+            other {CollocateCount} -- collocate frequency results
 
-                # write row to csv
-                writer.writerow(row)
+        Returns:
+            CollocateCount -- the combined collocate frequency results
+        """
 
-    @staticmethod
-    def process_line(count, line, words, n):
+        return count.update(other)
+
+    def save(self):
+        """Saves the results to csv at the path specified by the configs.
+
+        Every measure is computed over every (word, collocate) pair at once, after which the top_k collocates
+        of each word are selected by the score specified in the configs. Unless ranking by count or relative
+        frequency, the score of each collocate is written alongside them.
+        """
+
+        # gather every pair as arrays, setting aside the total count of each word
+        rows, cols, counts, keys = self.master_count.arrays()
+        collocates = cols != (keys.index('TOTAL') if 'TOTAL' in keys else -1)
+        totals = np.bincount(rows[~collocates], weights=counts[~collocates], minlength=len(self.words)).astype(np.int64)
+        rows, cols, counts = rows[collocates], cols[collocates], counts[collocates]
+
+        # relative frequency measures the collocate count against the frequency of the collocate alone, or is 0
+        # if the collocate was not found in the frequency analysis
+        raw_keys, keys = keys, [self.decode(key) for key in keys]
+        collocate_freq = np.array([self.freq.get(abs(self.n), {}).get(key, 0) for key in keys], dtype=np.float64)[cols]
+        scores = Association.scores(rows, cols, counts)
+        scores["count"] = counts
+        scores["relative_frequency"] = np.divide(counts, collocate_freq, out=np.zeros(len(counts)), where=collocate_freq > 0)
+
+        # sampled counts are scaled up to the whole resource, with the bounds of their confidence intervals,
+        # while the association measures are those of the sample
+        columns = ["count", "relative_frequency"]
+        if self.sampler:
+            scores["count"], scores["count_low"], scores["count_high"] = self.sampler.counts(counts)
+            scores["relative_frequency"], scores["relative_frequency_low"], scores["relative_frequency_high"] = self.sampler.ratios(counts, collocate_freq)
+            columns = ["count", "count_low", "count_high", "relative_frequency", "relative_frequency_low", "relative_frequency_high"]
+            totals, totals_low, totals_high = self.sampler.counts(totals)
+
+        # select the top collocates of each word
+        score = self.task_configs["score"]
+        if score not in Association.measures:
+            raise ValueError("Unknown score, choose from {}...".format(", ".join(Association.measures)))
+        top = Association.top_k(rows, scores[score].astype(np.float64), self.task_configs["top_k"])
+        columns += [score] if score not in ["count", "relative_frequency"] else []
+
+        # approximate counts also record how far each count may be overestimated
+        if self.master_count.capacity is not None:
+            scores["error_bound"] = np.zeros(len(counts), dtype=np.int64)
+            errors = [self.master_count.error(self.words[r], raw_keys[c]) for r, c in zip(rows[top].tolist(), cols[top].tolist())]
+            scores["error_bound"][top] = self.sampler.counts(errors)[0] if self.sampler else errors
+            columns.append("error_bound")
+            print("The top {} collocates by count are guaranteed for {} of {} words...".format(
+                self.task_configs["top_k"], self.master_count.guaranteed(self.task_configs["top_k"]), len(self.words)))
+
+        # build the row of each word of interest from its selected collocates
+        table = [[self.decode(word), int(total)] for word, total in zip(self.words, totals.tolist())]
+        if self.sampler:
+            for row, low, high in zip(table, totals_low.tolist(), totals_high.tolist()):
+                row.extend([low, high])
+        for r, c, values in zip(rows[top].tolist(), cols[top].tolist(), zip(*[scores[column][top].tolist() for column in columns])):
+            table[r].append(keys[c])
+            table[r].extend(values)
+
+        # create column headings
+        headings = ['word', 'count'] + (['count_low', 'count_high'] if self.sampler else [])
+        for i in range(1, self.task_configs["top_k"] + 1):
+            headings.append("collocate_{}".format(i))
+            headings.extend("{}_{}".format(column, i) for column in columns)
+
+        # transpose to columns, leaving the cells of missing collocates empty
+        self.write_results({
+            heading: [row[i] if i < len(row) else None for row in table]
+            for i, heading in enumerate(headings)
+            }, encoding='UTF-8')
+
+    def process_line(self, count, line, words, n, weight=1):
         """Processes a single line and updates the frequency count with any matched collocates.
 
         Arguments:
-            count {Counter} -- frequency count
-            line {str} -- the sentence to be analysed
-            words {list[str]} -- words of interest
+            count {CollocateCount} -- frequency count
+            line {list[str]|list[int]} -- the tokenised sentence to be analysed
+            words {set[str]} -- words of interest
             n {int} -- number of words before or after word of interest
+            weight {int} -- the number of times the sentence occurred (default: {1})
 
         Returns:
-            Counter -- updated frequency count
+            CollocateCount -- updated frequency count
         """
-        
-        # get word list from string
-        line = line.split()
 
         # iterate over words in sentence
         for i, word in enumerate(line):
@@ -138,29 +268,15 @@ class SpecificCollocate(AnalyserTemplate):
             if word in words:
 
                 # increment total counter
-                count[word]['TOTAL'] += 1
-
-                # do forwards and backwards index logic
-                neg = n if n < 0 else 1
-                pos = n + 1 if n > 0 else 0
-
-                try:
-
-                    # catch outside range limits
-                    if i-neg < 0: 
-                        raise IndexError()
-                    elif i+pos > len(line)-1:
-                        raise IndexError()
-                    
-                    # generate phrase
-                    phrase_list = line[i+neg:i+pos]
-                    phrase = " ".join(phrase_list)
-                    
-                    # increment counter
-                    count[word][phrase] += 1
-
-                except IndexError:
-                    pass
+                count[word]['TOTAL'] += weight
+
+                # find the phrase of n words before or after, skipping any which overruns the sentence
+                start, end = (i + n, i) if n < 0 else (i + 1, i + n + 1)
+                if start < 0 or end > len(line):
+                    continue
+
+                # increment counter
+                count[word][self.make_key(line[start:end])] += weight
 
         return count
 
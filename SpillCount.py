@@ -0,0 +1,178 @@
+import os
+import heapq
+import uuid
+from operator import itemgetter
+
+
+class SpillCount:
+    """An exact count of phrases which is held on disk as sorted runs rather than in memory.
+
+    Whenever a counter grows beyond the memory budget it is sorted by key and spilled to a run file, after
+    which counting continues in an empty counter. Merging two counts only combines their lists of runs, and
+    the runs are merged external-sort style, streaming through every file at once and summing the counts of
+    equal keys, when the results are read.
+    """
+
+    # the maximum number of runs merged at once, to stay within the open file limit
+    max_open = 256
+
+    def __init__(self, folder, runs=None):
+
+        self.folder = folder
+        self.runs = runs or []
+
+    def spill(self, count):
+        """Writes the counter to disk as a run sorted by key and clears it.
+
+        Arguments:
+            count {Counter} -- the partial count
+        """
+
+        if not count:
+            return
+
+        path = os.path.join(self.folder, uuid.uuid4().hex + ".run")
+        with open(path, 'w', encoding="UTF-8") as f:
+            for key, c in sorted((self.serialise(key), c) for key, c in count.items()):
+                f.write("{}\t{}\n".format(key, c))
+
+        self.runs.append(path)
+        count.clear()
+
+    def __add__(self, other):
+
+        if not isinstance(other, SpillCount):
+            return NotImplemented
+
+        return SpillCount(self.folder, self.runs + other.runs)
+
+    def items(self):
+        """Merges every run, yielding each key once with its total count, in key order.
+
+        Yields:
+            str, int -- the serialised key and its count
+        """
+
+        # merge in several passes if there are too many runs to open at once
+        while len(self.runs) > self.max_open:
+            groups = [self.runs[i:i+self.max_open] for i in range(0, len(self.runs), self.max_open)]
+            self.runs = [self.merge_runs(group) for group in groups]
+
+        files = [open(path, 'r', encoding="UTF-8") for path in self.runs]
+        try:
+            current_key, current = None, 0
+            for key, c in heapq.merge(*[self.read_run(f) for f in files], key=itemgetter(0)):
+                if key == current_key:
+                    current += c
+                else:
+                    if current_key is not None:
+                        yield current_key, current
+                    current_key, current = key, c
+            if current_key is not None:
+                yield current_key, current
+        finally:
+            for f in files:
+                f.close()
+
+    def merge_runs(self, runs):
+        """Merges several runs into a single run, deleting the originals.
+
+        Arguments:
+            runs {list[str]} -- paths to the runs
+
+        Returns:
+            str -- path to the merged run
+        """
+
+        merged = SpillCount(self.folder, runs)
+        path = os.path.join(self.folder, uuid.uuid4().hex + ".run")
+        with open(path, 'w', encoding="UTF-8") as f:
+            for key, c in merged.items():
+                f.write("{}\t{}\n".format(key, c))
+
+        for run in runs:
+            os.remove(run)
+
+        return path
+
+    def most_common(self, n):
+        """Returns the n most common phrases and records the total count of every phrase.
+
+        Arguments:
+            n {int} -- the number of phrases
+
+        Returns:
+            list[tuple] -- (key, count) pairs, ordered by descending count
+        """
+
+        self.total_count = 0
+
+        def tally():
+            for key, c in self.items():
+                self.total_count += c
+                yield key, c
+
+        return [(self.deserialise(key), c) for key, c in heapq.nlargest(n, tally(), key=itemgetter(1))]
+
+    def total(self):
+        """Returns the sum of all the counts.
+
+        Returns:
+            int -- the total count
+        """
+
+        if not hasattr(self, "total_count"):
+            self.total_count = sum(c for _, c in self.items())
+
+        return self.total_count
+
+    @staticmethod
+    def read_run(f):
+        """Parses the lines of a run file.
+
+        Arguments:
+            f {file} -- the open run file
+
+        Yields:
+            str, int -- the serialised key and its count
+        """
+
+        for line in f:
+            key, c = line.rstrip("\n").split("\t")
+            yield key, int(c)
+
+    @staticmethod
+    def serialise(key):
+        """Returns the key as a string. A single token ID is prefixed with '#' and a tuple of token IDs, written
+        separated by spaces, with '@', neither of which can appear in a pre-processed phrase, so no text key is
+        ever read back as token IDs.
+
+        Arguments:
+            key {str|int|tuple[int]} -- the key, as returned by make_key
+
+        Returns:
+            str -- the serialised key
+        """
+
+        if isinstance(key, str):
+            return key
+        elif isinstance(key, tuple):
+            return "@" + " ".join(str(t) for t in key)
+        return "#" + str(key)
+
+    @staticmethod
+    def deserialise(key):
+        """Returns the key as it was counted.
+
+        Arguments:
+            key {str} -- the serialised key
+
+        Returns:
+            str|int|tuple[int] -- the key, as returned by make_key
+        """
+
+        if key.startswith("#"):
+            return int(key[1:])
+        elif key.startswith("@"):
+            return tuple(int(t) for t in key[1:].split())
+        return key
@@ -0,0 +1,186 @@
+import os
+import json
+import numpy as np
+import constants as co
+from collections import Counter
+from PoSTagger import PoSTagger
+from PartFile import PartFile
+from ResultCache import ResultCache
+
+
+class TaggedCorpus:
+    """This handles the part of speech tags of a pre-processed resource, which are computed once per dataset
+    rather than on every run. The tags of each pre-processed part are stored as a flat array of tag IDs aligned
+    with its tokens, alongside the offsets at which each sentence starts and a small metadata file. Tag IDs
+    index constants.POS_TAGS, with any other tags listed in the metadata of the part.
+
+    The metadata records the hash of the part and a fingerprint of the tagger model, so a part is re-tagged
+    whenever either changes. A lexicon of the most common tag of each word is derived from every part to
+    give the word types of the results without calling the tagger.
+    """
+
+    def __init__(self, pre_processed_folder, language, batch_size=1000, cache_size=100000):
+
+        self.lexicon_path = os.path.join(pre_processed_folder, language + "_lexicon.txt")
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.fingerprint = PoSTagger.fingerprint()
+
+    @staticmethod
+    def part_paths(part):
+        """Returns the paths of the tag, sentence offset and metadata files belonging to a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            str, str, str -- paths to the tag array, the offset array and the metadata
+        """
+
+        stem = PartFile.stem(part)
+        return stem + ".tags.npy", stem + ".tag_offsets.npy", stem + ".tags.json"
+
+    def stale(self, parts):
+        """Finds the parts whose tags are missing or were computed from a different part or tagger model.
+
+        Arguments:
+            parts {list[str]} -- paths to the pre-processed text files
+
+        Returns:
+            list[str] -- paths to the parts which must be tagged
+        """
+
+        stale = []
+        for part in parts:
+            tags_path, offsets_path, meta_path = self.part_paths(part)
+            try:
+                with open(meta_path, 'r', encoding="UTF-8") as f:
+                    meta = json.load(f)
+            except (FileNotFoundError, ValueError):
+                stale.append(part)
+                continue
+
+            if meta.get("source") != ResultCache.chunk_hash(part) or meta.get("tagger") != self.fingerprint \
+                    or not os.path.exists(tags_path) or not os.path.exists(offsets_path):
+                stale.append(part)
+
+        return stale
+
+    def tag_part(self, part):
+        """Tags a single pre-processed part and writes its tag and sentence offset arrays and metadata.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+        """
+
+        with PartFile.open(part) as f:
+            sentences = [line.split() for line in f]
+
+        # tag the sentences batch by batch, empty sentences having no tags
+        tagged = PoSTagger.instance(self.cache_size).tag_chunk([s for s in sentences if s], self.batch_size)
+        tagged = iter(tagged)
+        sentence_tags = [next(tagged) if s else () for s in sentences]
+
+        # number the tags, listing any not in constants.POS_TAGS after them
+        tagset = list(co.POS_TAGS)
+        tag_index = dict(co.POS_TAG_INDEX)
+        ids = []
+        offsets = [0]
+        for tags in sentence_tags:
+            for tag in tags:
+                if tag not in tag_index:
+                    tag_index[tag] = len(tagset)
+                    tagset.append(tag)
+                ids.append(tag_index[tag])
+            offsets.append(len(ids))
+
+        # write the metadata last so that a part is only valid once its arrays are complete
+        tags_path, offsets_path, meta_path = self.part_paths(part)
+        np.save(tags_path, np.array(ids, dtype=np.uint8))
+        np.save(offsets_path, np.array(offsets, dtype=np.int64))
+        with open(meta_path, 'w', encoding="UTF-8") as f:
+            json.dump({"source": ResultCache.chunk_hash(part), "tagger": self.fingerprint, "tagset": tagset[len(co.POS_TAGS):]}, f)
+
+    @staticmethod
+    def load_part(part):
+        """Memory-maps the tag and sentence offset arrays of a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            np.ndarray, np.ndarray, list[str] -- the tag IDs, the sentence offsets and every tag in ID order
+        """
+
+        tags_path, offsets_path, meta_path = TaggedCorpus.part_paths(part)
+        with open(meta_path, 'r', encoding="UTF-8") as f:
+            tagset = co.POS_TAGS + json.load(f)["tagset"]
+
+        return np.load(tags_path, mmap_mode='r'), np.load(offsets_path, mmap_mode='r'), tagset
+
+    @staticmethod
+    def count_word_tags(part):
+        """Counts how often each word of a pre-processed part was given each tag, weighting each word by the
+        weight of its sentence if the resource was de-duplicated.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            Counter -- frequency of each (word, tag) pair
+        """
+
+        tags, offsets, tagset = TaggedCorpus.load_part(part)
+        with PartFile.open(part) as f:
+            words = f.read().split()
+
+        pairs = zip(words, (tagset[t] for t in tags.tolist()))
+        weights = PartFile.load_weights(part)
+        if weights is None:
+            return Counter(pairs)
+
+        count = Counter()
+        for pair, weight in zip(pairs, np.repeat(weights, np.diff(offsets)).tolist()):
+            count[pair] += weight
+        return count
+
+    def save_lexicon(self, count):
+        """Writes the most common tag of each word, breaking ties alphabetically.
+
+        Arguments:
+            count {Counter} -- frequency of each (word, tag) pair in the resource
+        """
+
+        lexicon = {}
+        for (word, tag), c in sorted(count.items(), key=lambda item: (-item[1], item[0][1])):
+            lexicon.setdefault(word, tag)
+
+        with open(self.lexicon_path, 'w', encoding="UTF-8") as f:
+            for word in sorted(lexicon):
+                f.write("{}\t{}\n".format(word, lexicon[word]))
+
+    def extend_lexicon(self, count):
+        """Adds the most common tag of each word which is not yet in the lexicon, leaving the tags of the words
+        already in it unchanged.
+
+        Arguments:
+            count {Counter} -- frequency of each (word, tag) pair in the new parts
+        """
+
+        lexicon = self.load_lexicon()
+        for (word, tag), c in sorted(count.items(), key=lambda item: (-item[1], item[0][1])):
+            lexicon.setdefault(word, tag)
+
+        with open(self.lexicon_path, 'w', encoding="UTF-8") as f:
+            for word in sorted(lexicon):
+                f.write("{}\t{}\n".format(word, lexicon[word]))
+
+    def load_lexicon(self):
+        """Loads the most common tag of each word.
+
+        Returns:
+            dict{str:str} -- the tag of each word
+        """
+
+        with open(self.lexicon_path, 'r', encoding="UTF-8") as f:
+            return dict(line.rstrip("\n").split("\t") for line in f)
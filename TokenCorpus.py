@@ -0,0 +1,325 @@
+import os
+import numpy as np
+from collections import Counter
+from PartFile import PartFile
+
+
+# vocabulary index of each pool worker during encoding, and the path, size and modification time of the
+# vocabulary it was built from
+_word_index = None
+_word_index_key = None
+
+
+class TokenCorpus:
+    """This handles the binary token ID format of a pre-processed resource. The vocabulary is stored once as a
+    text file, with the line number of each word being its ID, and each pre-processed part is stored as a flat
+    array of token IDs alongside the offsets at which each sentence starts. Both arrays are memory-mapped when
+    loaded so that the analysers never need to decode or split the text.
+    """
+
+    def __init__(self, pre_processed_folder, language):
+
+        self.vocab_path = os.path.join(pre_processed_folder, language + "_vocab.txt")
+
+    def exists(self, parts):
+        """Checks whether the vocabulary and the token arrays for every part have been written.
+
+        Arguments:
+            parts {list[str]} -- paths to the pre-processed text files
+
+        Returns:
+            bool -- whether the binary corpus is complete
+        """
+
+        paths = [self.vocab_path] + [p for part in parts for p in self.part_paths(part)]
+        return all(os.path.exists(p) for p in paths)
+
+    def load_vocab(self):
+        """Loads the vocabulary, where the index of each word is its token ID.
+
+        Returns:
+            list[str] -- the vocabulary
+        """
+
+        with open(self.vocab_path, 'r', encoding="UTF-8") as f:
+            return f.read().splitlines()
+
+    def save_vocab(self, count):
+        """Writes the vocabulary from the merged token counts, assigning the lowest IDs to the most frequent words.
+
+        Arguments:
+            count {Counter} -- frequency of each token in the resource
+
+        Returns:
+            list[str] -- the vocabulary
+        """
+
+        # sort by descending count, breaking ties alphabetically so that the IDs are reproducible
+        vocab = [word for word, _ in sorted(count.items(), key=lambda item: (-item[1], item[0]))]
+
+        with open(self.vocab_path, 'w', encoding="UTF-8") as f:
+            f.write("\n".join(vocab) + "\n")
+
+        return vocab
+
+    def extend_vocab(self, vocab, count):
+        """Appends the words which are not yet in the vocabulary, so that the IDs of the existing words, and any
+        results counted on them, stay valid.
+
+        Arguments:
+            vocab {list[str]} -- the current vocabulary
+            count {Counter} -- frequency of each token in the new parts
+
+        Returns:
+            list[str] -- the extended vocabulary
+        """
+
+        known = set(vocab)
+        new = [word for word, _ in sorted(count.items(), key=lambda item: (-item[1], item[0])) if word not in known]
+
+        with open(self.vocab_path, 'a', encoding="UTF-8") as f:
+            f.write("".join(word + "\n" for word in new))
+
+        return vocab + new
+
+    @staticmethod
+    def part_paths(part):
+        """Returns the paths of the token and sentence offset arrays belonging to a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            str, str -- paths to the token array and the offset array
+        """
+
+        stem = PartFile.stem(part)
+        return stem + ".tokens.npy", stem + ".offsets.npy"
+
+    @staticmethod
+    def count_part(part):
+        """Counts the tokens in a single pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            Counter -- frequency of each token
+        """
+
+        count = Counter()
+        with PartFile.open(part) as f:
+            for line in f:
+                count.update(line.split())
+
+        return count
+
+    def word_index(self):
+        """Returns the word to ID lookup, which is built once per worker process for each version of the
+        vocabulary, so that any pool can encode the parts without an initializer.
+
+        Returns:
+            dict[str, int] -- the token ID of each word
+        """
+
+        global _word_index, _word_index_key
+        stat = os.stat(self.vocab_path)
+        key = (self.vocab_path, stat.st_size, stat.st_mtime_ns)
+        if key != _word_index_key:
+            _word_index = {word: i for i, word in enumerate(self.load_vocab())}
+            _word_index_key = key
+
+        return _word_index
+
+    def encode_part(self, part):
+        """Encodes a single pre-processed part as token IDs and writes the token and sentence offset arrays.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+        """
+
+        word_index = self.word_index()
+        tokens = []
+        offsets = [0]
+        with PartFile.open(part) as f:
+            for line in f:
+                tokens.extend(word_index[word] for word in line.split())
+                offsets.append(len(tokens))
+
+        dtype = np.uint16 if len(word_index) <= np.iinfo(np.uint16).max else np.uint32
+        tokens_path, offsets_path = TokenCorpus.part_paths(part)
+        np.save(tokens_path, np.array(tokens, dtype=dtype))
+        np.save(offsets_path, np.array(offsets, dtype=np.int64))
+
+    @staticmethod
+    def load_chunk(part):
+        """Memory-maps the token and sentence offset arrays of a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            TokenChunk -- the sentences of the part as token IDs
+        """
+
+        tokens_path, offsets_path = TokenCorpus.part_paths(part)
+        return TokenChunk(np.load(tokens_path, mmap_mode='r'), np.load(offsets_path, mmap_mode='r'), part, PartFile.load_weights(part))
+
+    @staticmethod
+    def index_paths(part):
+        """Returns the paths of the positional index arrays belonging to a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            str, str, str -- paths to the indexed token IDs, the pointers to their postings and the postings
+        """
+
+        stem = PartFile.stem(part)
+        return stem + ".index_tokens.npy", stem + ".index_ptr.npy", stem + ".index_pos.npy"
+
+    def index_exists(self, parts):
+        """Checks whether the positional index of every part has been written.
+
+        Arguments:
+            parts {list[str]} -- paths to the pre-processed text files
+
+        Returns:
+            bool -- whether the index is complete
+        """
+
+        return all(os.path.exists(p) for part in parts for p in self.index_paths(part))
+
+    @staticmethod
+    def index_part(part):
+        """Builds the positional index of a single part from its token array. The postings of each token are the
+        positions at which it occurs in the part, in order, and the sentence of each position is found from the
+        sentence offsets.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+        """
+
+        tokens_path, _ = TokenCorpus.part_paths(part)
+        tokens = np.load(tokens_path, mmap_mode='r')
+
+        # group the positions by token, keeping each group in order
+        positions = np.argsort(tokens, kind="stable")
+        indexed, starts = np.unique(tokens[positions], return_index=True)
+
+        dtype = np.uint32 if len(tokens) <= np.iinfo(np.uint32).max else np.uint64
+        indexed_path, ptr_path, pos_path = TokenCorpus.index_paths(part)
+        np.save(indexed_path, indexed)
+        np.save(ptr_path, np.append(starts, len(tokens)).astype(np.int64))
+        np.save(pos_path, positions.astype(dtype))
+
+    @staticmethod
+    def load_index(part):
+        """Memory-maps the positional index of a pre-processed part.
+
+        Arguments:
+            part {str} -- path to the pre-processed text file
+
+        Returns:
+            TokenIndex -- the positional index of the part
+        """
+
+        return TokenIndex(*[np.load(path, mmap_mode='r') for path in TokenCorpus.index_paths(part)])
+
+
+class TokenIndex:
+    """The positional index of a part of the resource, listing the positions at which each token ID occurs.
+    Only the tokens present in the part are indexed, so a lookup is a binary search over them followed by a
+    slice of the postings.
+    """
+
+    def __init__(self, tokens, ptr, positions):
+
+        self.tokens = tokens
+        self.ptr = ptr
+        self.positions = positions
+
+    def postings(self, token):
+        """Returns the positions at which a token occurs.
+
+        Arguments:
+            token {int} -- the token ID
+
+        Returns:
+            np.ndarray -- the positions within the token array of the part, in order
+        """
+
+        i = np.searchsorted(self.tokens, token)
+        if i == len(self.tokens) or self.tokens[i] != token:
+            return np.zeros(0, dtype=np.int64)
+
+        return np.asarray(self.positions[self.ptr[i]:self.ptr[i + 1]], dtype=np.int64)
+
+
+class TokenChunk:
+    """A memory-mapped part of the resource. Iterating over it yields each sentence as a list of token IDs, while
+    the underlying arrays remain available to any analysis which can work on the whole chunk at once. If the
+    resource was de-duplicated, each sentence is weighted by the number of times it occurred.
+    """
+
+    def __init__(self, tokens, offsets, path=None, weights=None):
+
+        self.tokens = tokens
+        self.offsets = offsets
+        self.path = path
+        self.weights = weights
+
+    def __len__(self):
+
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+
+        # convert once per chunk, slicing python lists is far cheaper than indexing the array per token
+        tokens = self.tokens.tolist()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield tokens[start:end]
+
+    def sentence_weights(self):
+        """Returns the weight of each sentence.
+
+        Returns:
+            list[int] -- the number of times each sentence occurred, or 1 if not de-duplicated
+        """
+
+        return self.weights.tolist() if self.weights is not None else [1] * len(self)
+
+    def token_weights(self):
+        """Returns the weight of the sentence of each token.
+
+        Returns:
+            np.ndarray -- the weight of each token, or None if not de-duplicated
+        """
+
+        if self.weights is None:
+            return None
+        return np.repeat(np.asarray(self.weights, dtype=np.int64), np.diff(self.offsets))
+
+
+class TextChunk(list):
+    """A part of the resource read from its text file, as a list of sentences which are each a list of words,
+    which remembers the path of the part so that any artifacts derived from it can be found, and the weight of
+    each sentence if the resource was de-duplicated.
+    """
+
+    def __init__(self, sentences, path=None, weights=None):
+
+        super().__init__(sentences)
+        self.path = path
+        self.weights = weights
+
+    def sentence_weights(self):
+        """Returns the weight of each sentence.
+
+        Returns:
+            list[int] -- the number of times each sentence occurred, or 1 if not de-duplicated
+        """
+
+        return self.weights.tolist() if self.weights is not None else [1] * len(self)
@@ -1,30 +1,79 @@
+import os
+import json
 import argparse
 from Frequency import Frequency
 from PoSFrequency import PoSFrequency
+from FusedAnalyser import FusedAnalyser
 from GeneralCollocate import GeneralCollocate
 from SpecificCollocate import SpecificCollocate
+from Concordance import Concordance
+from BatchRunner import BatchRunner
+from Coordinator import authkey
 
 analysers = {
     "frequency": Frequency,
     "pos_frequency": PoSFrequency,
     "general_collocate": GeneralCollocate,
-    "specific_collocate": SpecificCollocate
+    "specific_collocate": SpecificCollocate,
+    "concordance": Concordance
     }
 
+languages = ['nl', 'en', 'es', 'de', 'fr', 'pl', 'it', 'no', 'pt', 'sv', 'ru']
+
 def analyse():
 
     # get arguments
-    parser = argparse.ArgumentParser(description="Select the analysis type, language and dataset that you wish to execute...")
-    parser.add_argument(dest="type", choices=["frequency", "pos_frequency", "specific_collocate", "general_collocate"])
-    parser.add_argument("-l", "--language", dest="language", choices=['nl', 'en', 'es', 'de', 'fr', 'pl', 'it', 'no', 'pt', 'sv', 'ru'], required=True)
-    parser.add_argument("-d", "--dataset", dest="dataset", required=True)
+    parser = argparse.ArgumentParser(description="Select the analysis type(s), language and dataset that you wish to execute...")
+    parser.add_argument(dest="types", nargs="+", choices=["all", "frequency", "pos_frequency", "specific_collocate", "general_collocate", "concordance"])
+    parser.add_argument("-l", "--language", dest="languages", nargs="+", choices=["all"] + languages, required=True)
+    parser.add_argument("-d", "--dataset", dest="datasets", nargs="+", required=True)
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", help="process every chunk, ignoring cached results")
+    parser.add_argument("--sample", dest="sample", type=float, help="estimate the results from a random fraction of the chunks")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, help="seed of the random sample of chunks")
+    parser.add_argument("--serve", dest="serve", metavar="HOST:PORT", help="process the chunks on workers started with worker.py, which connect to this address")
+    parser.add_argument("--resume", dest="resume", action="store_true", help="pick up from the last checkpoint of the same analysis")
+    parser.add_argument("--ingest", dest="ingest", metavar="FILE", help="add the new sentences of FILE, or - for stdin, and update the saved results with them")
     args = parser.parse_args()
-    
-    # define analyser
-    analyser = analysers[args.type]
 
-    # execute analysis
-    analyser(args.language, args.dataset).execute()
+    # expand the selected analysis types, keeping the order in which they are defined, where the concordance is
+    # a lookup rather than an analysis of the resource and so is only executed when selected
+    types = [t for t in analysers if t in args.types or ("all" in args.types and t != "concordance")]
+    selected = [l for l in languages if l in args.languages or "all" in args.languages]
+    datasets = list(dict.fromkeys(args.datasets))
+
+    # serving requires the key shared with the workers before any resource is loaded
+    if args.serve:
+        try:
+            authkey()
+        except ValueError as e:
+            parser.error(str(e))
+
+    # a sample of whole chunks misestimates de-duplicated resources, whose repeats all weigh on the part of
+    # their first copy
+    with open(os.path.join(os.path.dirname(__file__), "config.json")) as f:
+        deduplicate = json.load(f)["pre_processing"]["deduplicate"]
+    if args.sample is not None and deduplicate:
+        parser.error("sampling is not supported when de-duplicating, disable deduplicate to sample")
+
+    # execute every dataset and language as a batch on a single pool
+    if len(datasets) * len(selected) > 1:
+        if args.sample is not None or args.serve or args.resume or args.ingest:
+            parser.error("sampling, serving, resuming and ingesting are not supported when executing several datasets or languages")
+        BatchRunner([([analysers[t] for t in types], language, dataset) for dataset in datasets for language in selected], args.use_cache).execute()
+
+    # add new sentences to the resource and update the saved results of the selected analyses
+    elif args.ingest:
+        if args.sample is not None:
+            parser.error("sampled results cannot be updated by ingesting")
+        FusedAnalyser([analysers[t](selected[0], datasets[0], args.use_cache, None, 0, args.serve) for t in types]).ingest(args.ingest)
+
+    # execute a single analysis
+    elif len(types) == 1:
+        analysers[types[0]](selected[0], datasets[0], args.use_cache, args.sample, args.seed, args.serve, args.resume).execute()
+
+    # execute several analyses in a single pass over the corpus
+    else:
+        FusedAnalyser([analysers[t](selected[0], datasets[0], args.use_cache, args.sample, args.seed, args.serve, args.resume) for t in types]).execute()
 
 
 if __name__ == "__main__":
@@ -64,3 +64,4 @@ POS_TAGS = ["CC",
             "WP$", 
             "WRB", 
             "VBP"]
+POS_TAG_INDEX = {tag: i for i, tag in enumerate(POS_TAGS)}
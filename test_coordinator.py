@@ -0,0 +1,112 @@
+import os
+import time
+import operator
+import unittest
+import threading
+from multiprocessing import Process
+from Coordinator import Coordinator, work, authkey, AUTHKEY_VARIABLE
+
+
+def square(x):
+    """Squares an item, slowly in a worker started as the slow worker so that it can be killed mid-task.
+    """
+
+    if os.environ.get("SLOW_WORKER"):
+        time.sleep(60)
+    return x * x
+
+
+def missing_module():
+    """Stands in for a function whose module cannot be imported on the worker host.
+    """
+
+    raise ImportError("No module named 'missing'")
+
+
+class Unloadable:
+    """A processing function which fails to unpickle on the worker, as one from a missing module would.
+    """
+
+    def __reduce__(self):
+
+        return missing_module, ()
+
+
+def run_worker(address, slow):
+    """Runs a worker process on localhost, optionally as the slow worker.
+    """
+
+    if slow:
+        os.environ["SLOW_WORKER"] = "1"
+    work(address, authkey(), 5)
+
+
+class TestCoordinator(unittest.TestCase):
+    """End-to-end checks of the coordinator with several worker processes on localhost.
+    """
+
+    configs = {"chunks_per_task": 1, "task_timeout": 60, "wait": 5}
+
+    def setUp(self):
+
+        os.environ[AUTHKEY_VARIABLE] = "a test key of some length"
+        self.workers = []
+
+    def tearDown(self):
+
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+
+    def start_workers(self, address, n, slow=False):
+
+        for _ in range(n):
+            worker = Process(target=run_worker, args=(address, slow))
+            worker.start()
+            self.workers.append(worker)
+
+    def test_workers_combine_every_item(self):
+
+        coordinator = Coordinator(("127.0.0.1", 0), self.configs)
+        self.start_workers(coordinator.listener.address, 3)
+
+        with coordinator.start_job(square, operator.add) as executor:
+            self.assertEqual(executor.map_reduce(list(range(20))), sum(x * x for x in range(20)))
+
+    def test_task_of_killed_worker_is_reassigned(self):
+
+        coordinator = Coordinator(("127.0.0.1", 0), self.configs)
+        self.start_workers(coordinator.listener.address, 1, slow=True)
+
+        # kill the only worker once it holds a task, then let two healthy workers finish the pass
+        result = {}
+        with coordinator.start_job(square, operator.add) as executor:
+            thread = threading.Thread(target=lambda: result.setdefault("count", executor.map_reduce(list(range(10)))))
+            thread.start()
+            while coordinator.tasks.qsize() == 10:
+                time.sleep(0.1)
+            self.workers[0].kill()
+            self.start_workers(coordinator.listener.address, 2)
+            thread.join(60)
+
+        self.assertEqual(result.get("count"), sum(x * x for x in range(10)))
+
+    def test_job_which_cannot_be_loaded_fails_the_pass(self):
+
+        coordinator = Coordinator(("127.0.0.1", 0), self.configs)
+        self.start_workers(coordinator.listener.address, 2)
+
+        with self.assertRaisesRegex(Exception, "Failed to load the job"):
+            with coordinator.start_job(Unloadable(), operator.add) as executor:
+                executor.map_reduce(list(range(4)))
+
+    def test_key_is_required(self):
+
+        os.environ[AUTHKEY_VARIABLE] = "change this key"
+        with self.assertRaises(ValueError):
+            Coordinator(("127.0.0.1", 0), self.configs)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
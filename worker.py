@@ -0,0 +1,33 @@
+import os
+import json
+import argparse
+from multiprocessing import Process
+from Coordinator import Coordinator, work, authkey
+
+def worker():
+
+    # get arguments
+    parser = argparse.ArgumentParser(description="Process the chunks of an analysis started with analyse.py --serve HOST:PORT...")
+    parser.add_argument(dest="address", metavar="HOST:PORT", help="the address the coordinator is serving on")
+    parser.add_argument("-p", "--processes", dest="processes", type=int, default=1, help="the number of worker processes on this host")
+    args = parser.parse_args()
+
+    # load the key shared with the coordinator and how long to wait for it
+    with open(os.path.join(os.path.dirname(__file__), "config.json")) as f:
+        configs = json.load(f)["distributed"]
+    try:
+        work_args = (Coordinator.parse_address(args.address), authkey(), configs["wait"])
+    except ValueError as e:
+        parser.error(str(e))
+
+    # start each worker process with its own connection to the coordinator
+    processes = [Process(target=work, args=work_args) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+
+    worker()